@@ -1,31 +1,104 @@
+# -*- test-case-name: components.tests.test_rate_manage -*-
+from math import ceil
+from time import time
+
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 
+## Sliding window counter: the messages are counted by fixed windows of
+## per_seconds and the rate is the count of the current window plus the
+## count of the previous one weighted by its overlap with the sliding window.
+## A message costs a constant number of redis calls whatever the window size.
+## Besides the window of all the messages, the messages can be counted in
+## named buckets (ie a shortcode or a destination prefix) having their own
+## window size.
 class RateManager(object):
 
+    BUCKET_ALL = 'all'
+
     def __init__(self, redis, window_size=100, per_seconds=1):
         self.window_size = window_size
         self.per_seconds = per_seconds
         self.redis = redis
 
-    def rate_key(self, key):
-        return self.redis._key(key)
+    def get_time(self):
+        return time()
+
+    def rate_key(self, bucket, window):
+        return 'window:%s:%s' % (bucket, window)
+
+    def get_buckets(self, buckets):
+        all_buckets = {self.BUCKET_ALL: self.window_size}
+        all_buckets.update(buckets)
+        return all_buckets.iteritems()
+
+    ## return a tuple (previous, current, elapsed) of the counts of the
+    ## previous and current windows, the count is added to the current one
+    @inlineCallbacks
+    def get_counts(self, bucket, now, count=0):
+        window, elapsed = divmod(now, self.per_seconds)
+        window = int(window)
+        current_key = self.rate_key(bucket, window)
+        if count > 0:
+            current = yield self.redis.incr(current_key, count)
+            if current == count:
+                yield self.redis.expire(
+                    current_key, int(ceil(2 * self.per_seconds)))
+        else:
+            current = yield self.redis.get(current_key)
+        previous = yield self.redis.get(self.rate_key(bucket, window - 1))
+        returnValue((int(previous or 0), int(current or 0), elapsed))
+
+    def compute_rate(self, previous, current, elapsed):
+        return previous * (1 - (elapsed / self.per_seconds)) + current
 
-    def rate_keys(self):
-        return self.redis._key('*')
+    ## The seconds until the rate is under the window size
+    def compute_delay(self, window_size, previous, current, elapsed):
+        if self.compute_rate(previous, current, elapsed) < window_size:
+            return 0
+        if current >= window_size:
+            ## the current window has to slide out of the next one
+            return (self.per_seconds - elapsed
+                    + self.per_seconds * (1 - float(window_size) / current))
+        return (self.per_seconds * (1 - float(window_size - current) / previous)
+                - elapsed)
 
     @inlineCallbacks
-    def is_within_rate(self, message_id):
-        allowed = yield self.has_room()
-        yield self.redis.setex(
-            self.rate_key(message_id),
-            self.per_seconds,
-            '')
+    def get_rate(self, bucket, now):
+        previous, current, elapsed = yield self.get_counts(bucket, now)
+        returnValue(self.compute_rate(previous, current, elapsed))
+
+    ## Count the message, return a tuple (allowed, delay) with allowed when
+    ## the rate was under the window sizes before the message and the
+    ## seconds until the next message is allowed
+    @inlineCallbacks
+    def reserve(self, message_id, buckets={}):
+        now = self.get_time()
+        allowed, delay = True, 0
+        for bucket, window_size in self.get_buckets(buckets):
+            previous, current, elapsed = yield self.get_counts(bucket, now, 1)
+            if self.compute_rate(previous, current - 1, elapsed) >= window_size:
+                allowed = False
+            delay = max(delay, self.compute_delay(
+                window_size, previous, current, elapsed))
+        returnValue((allowed, delay))
+
+    @inlineCallbacks
+    def is_within_rate(self, message_id, buckets={}):
+        allowed, delay = yield self.reserve(message_id, buckets)
         returnValue(allowed)
 
     @inlineCallbacks
-    def has_room(self):
-        inflight_keys = yield self.redis.keys(self.rate_keys())
-        if self.window_size > len(inflight_keys):
-            returnValue(True)
-        returnValue(False)
+    def get_next_slot_delay(self, buckets={}):
+        now = self.get_time()
+        delay = 0
+        for bucket, window_size in self.get_buckets(buckets):
+            previous, current, elapsed = yield self.get_counts(bucket, now)
+            delay = max(delay, self.compute_delay(
+                window_size, previous, current, elapsed))
+        returnValue(delay)
+
+    @inlineCallbacks
+    def has_room(self, buckets={}):
+        delay = yield self.get_next_slot_delay(buckets)
+        returnValue(delay <= 0)
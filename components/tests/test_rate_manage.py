@@ -36,4 +36,62 @@ class RateManagerTestCase(VumiTestCase):
         yield wait(2.0)
         
         allowed = yield self.manager.is_within_rate('3')
-        self.assertTrue(allowed)
\ No newline at end of file
+        self.assertTrue(allowed)
+
+    @inlineCallbacks
+    def test_sliding_window(self):
+        self.manager = RateManager(self.redis, window_size=2, per_seconds=10)
+        self.manager.get_time = lambda: 1009.0
+        allowed = yield self.manager.is_within_rate('1')
+        self.assertTrue(allowed)
+        allowed = yield self.manager.is_within_rate('2')
+        self.assertTrue(allowed)
+        allowed = yield self.manager.is_within_rate('3')
+        self.assertFalse(allowed)
+
+        ## the previous window is weighted by its overlap
+        self.manager.get_time = lambda: 1012.0
+        has_room = yield self.manager.has_room()
+        self.assertFalse(has_room)
+        self.manager.get_time = lambda: 1016.0
+        has_room = yield self.manager.has_room()
+        self.assertTrue(has_room)
+
+    @inlineCallbacks
+    def test_is_within_rate_buckets(self):
+        self.manager = RateManager(self.redis, window_size=10, per_seconds=10)
+        self.manager.get_time = lambda: 1000.0
+        allowed = yield self.manager.is_within_rate('1', {'shortcode:8181': 1})
+        self.assertTrue(allowed)
+        allowed = yield self.manager.is_within_rate('2', {'shortcode:8282': 1})
+        self.assertTrue(allowed)
+        allowed = yield self.manager.is_within_rate('3', {'shortcode:8181': 1})
+        self.assertFalse(allowed)
+
+        has_room = yield self.manager.has_room({'shortcode:8181': 1})
+        self.assertFalse(has_room)
+        has_room = yield self.manager.has_room({'prefix:+256': 1})
+        self.assertTrue(has_room)
+
+    def test_compute_delay(self):
+        manager = RateManager(self.redis, window_size=10, per_seconds=1)
+        self.assertEqual(manager.compute_delay(10, 5, 4, 0.5), 0)
+        ## the previous window has to slide out
+        self.assertAlmostEqual(manager.compute_delay(10, 10, 5, 0.2), 0.3)
+        ## the current window is full
+        self.assertAlmostEqual(manager.compute_delay(10, 0, 20, 0.6), 0.9)
+
+    def test_compute_delay_sustained_rate(self):
+        manager = RateManager(self.redis, window_size=30, per_seconds=1)
+        windows = {}
+        now = 1000.0
+        sent = 0
+        ## the sender is paused until the next slot
+        while now < 1010:
+            window, elapsed = divmod(now, 1)
+            windows[window] = windows.get(window, 0) + 1
+            sent += 1
+            delay = manager.compute_delay(
+                30, windows.get(window - 1, 0), windows[window], elapsed)
+            now += max(delay + 0.001, 0.001)
+        self.assertTrue(290 <= sent <= 310)
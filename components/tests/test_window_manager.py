@@ -1,34 +1,68 @@
-import fnmatch
-from functools import wraps
-from itertools import takewhile, dropwhile
-
-from twisted.trial.unittest import TestCase
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet.task import Clock
 
-from vumi.tests.helpers import VumiTestCase
+from vumi.tests.helpers import VumiTestCase, PersistenceHelper
 from components.window_manager import VusionWindowManager
-    
+
 
 class VusionWindowManagerTestCase(VumiTestCase):
 
-    #@inlineCallbacks
+    @inlineCallbacks
     def setUp(self):
-        pass
-        #self._persist_setUp()
-        #modify for backward compatibility
-        #redis = FakeRedis()
-        #self.window_id = 'window_id'
+        self.persistence_helper = self.add_helper(PersistenceHelper())
+        redis = yield self.persistence_helper.get_redis_manager()
+        self.window_id = 'window_id'
 
         ## Patch the clock so we can control time
-        #self.clock = Clock()
-        #self.patch(WindowManager, 'get_clock', lambda _: self.clock)
+        self.clock = Clock()
+        self.patch(VusionWindowManager, 'get_clock', lambda _: self.clock)
 
-        #self.wm = VusionWindowManager(redis, window_size=10, flight_lifetime=10)
-        #yield self.wm.create_window(self.window_id)
-        #self.redis = self.wm.redis
+        self.wm = VusionWindowManager(
+            redis, window_size=10, flight_lifetime=10, remove_expired=True,
+            claim_size=4)
+        self.add_cleanup(self.wm.stop)
+        yield self.wm.create_window(self.window_id)
+        self.redis = self.wm.redis
 
     @inlineCallbacks
-    def tearDown(self):
-        #yield self.wm.stop()
-        yield super(VusionWindowManagerTestCase, self).tearDown()
+    def test_get_next_keys(self):
+        for i in range(12):
+            yield self.wm.add(self.window_id, {'content': i}, str(i))
+
+        claimed = yield self.wm.get_next_keys(self.window_id)
+        self.assertEqual(
+            [(str(i), {'content': i}) for i in range(10)], claimed)
+        claimed = yield self.wm.get_next_keys(self.window_id)
+        self.assertEqual([], claimed)
+
+        yield self.wm.remove_keys(self.window_id, ['0', '1', '2'])
+        claimed = yield self.wm.get_next_keys(self.window_id, 1)
+        self.assertEqual([('10', {'content': 10})], claimed)
+        self.assertEqual(8, (yield self.wm.count_in_flight(self.window_id)))
+        self.assertEqual(None, (yield self.wm.get_data(self.window_id, '0')))
+
+    @inlineCallbacks
+    def test_monitor_windows(self):
+        for i in range(6):
+            yield self.wm.add(self.window_id, {'content': i}, str(i))
+
+        sent = []
+        def send(window_id, key, data):
+            sent.append((key, data['content']))
+        yield self.wm._monitor_windows(send, False)
+        self.assertEqual([(str(i), i) for i in range(6)], sent)
+
+    @inlineCallbacks
+    def test_clear_expired_flight_keys(self):
+        for i in range(3):
+            yield self.wm.add(self.window_id, {'content': i}, str(i))
+        yield self.wm.get_next_keys(self.window_id)
+        yield self.wm.set_external_id(self.window_id, '1', 'external-1')
+
+        self.clock.advance(11)
+        yield self.wm.clear_expired_flight_keys()
+        self.assertEqual(0, (yield self.wm.count_in_flight(self.window_id)))
+        self.assertEqual([], (yield self.wm.get_expired_flight_keys(self.window_id)))
+        self.assertEqual(None, (yield self.wm.get_data(self.window_id, '2')))
+        self.assertEqual(
+            None, (yield self.wm.get_internal_id(self.window_id, 'external-1')))
@@ -3,22 +3,36 @@ import json
 import uuid
 
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import inlineCallbacks, returnValue, gatherResults
 from twisted.internet.task import LoopingCall
 
 from vumi.log import log
 from vumi.components.window_manager import WindowManager
 
 
+## The redis commands of a step are sent together without waiting for each
+## reply, the connection keeping them in order: a message is added with
+## its data and key at once, the monitor claims all the room of a window
+## with the data of the keys and the expired keys are removed in bulk.
 class VusionWindowManager(WindowManager):
 
     def __init__(self, redis, window_size=100, flight_lifetime=None,
-                gc_interval=10, window_key=None, remove_expired = False):
+                gc_interval=10, window_key=None, remove_expired = False,
+                claim_size=None):
         super(VusionWindowManager, self).__init__(
             redis, window_size, flight_lifetime, gc_interval);
         if window_key is not None:
             self.WINDOW_KEY = window_key
         self.remove_expired = remove_expired
+        self.claim_size = claim_size or window_size
+
+    def add(self, window_id, data, key=None):
+        key = key or uuid.uuid4().get_hex()
+        d = gatherResults([
+            self.redis.set(self.window_key(window_id, key), json.dumps(data)),
+            self.redis.lpush(self.window_key(window_id), key)])
+        d.addCallback(lambda r: key)
+        return d
 
     @inlineCallbacks
     def get_data(self, window_id, key):
@@ -27,13 +41,83 @@ class VusionWindowManager(WindowManager):
             returnValue(None)
         returnValue(json.loads(json_data))
 
+    ## Return a list of (key, data) of the keys moved in flight
+    @inlineCallbacks
+    def get_next_keys(self, window_id, limit=None):
+        waiting, flight_size = yield gatherResults([
+            self.count_waiting(window_id), self.count_in_flight(window_id)])
+        room = min(waiting, self.window_size - flight_size, limit or waiting)
+        if room <= 0:
+            returnValue([])
+        window_key = self.window_key(window_id)
+        inflight_key = self.flight_key(window_id)
+        keys = yield gatherResults([
+            self.redis.rpoplpush(window_key, inflight_key) for i in range(room)])
+        keys = [key for key in keys if key]
+        if keys == []:
+            returnValue([])
+        clock_time = self.get_clocktime()
+        results = yield gatherResults(
+            [self.redis.zadd(self.stats_key(window_id),
+                             **dict((key, clock_time) for key in keys))]
+            + [self.redis.get(self.window_key(window_id, key)) for key in keys])
+        returnValue([(key, json.loads(data) if data is not None else None)
+                     for key, data in zip(keys, results[1:])])
+
+    @inlineCallbacks
+    def remove_key(self, window_id, key):
+        yield self.remove_keys(window_id, [key])
+
+    @inlineCallbacks
+    def remove_keys(self, window_id, keys):
+        if keys == []:
+            return
+        external_ids = yield gatherResults([
+            self.get_external_id(window_id, key) for key in keys])
+        commands = []
+        for key, external_id in zip(keys, external_ids):
+            commands += [
+                self.redis.lrem(self.flight_key(window_id), key, 1),
+                self.redis.delete(self.window_key(window_id, key)),
+                self.redis.delete(self.stats_key(window_id, key)),
+                self._clear_timestamp(window_id, key)]
+            if external_id:
+                commands += [
+                    self.redis.delete(self.map_key(window_id, 'external', key)),
+                    self.redis.delete(self.map_key(window_id, 'internal', external_id))]
+        yield gatherResults(commands)
+
     @inlineCallbacks
     def clear_expired_flight_keys(self):
         windows = yield self.get_windows()
+        windows_expired_keys = yield gatherResults([
+            self.get_expired_flight_keys(window_id) for window_id in windows])
+        commands = []
+        for window_id, expired_keys in zip(windows, windows_expired_keys):
+            if self.remove_expired is False:
+                commands += [
+                    self.redis.lrem(self.flight_key(window_id), key, 1)
+                    for key in expired_keys]
+            else:
+                commands.append(self.remove_keys(window_id, expired_keys))
+        yield gatherResults(commands)
+
+    ## The callback is called with the data of the key, the keys are
+    ## claimed by batch of claim_size
+    @inlineCallbacks
+    def _monitor_windows(self, key_callback, cleanup=True,
+                         cleanup_callback=None):
+        windows = yield self.get_windows()
         for window_id in windows:
-            expired_keys = yield self.get_expired_flight_keys(window_id)
-            for key in expired_keys:
-                if self.remove_expired is False:
-                    yield self.redis.lrem(self.flight_key(window_id), key, 1)
-                else:
-                    yield self.remove_key(window_id, key)
+            claimed = yield self.get_next_keys(window_id, self.claim_size)
+            while claimed:
+                for key, data in claimed:
+                    yield key_callback(window_id, key, data)
+                claimed = yield self.get_next_keys(window_id, self.claim_size)
+
+            # Remove empty windows if required
+            if cleanup and not ((yield self.count_waiting(window_id)) or
+                                (yield self.count_in_flight(window_id))):
+                if cleanup_callback:
+                    cleanup_callback(window_id)
+                yield self.remove_window(window_id)
@@ -102,3 +102,26 @@ class TestVusionMainRouter(VumiTestCase):
             to_addr='8181',
             from_addr='+256453')
         self.assert_dispatched_inbound('app1', [msg])
+
+    @inlineCallbacks
+    def test_inbound_message_not_matching_prefix(self):
+        msg = yield self.send_inbound(
+            'transport1',
+            u'espanol join',
+            to_addr='8181',
+            from_addr='+254453')
+        self.assert_dispatched_inbound('app1', [])
+        self.assert_dispatched_inbound('fallback_app', [msg])
+
+    @inlineCallbacks
+    def test_inbound_message_rules_index(self):
+        self.router.rules.append({'app': 'app3', 'keyword': 'ESPAÑOL'})
+        self.router.build_index()
+        msg = yield self.send_inbound(
+            'transport1',
+            u'Espanol join',
+            to_addr='8181',
+            from_addr='+256453')
+        self.assert_dispatched_inbound('app1', [msg])
+        self.assert_dispatched_inbound('app3', [msg])
+        self.assertEqual(self.router.rules[-1]['keyword'], 'ESPAÑOL')
@@ -108,6 +108,7 @@ class DynamicDispatchWorker(BaseDispatchWorker):
         for rule in rules:
             if rule not in self._router.rules:
                 self._router.rules.append(rule)
+        self.rules_changed()
 
     def remove_non_present_mappings(self, exposed_name, rules):
         non_present_mappings = self.get_non_present_mapping(
@@ -129,6 +130,12 @@ class DynamicDispatchWorker(BaseDispatchWorker):
                               for rule
                               in self._router.rules
                               if name_to_clear != rule['app']]
+        self.rules_changed()
+
+    ## The router indexing its rules has to rebuild its index
+    def rules_changed(self):
+        if hasattr(self._router, 'build_index'):
+            self._router.build_index()
 
     def receive_control_message(self, msg):
         log.debug('Received control %r' % msg)
@@ -43,20 +43,52 @@ class VusionMainRouter(ContentKeywordRouter):
             return match_transport_name
         return None
 
+    def setup_routing(self):
+        super(VusionMainRouter, self).setup_routing()
+        self.build_index()
+
+    ## The rules are indexed by (keyword, to_addr, prefix) with the keyword
+    ## cleaned once, to_addr and prefix are None when the rule has none.
+    ## The index has to be rebuilt each time the rules are changed.
+    def build_index(self):
+        index = {}
+        prefixes = set()
+        for position, rule in enumerate(self.rules):
+            prefix = rule.get('prefix', None)
+            key = (clean_keyword(rule['keyword']), rule.get('to_addr', None), prefix)
+            index.setdefault(key, []).append((position, rule))
+            if prefix is not None:
+                prefixes.add(prefix)
+        self.rules_index = index
+        self.rules_prefixes = sorted(prefixes)
+
+    ## Return the matching rules in the order they have been added
+    def get_matching_rules(self, keyword, msg):
+        from_addr = msg['from_addr'] or ''
+        prefixes = [None] + [prefix for prefix in self.rules_prefixes
+                             if from_addr.startswith(prefix)]
+        to_addrs = [None]
+        if msg['to_addr'] is not None:
+            to_addrs.append(msg['to_addr'])
+        matching = []
+        for to_addr in to_addrs:
+            for prefix in prefixes:
+                matching += self.rules_index.get((keyword, to_addr, prefix), [])
+        return [rule for position, rule in sorted(matching, key=lambda m: m[0])]
+
     def is_msg_matching_routing_rules(self, keyword, msg, rule):
-        rule['keyword'] = clean_keyword(rule['keyword'])
+        rule = dict(rule, keyword=clean_keyword(rule['keyword']))
         return super(VusionMainRouter, self).is_msg_matching_routing_rules(
             clean_keyword(keyword), msg, rule)
 
     def dispatch_inbound_message(self, msg):
-        keyword = get_first_msg_word(msg['content']).lower()
+        keyword = clean_keyword(get_first_msg_word(msg['content']).lower())
         matched = False
-        for rule in self.rules:
-            if self.is_msg_matching_routing_rules(keyword, msg, rule):
-                matched = True
-                # copy message so that the middleware doesn't see a particular
-                # message instance multiple times
-                self.publish_exposed_inbound(rule['app'], msg.copy())
+        for rule in self.get_matching_rules(keyword, msg):
+            matched = True
+            # copy message so that the middleware doesn't see a particular
+            # message instance multiple times
+            self.publish_exposed_inbound(rule['app'], msg.copy())
         if not matched:
             if self.fallback_application is not None:
                 self.publish_exposed_inbound(self.fallback_application, msg)
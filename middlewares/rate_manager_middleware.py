@@ -1,5 +1,6 @@
 from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.task import LoopingCall
 
 from vumi.persist.txredis_manager import TxRedisManager
 from vumi.middleware import BaseMiddleware
@@ -8,6 +9,9 @@ from vumi.log import log
 from components.rate_manager import RateManager
 
 
+## The connectors are paused as soon as the window is full and unpaused when
+## the limiter state tells the next slot is free, so that the transport is
+## sending at the configured rate.
 class RateManagerMiddleware(BaseMiddleware):
 
     RATE_MANAGER_KEY = 'rate_managers'
@@ -16,10 +20,17 @@ class RateManagerMiddleware(BaseMiddleware):
     @inlineCallbacks
     def setup_middleware(self):
         self._unpause_delayedCall = None
-        self._unpause_check_delay = self.config.get('unpause_chech_delay', 0.5)
+        self._paused_at = None
 
         window_size = self.config.get('window_size', 10)
         per_seconds = self.config.get('per_seconds', 1)
+        #Window of each shortcode (0 is disabled) and of destination prefixes
+        self.shortcode_window_size = self.config.get('shortcode_window_size', 0)
+        self.prefix_window_sizes = self.config.get('prefix_window_sizes', {})
+        self.prefixes = sorted(self.prefix_window_sizes.keys(), key=len, reverse=True)
+        self._paused_buckets = {}
+        #The messages prefetched by the transport are limited to the window
+        self.prefetch_window = bool(int(self.config.get('prefetch_window', 0)))
         r_config = self.config.get('redis_manager', {})
         key_prefix = r_config.get('key_prefix', self.RATE_MANAGER_KEY)
         r_config['key_prefix'] = ':'.join([key_prefix, self.worker.transport_name])
@@ -27,28 +38,93 @@ class RateManagerMiddleware(BaseMiddleware):
         self.redis = yield TxRedisManager.from_config(r_config)
         self.sub_man = self.redis.sub_manager(self.RATE_MANAGER_KEY)
         self.manager = RateManager(self.sub_man, window_size, per_seconds)
+        if self.prefetch_window:
+            self.set_prefetch()
 
+        self.pauses = 0
+        self.paused_seconds = 0
+        self.over_rate = 0
+        self.rate_reporter = LoopingCall(self.report_rate)
+        self.rate_reporter.clock = self.clock
+        rate_report_interval = self.config.get('rate_report_interval', 60)
+        if rate_report_interval > 0:
+            self.rate_reporter.start(rate_report_interval, now=False)
+
+    @inlineCallbacks
     def teardown_middleware(self):
-        if self._unpause_delayedCall is not None:
+        if self._unpause_delayedCall is not None and self._unpause_delayedCall.active():
             self._unpause_delayedCall.cancel()
+        if self.rate_reporter.running:
+            self.rate_reporter.stop()
         yield self.redis._close()
 
+    def get_buckets(self, msg):
+        buckets = {}
+        if self.shortcode_window_size > 0 and msg['from_addr'] is not None:
+            buckets['shortcode:%s' % msg['from_addr']] = self.shortcode_window_size
+        to_addr = msg['to_addr'] or ''
+        for prefix in self.prefixes:
+            if to_addr.startswith(prefix):
+                buckets['prefix:%s' % prefix] = self.prefix_window_sizes[prefix]
+                break
+        return buckets
+
+    ## The middlewares are set up before the connectors, which take their
+    ## prefetch count from the worker config
+    def set_prefetch(self):
+        prefetch_count = self.worker.get_static_config().amqp_prefetch_count
+        self.worker.config['amqp_prefetch_count'] = min(
+            prefetch_count, self.manager.window_size)
+
     @inlineCallbacks
     def handle_outbound(self, msg, endpoint):
-        is_within_rate = yield self.manager.is_within_rate(msg['message_id'])
-        if not is_within_rate:
-            log.msg("Pausing")
-            self.worker.pause_connectors()
-            self._unpause_delayedCall = self.clock.callLater(
-                self._unpause_check_delay, self._check_unpause)
+        buckets = self.get_buckets(msg)
+        allowed, delay = yield self.manager.reserve(msg['message_id'], buckets)
+        if not allowed:
+            self.over_rate += 1
+        if delay > 0:
+            self._paused_buckets.update(buckets)
+            self.pause(delay)
         returnValue(msg)
 
+    def pause(self, delay):
+        if self._unpause_delayedCall is not None and self._unpause_delayedCall.active():
+            if self._unpause_delayedCall.getTime() < self.clock.seconds() + delay:
+                self._unpause_delayedCall.reset(delay)
+            return
+        log.msg("Pausing for %.3fs" % delay)
+        self.pauses += 1
+        self._paused_at = self.clock.seconds()
+        self.worker.pause_connectors()
+        self._unpause_delayedCall = self.clock.callLater(delay, self._check_unpause)
+
     @inlineCallbacks
     def _check_unpause(self):
-        can_unpause = yield self.manager.has_room()
-        if can_unpause:
+        delay = yield self.manager.get_next_slot_delay(self._paused_buckets)
+        if delay <= 0:
             log.msg("Unpausing")
+            self.paused_seconds += self.clock.seconds() - self._paused_at
+            self._paused_buckets = {}
+            self._unpause_delayedCall = None
             self.worker.unpause_connectors()
             return
+        ## the window is shared with other transports
         self._unpause_delayedCall = self.clock.callLater(
-            self._unpause_check_delay, self._check_unpause)
+            delay + 0.001, self._check_unpause)
+
+    @inlineCallbacks
+    def get_rate_stats(self):
+        rate = yield self.manager.get_rate(
+            RateManager.BUCKET_ALL, self.manager.get_time())
+        per_seconds = float(self.manager.per_seconds)
+        returnValue({
+            'configured-rate': self.manager.window_size / per_seconds,
+            'achieved-rate': rate / per_seconds,
+            'pauses': self.pauses,
+            'paused-seconds': round(self.paused_seconds, 3),
+            'over-rate': self.over_rate})
+
+    @inlineCallbacks
+    def report_rate(self):
+        stats = yield self.get_rate_stats()
+        log.msg("Rate of %s %r" % (self.worker.transport_name, stats))
@@ -57,13 +57,47 @@ class RateManagerMiddlewareTestCase(VumiTestCase):
 
     @inlineCallbacks
     def test_handle_outbound(self):
+        ## the window is full with the first message
         msg_1 = self.tx_helper.make_outbound('hello world 1', message_id='1')
         msg_1_after = yield self.rm.handle_outbound(msg_1, 'outbound')
-        self.assertFalse(self.transport.paused)
-        
-        msg_2 = self.tx_helper.make_outbound('hello world 2', message_id='2')
-        msg_2_after = yield self.rm.handle_outbound(msg_2, 'outbound')
         self.assertTrue(self.transport.paused)
+        self.assertEqual(self.rm.pauses, 1)
 
         yield wait(2.5)
-        self.assertFalse(self.transport.paused)
\ No newline at end of file
+        self.assertFalse(self.transport.paused)
+
+        stats = yield self.rm.get_rate_stats()
+        self.assertEqual(stats['configured-rate'], 1)
+        self.assertEqual(stats['over-rate'], 0)
+
+    @inlineCallbacks
+    def test_get_buckets(self):
+        config = {'window_size': 10,
+                  'per_seconds': 1,
+                  'shortcode_window_size': 2,
+                  'prefix_window_sizes': {'+256': 5, '+2567': 3}}
+        rm = RateManagerMiddleware('rm_buckets', config, self.transport)
+        yield rm.setup_middleware()
+
+        msg = self.tx_helper.make_outbound(
+            'hello', from_addr='8181', to_addr='+256712345678')
+        self.assertEqual(
+            rm.get_buckets(msg),
+            {'shortcode:8181': 2, 'prefix:+2567': 3})
+        msg = self.tx_helper.make_outbound(
+            'hello', from_addr='8181', to_addr='+255712345678')
+        self.assertEqual(rm.get_buckets(msg), {'shortcode:8181': 2})
+        yield rm.teardown_middleware()
+
+    @inlineCallbacks
+    def test_set_prefetch(self):
+        config = {'window_size': 5,
+                  'per_seconds': 1,
+                  'prefetch_window': 1}
+        rm = RateManagerMiddleware('rm_prefetch', config, self.transport)
+        yield rm.setup_middleware()
+
+        ## the connectors set up next prefetch no more than the window
+        self.assertEqual(
+            self.transport.get_static_config().amqp_prefetch_count, 5)
+        yield rm.teardown_middleware()
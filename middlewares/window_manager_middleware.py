@@ -140,7 +140,8 @@ class WindowManagerMiddleware(BaseMiddleware):
             flight_lifetime=self.config.get('flight_lifetime', 1),
             gc_interval=self.config.get('gc_interval', 1),
             window_key=r_key,
-            remove_expired=True)
+            remove_expired=True,
+            claim_size=self.config.get('claim_size', None))
 
         self.wm.monitor(
             self.send_outbound,
@@ -169,8 +170,9 @@ class WindowManagerMiddleware(BaseMiddleware):
         raise StopPropagation()
 
     @inlineCallbacks
-    def send_outbound(self, window_id, key):
-        data = yield self.wm.get_data(window_id, key)
+    def send_outbound(self, window_id, key, data=None):
+        if data is None:
+            data = yield self.wm.get_data(window_id, key)
         msg = TransportUserMessage.from_json(data)
         connector_name = self.worker.transport_name
         self.worker.connectors[connector_name]._consume_message('outbound', msg, self)
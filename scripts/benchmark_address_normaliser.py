@@ -0,0 +1,128 @@
+## Check that the address normaliser gives the same addresses as the regex
+## functions and middleware rules, as they were, on a corpus of number
+## formats and compare their cost per address.
+## usage: python scripts/benchmark_address_normaliser.py
+import sys
+import re
+from time import time
+sys.path.insert(0, './')
+
+from vusion.address_normaliser import AddressNormaliser
+from vusion.component import PrintLogger
+
+ROUNDS = 20000
+
+PLUS_REGEX = re.compile("^\+")
+ZEROS_REGEX = re.compile("^(0){1,2}")
+regex_zeros = re.compile("^00")
+regex_trim = re.compile("\s")
+
+logger = PrintLogger()
+
+CORPUS = [
+    '+256712345678', '256712345678', '0712345678', '00256712345678',
+    '000256712345678', '+256 712 345 678', '256 712-345-678', '0712 345678',
+    ' +256712345678 ', '+256\t712345678', '712345678', '+254888', '00254888',
+    '+ 254 888', '888', '256-8181', '254-8181', '8181', '+318181', '+318181\n',
+    '256-', '-8181', '+', '0', '00', '0000', u'+256712345678', u'0712345678',
+    u'256 712 345 678', u'256-8181', u'+256\xa0712345678', 'abc', '+25a61']
+PREFIXES = ['256', '254']
+
+
+def clean_phone(phone):
+    if phone in [None,'']:
+        return None
+    if (re.match(ZEROS_REGEX, phone)):
+        return re.sub(ZEROS_REGEX, "+", phone)
+    if (not re.match(PLUS_REGEX, phone)):
+        return '+%s' % phone
+    return phone
+
+
+def get_shortcode_value(shortcode):
+    if shortcode is None :
+        return None
+    if re.match(re.compile('^[0-9]+-[0-9]+$'), shortcode):
+        return shortcode.split('-')[1]
+    return shortcode
+
+
+def inbound_from_addr(from_addr, international_prefix):
+    regex_internation_prefix = re.compile(("^\+?%s" % international_prefix))
+    from_addr = re.sub(regex_trim, "", from_addr)
+    from_addr = re.sub(regex_zeros, "", from_addr)
+    if (not re.match(PLUS_REGEX, from_addr)):
+        from_addr = '+%s' % from_addr
+    if international_prefix and not re.match(regex_internation_prefix, from_addr):
+        from_addr = re.sub(PLUS_REGEX, '', from_addr)
+        from_addr = '+%s%s' % (international_prefix, from_addr)
+    return from_addr
+
+
+def inbound_to_addr(to_addr, ensure_plus_inbound):
+    to_addr = re.sub(regex_trim, "", to_addr)
+    to_addr = re.sub(PLUS_REGEX, "", to_addr)
+    if (re.match(regex_zeros, to_addr)):
+        to_addr = re.sub(regex_zeros, "", to_addr)
+    if ensure_plus_inbound:
+        to_addr = '+%s' % to_addr
+    return to_addr
+
+
+def outbound_to_addr(to_addr, international_prefix, trim_plus_outbound):
+    regex_internation_prefix = re.compile(("^\+?%s" % international_prefix))
+    to_addr = re.sub(regex_internation_prefix, '', to_addr)
+    if trim_plus_outbound:
+        to_addr = re.sub(PLUS_REGEX, '', to_addr)
+    return to_addr
+
+
+def check(name, legacy, normalised):
+    different = [(address, legacy(address), normalised(address))
+                 for address in CORPUS if legacy(address) != normalised(address)]
+    if different:
+        logger.log("%s differs on %r" % (name, different))
+        return False
+    return True
+
+
+def timed(function):
+    start = time()
+    for i in xrange(ROUNDS):
+        for address in CORPUS:
+            function(address)
+    return (time() - start) * 1000000 / (ROUNDS * len(CORPUS))
+
+
+equivalent = True
+for prefix in PREFIXES:
+    for flag in [False, True]:
+        normaliser = AddressNormaliser(
+            international_prefix=prefix, ensure_plus_inbound=flag,
+            trim_plus_outbound=flag, trim_international_prefix_outbound=True)
+        equivalent &= check(
+            'inbound from_addr', lambda a: inbound_from_addr(a, prefix),
+            normaliser.normalise_inbound_from_addr)
+        equivalent &= check(
+            'inbound to_addr', lambda a: inbound_to_addr(a, flag),
+            normaliser.normalise_inbound_to_addr)
+        equivalent &= check(
+            'outbound to_addr', lambda a: outbound_to_addr(a, prefix, flag),
+            normaliser.normalise_outbound_to_addr)
+normaliser = AddressNormaliser()
+equivalent &= check('clean_phone', clean_phone, normaliser.clean_phone)
+equivalent &= check(
+    'get_shortcode_value', get_shortcode_value, normaliser.get_shortcode_value)
+logger.log("%s addresses, equivalent: %s" % (len(CORPUS), equivalent))
+
+normaliser = AddressNormaliser(international_prefix='256')
+for name, legacy, normalised in [
+        ('clean_phone', clean_phone, normaliser.clean_phone),
+        ('get_shortcode_value', get_shortcode_value,
+         normaliser.get_shortcode_value),
+        ('inbound from_addr', lambda a: inbound_from_addr(a, '256'),
+         normaliser.normalise_inbound_from_addr),
+        ('inbound to_addr', lambda a: inbound_to_addr(a, False),
+         normaliser.normalise_inbound_to_addr)]:
+    logger.log("%s: %.2fus/address with regex, %.2fus/address normaliser" % (
+        name, timed(legacy), timed(normalised)))
@@ -0,0 +1,74 @@
+## Compare the messages/sec of the credit log path: the count and increment
+## per counter, the upsert with the day cache and the in-memory accumulator.
+## usage: python scripts/benchmark_credit_log.py [mongodb_host] [mongodb_port]
+import sys
+from time import time
+
+import pymongo
+sys.path.insert(0, './')
+
+from vusion.persist import ProgramCreditLogManager
+from vusion.component import DialogueWorkerPropertyHelper, PrintLogger
+
+MESSAGES = 20000
+
+mongodb_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+mongodb_port = int(sys.argv[2]) if len(sys.argv) > 2 else 27017
+c = pymongo.MongoClient(mongodb_host, mongodb_port, w=1)
+db = c['benchmark_credit_log']
+logger = PrintLogger()
+
+property_helper = DialogueWorkerPropertyHelper(None, None)
+property_helper['timezone'] = 'Africa/Kampala'
+property_helper['shortcode'] = '256-8181'
+credit_log_manager = ProgramCreditLogManager(
+    db, 'credit_logs', 'benchmark_program', logger=logger)
+credit_log_manager.set_property_helper(property_helper)
+
+
+## The credit path as it was: a count before each counter increment
+def count_and_increment(credit_type, credit_number):
+    selector = {
+        'date': property_helper.get_local_time('iso_date'),
+        'program-database': 'benchmark_program',
+        'code': property_helper['shortcode']}
+    if db.credit_logs.find(selector).count() == 0:
+        credit_log_manager.save_document(
+            credit_log_manager._create_today_credit_log())
+    db.credit_logs.update(selector, {'$inc': {credit_type: credit_number}})
+
+
+def previous_message():
+    count_and_increment('outgoing', 1)
+    count_and_increment('outgoing-pending', 1)
+    count_and_increment('outgoing-acked', 1)
+    count_and_increment('outgoing-pending', -1)
+
+
+def message():
+    credit_log_manager.increment_outgoing(1)
+    credit_log_manager.increment_acked(1)
+
+
+def run(name, send, flush=lambda: None):
+    db.credit_logs.drop()
+    credit_log_manager.day_credit_logs.clear()
+    start = time()
+    for i in range(MESSAGES):
+        send()
+        if i % 1000 == 0:
+            flush()
+    flush()
+    duration = time() - start
+    credit_log = db.credit_logs.find_one()
+    logger.log("%s: %s messages in %.3fs (%.0f msg/s), outgoing %s pending %s" % (
+        name, MESSAGES, duration, MESSAGES / duration,
+        credit_log['outgoing'], credit_log['outgoing-pending']))
+
+
+run('count and increment', previous_message)
+run('upsert and day cache', message)
+credit_log_manager.set_accumulator(True)
+run('accumulator', message, credit_log_manager.flush_counters)
+credit_log_manager.set_accumulator(False)
+db.credit_logs.drop()
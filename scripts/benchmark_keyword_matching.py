@@ -0,0 +1,112 @@
+## Compare the linear keyword matching with the KeywordIndex on a synthetic
+## program of 2500 dialogue keywords and 2500 request keywords.
+## usage: python scripts/benchmark_keyword_matching.py [mongodb_host] [mongodb_port]
+import sys
+import random
+from time import time
+
+import pymongo
+sys.path.insert(0, './')
+
+from vusion.persist import DialogueManager, RequestManager
+from vusion.persist.action import Actions
+from vusion.context import Context
+from vusion.component import PrintLogger
+
+DIALOGUES = 100
+INTERACTIONS = 25
+REQUESTS = 2500
+MESSAGES = 2000
+
+mongodb_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+mongodb_port = int(sys.argv[2]) if len(sys.argv) > 2 else 27017
+c = pymongo.MongoClient(mongodb_host, mongodb_port)
+db = c['benchmark_keyword_matching']
+logger = PrintLogger()
+
+db.dialogues.drop()
+db.requests.drop()
+keywords = []
+for d in range(DIALOGUES):
+    interactions = []
+    for i in range(INTERACTIONS):
+        keyword = 'dial%si%s' % (d, i)
+        keywords.append(keyword)
+        interactions.append({
+            'activated': 1,
+            'interaction-id': '%s-%s' % (d, i),
+            'type-interaction': 'question-answer',
+            'content': 'What is your name?',
+            'keyword': keyword,
+            'set-use-template': 'use-template',
+            'type-question': 'open-question',
+            'answer-label': 'name',
+            'type-schedule': 'offset-days',
+            'days': '1',
+            'at-time': '22:30',
+            'feedbacks': None})
+    db.dialogues.save({
+        'name': 'dialogue %s' % d,
+        'auto-enrollment': None,
+        'activated': 1,
+        'dialogue-id': str(d),
+        'interactions': interactions})
+for r in range(REQUESTS):
+    keyword = 'req%s' % r
+    keywords.append(keyword)
+    db.requests.save({
+        'keyword': '%s join, %s' % (keyword, keyword),
+        'responses': [{'content': 'thank you'}],
+        'actions': [],
+        'set-no-request-matching-try-keyword-only': 'no-request-matching-try-keyword-only',
+        'object-type': 'request',
+        'model-version': '2'})
+
+dialogue_manager = DialogueManager(db, 'dialogues', logger=logger)
+request_manager = RequestManager(db, 'requests', logger=logger)
+messages = ['%s some answer' % random.choice(keywords) for i in range(MESSAGES)]
+messages += ['unknown%s' % i for i in range(MESSAGES / 10)]
+
+
+def linear_matching(message):
+    actions, context = Actions(), Context()
+    requests = request_manager.loaded_requests
+    for request_id, request in requests.iteritems():
+        if request.is_matching(message):
+            return request_id
+    for request_id, request in requests.iteritems():
+        if request.is_matching(message, False):
+            return request_id
+    for dialogue in dialogue_manager.loaded_dialogues.itervalues():
+        dialogue.get_matching_reference_and_actions(message, actions, context)
+        if context.is_matching():
+            return context['interaction-id']
+    return None
+
+
+def indexed_matching(message):
+    actions, context = Actions(), Context()
+    request_manager.get_matching_request_actions(message, actions, context)
+    if 'request-id' in context:
+        return str(context['request-id'])
+    dialogue_manager.get_matching_dialogue_actions(message, actions, context)
+    if context.is_matching():
+        return context['interaction-id']
+    return None
+
+
+sample = messages[:200]
+mismatches = [m for m in sample if linear_matching(m) != indexed_matching(m)]
+logger.log("Same matching on %s messages sample: %s mismatches" % (
+    len(sample), len(mismatches)))
+
+for name, matching in [('linear', linear_matching), ('indexed', indexed_matching)]:
+    start = time()
+    for message in messages:
+        matching(message)
+    duration = time() - start
+    logger.log("%s: %s messages in %.3fs (%.0f msg/s)" % (
+        name, len(messages), duration, len(messages) / duration))
+
+db.dialogues.drop()
+db.requests.drop()
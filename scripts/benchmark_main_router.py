@@ -0,0 +1,81 @@
+## Compare the inbound routing latency of the VusionMainRouter going through
+## all the rules, as it was, and looking up its index of the rules while the
+## number of rules grows.
+## usage: python scripts/benchmark_main_router.py
+import sys
+from time import time
+sys.path.insert(0, './')
+
+from vumi.message import TransportUserMessage
+
+from dispatchers import VusionMainRouter
+from vusion import clean_keyword
+from vusion.component import PrintLogger
+
+PROGRAMS = 50
+MESSAGES = 200
+
+logger = PrintLogger()
+
+
+class Dispatcher(object):
+
+    def __init__(self):
+        self.published = 0
+
+    def publish_inbound_message(self, name, msg):
+        self.published += 1
+
+
+## The routing as it was: all the rules are matched for each message
+class LoopMainRouter(VusionMainRouter):
+
+    def is_msg_matching_routing_rules(self, keyword, msg, rule):
+        rule['keyword'] = clean_keyword(rule['keyword'])
+        return super(VusionMainRouter, self).is_msg_matching_routing_rules(
+            clean_keyword(keyword), msg, rule)
+
+    def dispatch_inbound_message(self, msg):
+        keyword = clean_keyword(msg['content'].split(' ')[0].lower())
+        for rule in self.rules:
+            if self.is_msg_matching_routing_rules(keyword, msg, rule):
+                self.publish_exposed_inbound(rule['app'], msg.copy())
+
+
+def get_rules(keywords):
+    rules = []
+    for program in range(PROGRAMS):
+        for keyword in range(keywords):
+            rules.append({
+                'app': 'program%s' % program,
+                'keyword': u'keyw\xf6rd%s' % keyword,
+                'to_addr': '8%03d' % program,
+                'prefix': '+256'})
+    return rules
+
+
+def run(router_class, keywords):
+    dispatcher = Dispatcher()
+    router = router_class(dispatcher, {
+        'dispatcher_name': 'benchmark_main_router',
+        'redis_manager': {'FAKE_REDIS': True},
+        'transport_mappings': {},
+        'rules': get_rules(keywords)})
+    router.setup_routing()
+    msgs = [TransportUserMessage(
+                to_addr='8%03d' % (i % PROGRAMS), from_addr='+256712345678',
+                content='keyword%s join' % (i % keywords), transport_name='sms',
+                transport_type='sms')
+            for i in range(MESSAGES)]
+    start = time()
+    for msg in msgs:
+        router.dispatch_inbound_message(msg)
+    assert dispatcher.published == MESSAGES
+    return (time() - start) * 1000 / MESSAGES
+
+
+for keywords in [1, 10, 100, 500]:
+    loop = run(LoopMainRouter, keywords)
+    indexed = run(VusionMainRouter, keywords)
+    logger.log("%s rules: %.3fms/msg going through the rules, %.3fms/msg indexed" % (
+        PROGRAMS * keywords, loop, indexed))
@@ -0,0 +1,139 @@
+## Compare the rendering of messages with mixed placeholders by the regex and
+## replace customization with the compiled messages of the DialogueWorker.
+## usage: python scripts/benchmark_message_template.py [mongodb_host] [mongodb_port]
+import sys
+import re
+from time import time
+
+import pymongo
+sys.path.insert(0, './')
+
+from vusion.dialogue_worker import DialogueWorker
+from vusion.persist import (
+    ParticipantManager, ContentVariableManager, DialogueManager)
+from vusion.component import (
+    DialogueWorkerPropertyHelper, PrintLogger, MessageTemplateCache)
+from vusion.context import Context
+from vusion.utils import (
+    add_char_to_pattern, dynamic_content_notation_to_string)
+
+MESSAGES = 100000
+
+mongodb_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+mongodb_port = int(sys.argv[2]) if len(sys.argv) > 2 else 27017
+c = pymongo.MongoClient(mongodb_host, mongodb_port)
+db = c['benchmark_message_template']
+logger = PrintLogger()
+
+for collection in ['participants', 'content_variables', 'content_variable_tables',
+                   'dialogues', 'templates']:
+    db[collection].drop()
+participant_manager = ParticipantManager(db, 'participants', logger=logger)
+participant_manager.save({
+    'model-version': '4',
+    'object-type': 'participant',
+    'phone': '+256712345678',
+    'session-id': '1',
+    'last-optin-date': '2014-01-01T10:00:00',
+    'last-optout-date': None,
+    'tags': [],
+    'enrolled': [],
+    'profile': [{'label': 'name', 'value': 'oliv', 'raw': None}],
+    'transport_metadata': {},
+    'simulate': False})
+content_variable_manager = ContentVariableManager(
+    db, 'content_variables', 'content_variable_tables', logger=logger)
+content_variable_manager.save_content_variable(
+    {'key1': 'mombasa', 'key2': 'chicken', 'key3': None}, '600')
+template_id = db.templates.save({
+    'name': 'closed question',
+    'type-template': 'closed-question',
+    'template': 'QUESTION\r\nANSWERS\r\n To reply send: KEYWORD<space><AnswerNb> to SHORTCODE'})
+
+property_helper = DialogueWorkerPropertyHelper(None, None)
+property_helper['timezone'] = 'Africa/Kampala'
+property_helper['shortcode'] = '256-8181'
+property_helper['default-template-closed-question'] = template_id
+property_helper['default-template-open-question'] = None
+
+## Only the attributes used by the customization are set on the worker
+worker = DialogueWorker.__new__(DialogueWorker)
+worker.logger = logger
+worker.properties = property_helper
+worker.message_templates = MessageTemplateCache()
+worker.collections = {
+    'participants': participant_manager,
+    'content_variables': content_variable_manager,
+    'dialogues': DialogueManager(db, 'dialogues', logger=logger),
+    'templates': db.templates}
+
+context = Context(**{'message': 'feel fine', 'time': '09:00'})
+interaction = {
+    'interaction-id': '01-01',
+    'type-interaction': 'question-answer',
+    'type-question': 'closed-question',
+    'set-use-template': 'use-template',
+    'content': 'How are you [participant.name]?',
+    'keyword': 'feel',
+    'answers': [{'choice': 'Fine'}, {'choice': 'Ok'}]}
+messages = [
+    'Thank you for your answer',
+    'Hello [participant.name], the chicken is at [contentVariable.mombasa.chicken]',
+    'You sent "[context.message]" at [time.H:M]',
+    'Hello [participant.name], you sent "[context.message]"',
+    None]
+
+
+## The customization as it was: a regex compiled and a replace by placeholder
+def previous_customize_message(message, participant_phone=None, context=None):
+    participant = None
+    custom_regexp = re.compile(r'\[(?P<domain>[^\.\]]+)\.(?P<key1>[^\.\]]+)(\.(?P<key2>[^\.\]]+))?(\.(?P<key3>[^\.\]]+))?(\.(?P<otherkey>[^\.\]]+))?\]')
+    for match in re.finditer(custom_regexp, message):
+        match = match.groupdict()
+        domain = match['domain']
+        keys = {k: match[k] for k in ('key1', 'key2', 'key3') if match[k] is not None}
+        replace_match = dynamic_content_notation_to_string(domain, keys)
+        if domain.lower() in ['participant', 'participants']:
+            if participant is None:
+                participant = participant_manager.get_participant(participant_phone)
+            message = message.replace(replace_match, participant.get_data(match['key1']))
+        elif domain == 'contentVariable':
+            content_variable = content_variable_manager.get_content_variable_from_match(match)
+            message = message.replace(replace_match, content_variable['value'])
+        elif domain == 'context':
+            message = message.replace(replace_match, context.get_data_from_notation(**keys))
+        elif domain == 'time':
+            local_time = property_helper.get_local_time()
+            message = message.replace(replace_match, local_time.strftime(
+                add_char_to_pattern(match['key1'], '[a-zA-Z]')))
+    return message
+
+
+def previous_render(message):
+    if message is None:
+        message = worker.generate_message(interaction, False)
+    return previous_customize_message(message, '+256712345678', context)
+
+
+def compiled_render(message):
+    if message is None:
+        message = worker.generate_message(interaction)
+    return worker.customize_message(message, '+256712345678', context)
+
+
+sample = [previous_render(m) == compiled_render(m) for m in messages]
+logger.log("Same rendering on %s messages: %s" % (len(sample), all(sample)))
+
+for name, render in [('regex and replace', previous_render),
+                     ('compiled', compiled_render)]:
+    start = time()
+    for i in range(MESSAGES):
+        render(messages[i % len(messages)])
+    duration = time() - start
+    logger.log("%s: %s messages in %.3fs (%.0f msg/s)" % (
+        name, MESSAGES, duration, MESSAGES / duration))
+logger.log("Compiled messages cache %r" % worker.message_templates.get_stats())
+
+for collection in ['participants', 'content_variables', 'content_variable_tables',
+                   'dialogues', 'templates']:
+    db[collection].drop()
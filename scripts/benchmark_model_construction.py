@@ -0,0 +1,53 @@
+## Compare the objects/sec of the model construction with the upgrade and
+## the validation rules and of the trusted construction of database reads.
+## usage: python scripts/benchmark_model_construction.py
+import sys
+from time import time
+sys.path.insert(0, './')
+
+from vusion.persist import (
+    Participant, Dialogue, schedule_generator, trusted_schedule_generator,
+    history_generator, trusted_history_generator)
+from vusion.component import PrintLogger
+from tests.utils import ObjectMaker
+
+OBJECTS = 20000
+
+logger = PrintLogger()
+maker = ObjectMaker()
+
+documents = {
+    'participant': maker.mkobj_participant(
+        '+256712345678',
+        enrolled=[{'dialogue-id': '1', 'date-time': '2014-01-01T10:00:00'}],
+        tags=['geek', 'french'],
+        profile=[{'label': 'name', 'value': 'oliv', 'raw': None}]),
+    'schedule': maker.mkobj_schedule(),
+    'dialogue': maker.mkobj_dialogue_open_question_reminder(),
+    'history': maker.mkobj_history_dialogue(
+        '1', '1', '2014-01-01T10:00:00', message_content='hello')}
+documents['dialogue']['model-version'] = Dialogue.MODEL_VERSION
+
+constructions = [
+    ('participant', Participant, Participant.from_trusted),
+    ('schedule', schedule_generator, trusted_schedule_generator),
+    ('dialogue', Dialogue, Dialogue.from_trusted),
+    ('history', history_generator, trusted_history_generator)]
+
+
+def run(document, instanciate, objects):
+    start = time()
+    for i in xrange(objects):
+        instanciate(**dict(document))
+    return objects / (time() - start)
+
+
+for name, instanciate, trusted_instanciate in constructions:
+    document = documents[name]
+    ## the dialogues are much bigger
+    objects = OBJECTS / 10 if name == 'dialogue' else OBJECTS
+    assert instanciate(**dict(document)) == trusted_instanciate(**dict(document))
+    validated = run(document, instanciate, objects)
+    trusted = run(document, trusted_instanciate, objects)
+    logger.log("%s: %.0f objects/s validated, %.0f objects/s trusted (x%.1f)" % (
+        name, validated, trusted, trusted / validated))
@@ -0,0 +1,61 @@
+## Compare the per message cost of the rate limiting with a key per message
+## in flight counted by KEYS, as it was, and with the sliding window counter
+## while the number of messages in the window grows.
+## usage: python scripts/benchmark_rate_manager.py [redis_host] [redis_port]
+import sys
+from time import time
+
+from twisted.internet import task
+from twisted.internet.defer import inlineCallbacks, returnValue
+sys.path.insert(0, './')
+
+from vumi.persist.txredis_manager import TxRedisManager
+
+from components.rate_manager import RateManager
+from vusion.component import PrintLogger
+
+MESSAGES = 1000
+
+redis_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+redis_port = int(sys.argv[2]) if len(sys.argv) > 2 else 6379
+logger = PrintLogger()
+
+
+## The rate limiting as it was: a key per message expiring after per_seconds
+class KeysRateManager(RateManager):
+
+    @inlineCallbacks
+    def is_within_rate(self, message_id, buckets={}):
+        inflight_keys = yield self.redis.keys(self.redis._key('*'))
+        yield self.redis.setex(self.redis._key(message_id), self.per_seconds, '')
+        returnValue(self.window_size > len(inflight_keys))
+
+
+@inlineCallbacks
+def run(redis, manager_class, inflight):
+    yield redis._purge_all()
+    manager = manager_class(redis, window_size=inflight * 2, per_seconds=60)
+    for i in xrange(inflight):
+        yield manager.is_within_rate('inflight-%s' % i)
+    start = time()
+    for i in xrange(MESSAGES):
+        yield manager.is_within_rate('message-%s' % i)
+    returnValue((time() - start) * 1000 / MESSAGES)
+
+
+@inlineCallbacks
+def main(reactor):
+    redis = yield TxRedisManager.from_config({
+        'host': redis_host,
+        'port': redis_port,
+        'key_prefix': 'benchmark_rate_manager'})
+    for inflight in [100, 1000, 10000]:
+        keys = yield run(redis, KeysRateManager, inflight)
+        sliding = yield run(redis, RateManager, inflight)
+        logger.log("%s messages in window: %.3fms/msg with keys, %.3fms/msg sliding window" % (
+            inflight, keys, sliding))
+    yield redis._purge_all()
+    yield redis._close()
+
+
+task.react(main)
@@ -0,0 +1,127 @@
+## Measure how long the reactor is stalled by the participant/history queries
+## of incoming messages, with blocking calls and with the db thread pool.
+## usage: python scripts/benchmark_reactor_stall.py [mongodb_host] [mongodb_port]
+import sys
+from time import time
+from datetime import datetime
+
+import pymongo
+sys.path.insert(0, './')
+
+from twisted.internet import reactor, task
+from twisted.internet.defer import inlineCallbacks, DeferredList
+
+from vusion.persist import ParticipantManager, HistoryManager
+from vusion.component import PrintLogger
+
+PARTICIPANTS = 20000
+MESSAGES = 2000
+CONCURRENT = 50
+HEARTBEAT = 0.01
+
+mongodb_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+mongodb_port = int(sys.argv[2]) if len(sys.argv) > 2 else 27017
+c = pymongo.MongoClient(mongodb_host, mongodb_port, w=1)
+db = c['benchmark_reactor_stall']
+logger = PrintLogger()
+
+db.participants.drop()
+db.history.drop()
+participant_manager = ParticipantManager(db, 'participants', logger=logger)
+history_manager = HistoryManager(db, 'history', None, None, logger=logger)
+participant_manager.insert([{
+    'model-version': '4',
+    'object-type': 'participant',
+    'phone': '+2567%08d' % i,
+    'session-id': '%032d' % i,
+    'last-optin-date': '2014-01-01T10:00:00',
+    'last-optout-date': None,
+    'tags': [], 'enrolled': [], 'profile': [],
+    'transport_metadata': {}, 'simulate': False} for i in range(PARTICIPANTS)])
+
+
+## The heartbeat is late by the time the reactor was not available
+class StallMonitor(object):
+
+    def __init__(self):
+        self.stalls = []
+        self.last = None
+        self.loop = task.LoopingCall(self.beat)
+
+    def beat(self):
+        now = time()
+        if self.last is not None:
+            self.stalls.append(max(now - self.last - HEARTBEAT, 0))
+        self.last = now
+
+    def start(self):
+        self.stalls = []
+        self.last = None
+        self.loop.start(HEARTBEAT)
+
+    def stop(self):
+        self.loop.stop()
+        stalls = sorted(self.stalls)
+        if stalls == []:
+            return 0, 0
+        return stalls[int(len(stalls) * 0.99)], stalls[-1]
+
+
+def blocking_message(phone):
+    participant = participant_manager.get_participant(phone, only_optin=True)
+    history_manager.save_history(**{
+        'object-type': 'unmatching-history',
+        'participant-phone': phone,
+        'participant-session-id': participant['session-id'],
+        'message-content': 'hello',
+        'message-direction': 'incoming',
+        'timestamp': datetime.now()})
+    history_manager.has_oneway_marker(
+        phone, participant['session-id'], '1', '1')
+
+
+@inlineCallbacks
+def deferred_message(phone):
+    participant = yield participant_manager.deferred.get_participant(
+        phone, only_optin=True)
+    yield history_manager.deferred.save_history(**{
+        'object-type': 'unmatching-history',
+        'participant-phone': phone,
+        'participant-session-id': participant['session-id'],
+        'message-content': 'hello',
+        'message-direction': 'incoming',
+        'timestamp': datetime.now()})
+    yield history_manager.deferred.has_oneway_marker(
+        phone, participant['session-id'], '1', '1')
+
+
+@inlineCallbacks
+def run(name, consume):
+    monitor = StallMonitor()
+    monitor.start()
+    start = time()
+    phones = ['+2567%08d' % (i * 7 % PARTICIPANTS) for i in range(MESSAGES)]
+    for i in range(0, MESSAGES, CONCURRENT):
+        ## let the reactor run between the bursts of messages
+        yield task.deferLater(reactor, 0, lambda: None)
+        yield DeferredList([task.deferLater(reactor, 0, consume, phone)
+                            for phone in phones[i:i + CONCURRENT]])
+    duration = time() - start
+    p99, worst = monitor.stop()
+    logger.log("%s: %s messages in %.3fs (%.0f msg/s), reactor stall p99 %.1fms max %.1fms" % (
+        name, MESSAGES, duration, MESSAGES / duration, p99 * 1000, worst * 1000))
+
+
+@inlineCallbacks
+def main():
+    try:
+        yield run('blocking', blocking_message)
+        yield run('db thread pool', deferred_message)
+    finally:
+        db.participants.drop()
+        db.history.drop()
+        reactor.stop()
+
+
+reactor.callWhenRunning(main)
+reactor.run()
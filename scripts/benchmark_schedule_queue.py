@@ -0,0 +1,65 @@
+## Measure the schedules/sec leased and acked from the shared schedule queue
+## by 1, 2 and 4 worker processes, each participant being leased to one
+## worker at a time.
+## usage: python scripts/benchmark_schedule_queue.py [redis_host] [redis_port]
+import sys
+from datetime import datetime, timedelta
+from multiprocessing import Process, Queue
+from time import time
+sys.path.insert(0, './')
+
+from bson import ObjectId
+from redis import Redis
+
+from vusion.component import RedisScheduleQueue, PrintLogger
+
+SCHEDULES = 50000
+PARTICIPANTS = 5000
+BATCH_SIZE = 500
+
+redis_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+redis_port = int(sys.argv[2]) if len(sys.argv) > 2 else 6379
+prefix_key = 'benchmark:schedule-queue'
+
+logger = PrintLogger()
+local_time = datetime(2014, 1, 1, 10, 0, 0)
+
+
+def consume(worker_id, results):
+    queue = RedisScheduleQueue(prefix_key, Redis(redis_host, redis_port))
+    consumed = 0
+    while True:
+        leased = queue.lease(worker_id, local_time, BATCH_SIZE)
+        if leased == {} and len(queue) == 0:
+            break
+        for phone, schedule_ids in leased.iteritems():
+            queue.ack(schedule_ids)
+            queue.release(worker_id, phone)
+            consumed += len(schedule_ids)
+    results.put(consumed)
+
+
+def run(workers):
+    queue = RedisScheduleQueue(prefix_key, Redis(redis_host, redis_port))
+    queue.clear()
+    queue.push_many([
+        (ObjectId(), '+%s' % (i % PARTICIPANTS),
+         local_time - timedelta(seconds=i % 3600))
+        for i in xrange(SCHEDULES)])
+    results = Queue()
+    processes = [Process(target=consume, args=('worker-%s' % i, results))
+                 for i in range(workers)]
+    start = time()
+    for process in processes:
+        process.start()
+    consumed = [results.get() for process in processes]
+    for process in processes:
+        process.join()
+    duration = time() - start
+    assert sum(consumed) == SCHEDULES
+    queue.clear()
+    return SCHEDULES / duration
+
+
+for workers in [1, 2, 4]:
+    logger.log("%s workers: %.0f schedules/s" % (workers, run(workers)))
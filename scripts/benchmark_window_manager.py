@@ -0,0 +1,65 @@
+## Compare the throughput of the window manager claiming a key per redis
+## round trip, as it was, and claiming the room of the window by batch with
+## the commands pipelined, for an add, monitor and ack of each message.
+## usage: python scripts/benchmark_window_manager.py [redis_host] [redis_port]
+import sys
+from time import time
+
+from twisted.internet import task
+from twisted.internet.defer import inlineCallbacks, returnValue
+sys.path.insert(0, './')
+
+from vumi.persist.txredis_manager import TxRedisManager
+from vumi.components.window_manager import WindowManager
+
+from components.window_manager import VusionWindowManager
+from vusion.component import PrintLogger
+
+MESSAGES = 5000
+WINDOW_ID = 'benchmark'
+
+redis_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+redis_port = int(sys.argv[2]) if len(sys.argv) > 2 else 6379
+logger = PrintLogger()
+
+
+@inlineCallbacks
+def run(redis, manager_class, window_size):
+    yield redis._purge_all()
+    manager = manager_class(redis, window_size=window_size, flight_lifetime=60)
+    yield manager.create_window(WINDOW_ID)
+    acked = []
+
+    ## the transport acks the message as soon as it is sent
+    @inlineCallbacks
+    def send(window_id, key, data=None):
+        if data is None:
+            data = yield manager.get_data(window_id, key)
+        acked.append(key)
+        yield manager.remove_key(window_id, key)
+
+    start = time()
+    for i in xrange(MESSAGES):
+        yield manager.add(WINDOW_ID, {'content': 'message %s' % i})
+    while len(acked) < MESSAGES:
+        yield manager._monitor_windows(send, False)
+    manager.stop()
+    returnValue(MESSAGES / (time() - start))
+
+
+@inlineCallbacks
+def main(reactor):
+    redis = yield TxRedisManager.from_config({
+        'host': redis_host,
+        'port': redis_port,
+        'key_prefix': 'benchmark_window_manager'})
+    for window_size in [10, 100, 1000]:
+        vumi = yield run(redis, WindowManager, window_size)
+        vusion = yield run(redis, VusionWindowManager, window_size)
+        logger.log("window of %s: %.0f msg/s one key per call, %.0f msg/s by batch" % (
+            window_size, vumi, vusion))
+    yield redis._purge_all()
+    yield redis._close()
+
+
+task.react(main)
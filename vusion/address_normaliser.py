@@ -0,0 +1,150 @@
+# -*- test-case-name: vusion.tests.test_address_normaliser -*-
+import re
+from threading import Lock
+
+SHORTCODE_REGEX = re.compile('^[0-9]+-[0-9]+$')
+WHITESPACE_REGEX = re.compile('\s')
+
+_MISSING = object()
+
+
+## Normalise the phones and the shortcode addresses with string operations
+## instead of a regex pass per rule. As the same participants and shortcodes
+## are coming again and again, the results are memoized by address in bounded
+## caches, which are cleared when full. The middleware rules are options as
+## they depend on the transport.
+class AddressNormaliser(object):
+
+    def __init__(self, international_prefix=None, ensure_plus_inbound=False,
+                 trim_plus_outbound=False,
+                 trim_international_prefix_outbound=False, max_size=10000):
+        self.international_prefix = (
+            str(international_prefix) if international_prefix else None)
+        self.ensure_plus_inbound = ensure_plus_inbound
+        self.trim_plus_outbound = trim_plus_outbound
+        self.trim_international_prefix_outbound = trim_international_prefix_outbound
+        self.max_size = max_size
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.phones = {}
+        self.shortcodes = {}
+        self.inbound_from_addrs = {}
+        self.inbound_to_addrs = {}
+        self.outbound_to_addrs = {}
+
+    def _memoize(self, cache, address, normalise):
+        value = cache.get(address, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = normalise(address)
+        with self.lock:
+            if len(cache) >= self.max_size:
+                cache.clear()
+            cache[address] = value
+        return value
+
+    def clean_phone(self, phone):
+        if phone in [None, '']:
+            return None
+        return self._memoize(self.phones, phone, self._clean_phone)
+
+    def _clean_phone(self, phone):
+        if phone[:2] == '00':
+            return '+' + phone[2:]
+        if phone[:1] == '0':
+            return '+' + phone[1:]
+        if phone[:1] != '+':
+            return '+' + phone
+        return phone
+
+    ## Return a tuple (prefix, shortcode) of a shortcode address as
+    ## 256-8181, the prefix is None for the other addresses
+    def split_shortcode(self, address):
+        return self._memoize(self.shortcodes, address, self._split_shortcode)
+
+    def _split_shortcode(self, address):
+        if SHORTCODE_REGEX.match(address) is None:
+            return (None, address)
+        return tuple(address.split('-'))
+
+    def is_shortcode_address(self, address):
+        if address is None:
+            return False
+        return self.split_shortcode(address)[0] is not None
+
+    def get_shortcode_value(self, address):
+        if address is None:
+            return None
+        return self.split_shortcode(address)[1]
+
+    def get_shortcode_international_prefix(self, address):
+        if address is None:
+            return None
+        prefix, shortcode = self.split_shortcode(address)
+        return address if prefix is None else prefix
+
+    def has_international_prefix(self, phone, international_prefix):
+        return phone[:1] == '+' and phone.startswith(str(international_prefix), 1)
+
+    def normalise_inbound_from_addr(self, address):
+        return self._memoize(
+            self.inbound_from_addrs, address, self._normalise_inbound_from_addr)
+
+    def _normalise_inbound_from_addr(self, address):
+        address = WHITESPACE_REGEX.sub('', address)
+        if address[:2] == '00':
+            address = address[2:]
+        if address[:1] != '+':
+            address = '+' + address
+        if (self.international_prefix
+                and not address.startswith(self.international_prefix, 1)):
+            address = '+' + self.international_prefix + address[1:]
+        return address
+
+    def normalise_inbound_to_addr(self, address):
+        return self._memoize(
+            self.inbound_to_addrs, address, self._normalise_inbound_to_addr)
+
+    def _normalise_inbound_to_addr(self, address):
+        address = WHITESPACE_REGEX.sub('', address)
+        if address[:1] == '+':
+            address = address[1:]
+        if address[:2] == '00':
+            address = address[2:]
+        if self.ensure_plus_inbound:
+            address = '+' + address
+        return address
+
+    def normalise_outbound_to_addr(self, address):
+        return self._memoize(
+            self.outbound_to_addrs, address, self._normalise_outbound_to_addr)
+
+    def _normalise_outbound_to_addr(self, address):
+        prefix = self.international_prefix
+        if self.trim_international_prefix_outbound and prefix:
+            if address[:1] == '+' and address.startswith(prefix, 1):
+                address = address[len(prefix) + 1:]
+            elif address.startswith(prefix):
+                address = address[len(prefix):]
+        if self.trim_plus_outbound and address[:1] == '+':
+            address = address[1:]
+        return address
+
+    def clear(self):
+        with self.lock:
+            for cache in [self.phones, self.shortcodes, self.inbound_from_addrs,
+                          self.inbound_to_addrs, self.outbound_to_addrs]:
+                cache.clear()
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'phones': len(self.phones),
+                'shortcodes': len(self.shortcodes)}
+
+
+## Shared by the utils functions
+address_normaliser = AddressNormaliser()
@@ -2,9 +2,19 @@ from dialogue_worker_property_helper import DialogueWorkerPropertyHelper
 from credit_manager import CreditManager, CreditStatus, CreditNotification
 from log_manager import RedisLogger, BasicLogger, PrintLogger
 from flying_messsage_manager import FlyingMessageManager
+from bulk_dialogue_scheduler import BulkDialogueScheduler
+from mass_scheduler import MassScheduler
+from message_template_cache import MessageTemplateCache, compile_message
+from schedule_queue import RedisScheduleQueue
+from shard_ring import ShardRing
+from metrics import Metrics, MetricsResource, timed
 
 
 __all__ = ["CreditManager", "CreditStatus", "CreditNotification",
            "DialogueWorkerPropertyHelper",
            "RedisLogger", "BasicLogger", "PrintLogger",
-           "FlyingMessageManager"]
\ No newline at end of file
+           "FlyingMessageManager",
+           "BulkDialogueScheduler", "MassScheduler",
+           "MessageTemplateCache", "compile_message",
+           "RedisScheduleQueue", "ShardRing",
+           "Metrics", "MetricsResource", "timed"]
\ No newline at end of file
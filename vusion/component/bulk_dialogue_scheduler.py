@@ -0,0 +1,173 @@
+# -*- test-case-name: vusion.component.tests.test_bulk_dialogue_scheduler -*-
+import sys
+import traceback
+from time import time
+
+from vusion.utils import time_from_vusion_format
+from vusion.persist import DialogueSchedule, ReminderSchedule, DeadlineSchedule
+
+
+## Compute the schedules of a dialogue for participants by batch: the
+## histories and schedules of a batch are prefetched with a few queries,
+## the times are computed in memory and written with one unordered bulk.
+## The result is the same as DialogueWorker.schedule_participant_dialogue.
+class BulkDialogueScheduler(object):
+
+    def __init__(self, history_collection, schedule_collection,
+                 property_helper, logger, batch_size=500):
+        self.history_collection = history_collection
+        self.schedule_collection = schedule_collection
+        self.property_helper = property_helper
+        self.logger = logger
+        self.batch_size = batch_size
+
+    def log(self, msg, level='msg'):
+        if self.logger is not None:
+            self.logger.log(msg, level)
+
+    def get_local_time(self):
+        return self.property_helper.get_local_time()
+
+    def schedule_participants_dialogue(self, participants, dialogue):
+        batch = []
+        total_participants = 0
+        total_writes = 0
+        start = time()
+        for participant in participants:
+            if participant is None:
+                continue
+            batch.append(participant)
+            if len(batch) >= self.batch_size:
+                total_writes += self.schedule_batch(batch, dialogue)
+                total_participants += len(batch)
+                batch = []
+        if batch != []:
+            total_writes += self.schedule_batch(batch, dialogue)
+            total_participants += len(batch)
+        duration = time() - start
+        self.log("Bulk scheduling of dialogue %s done: %s participants, %s writes in %.3fs" % (
+            dialogue['dialogue-id'], total_participants, total_writes, duration))
+        return total_participants
+
+    def schedule_batch(self, participants, dialogue):
+        start = time()
+        dialogue_id = dialogue['dialogue-id']
+        states = self.history_collection.get_dialogue_interaction_states(
+            participants, dialogue_id)
+        answered = self.history_collection.get_offset_condition_answered(
+            participants, dialogue_id,
+            [i['offset-condition-interaction-id'] for i in dialogue.interactions
+             if i['type-schedule'] == 'offset-condition'])
+        existing = self.schedule_collection.get_participants_dialogue_schedules(
+            [p['phone'] for p in participants], dialogue_id)
+        local_time = self.get_local_time()
+
+        to_save, to_remove = [], []
+        for participant in participants:
+            try:
+                saves, removes = self.compute_participant_schedules(
+                    participant, dialogue, states, answered, existing, local_time)
+                to_save += saves
+                to_remove += removes
+            except:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                self.log(
+                    "Error during bulk schedule of %s: %r" % (
+                        participant['phone'],
+                        traceback.format_exception(exc_type, exc_value, exc_traceback)))
+
+        writes = self.schedule_collection.save_schedules_bulk(to_save, to_remove)
+        duration = time() - start
+        self.log("Bulk scheduling of dialogue %s: batch of %s participants, %s writes in %.3fs (%.0f participants/s)" % (
+            dialogue_id, len(participants), writes, duration,
+            len(participants) / duration if duration > 0 else len(participants)))
+        return writes
+
+    def compute_participant_schedules(self, participant, dialogue, states,
+                                      answered, existing, local_time):
+        phone = participant['phone']
+        session_id = participant['session-id']
+        dialogue_id = dialogue['dialogue-id']
+        to_save, to_remove = [], []
+        for interaction in dialogue.interactions:
+            interaction_id = interaction['interaction-id']
+            state = states.get((phone, session_id, interaction_id), {})
+            schedules = existing.get((phone, interaction_id), [])
+
+            ##If we have any marker associate with this interaction,
+            ##no schedule is done.
+            if state.get('markers', 0) > 0:
+                continue
+
+            ##The iteraction has aleardy been sent,
+            ##the reminders might need to be updated.
+            if state.get('first-timestamp') is not None:
+                self.compute_reminders(
+                    participant, dialogue_id, interaction, state, schedules,
+                    time_from_vusion_format(state['first-timestamp']),
+                    local_time, to_save, to_remove, True)
+                continue
+
+            if (interaction['type-schedule'] == 'offset-condition'
+                    and not (phone, session_id, interaction['offset-condition-interaction-id']) in answered):
+                continue
+            sending_date_time = interaction.get_sending_date_time(
+                participant, dialogue_id, local_time)
+
+            dialogue_schedules = [s for s in schedules
+                                  if s.get_type() == 'dialogue-schedule']
+            if dialogue_schedules == []:
+                schedule = DialogueSchedule(**{
+                    'date-time': sending_date_time,
+                    'participant-phone': phone,
+                    'participant-session-id': session_id,
+                    'dialogue-id': dialogue_id,
+                    'interaction-id': interaction_id})
+            else:
+                schedule = dialogue_schedules[0]
+                schedule.set_time(sending_date_time)
+            to_save.append(schedule)
+            self.compute_reminders(
+                participant, dialogue_id, interaction, state, schedules,
+                sending_date_time, local_time, to_save, to_remove)
+        return to_save, to_remove
+
+    def compute_reminders(self, participant, dialogue_id, interaction, state,
+                          schedules, interaction_date_time, local_time,
+                          to_save, to_remove, is_interaction_history=False):
+        #Do not schedule reminder in case of valide answer or one way marker
+        if state.get('oneway-markers', 0) > 0:
+            return
+        if state.get('valid-answers', 0) > 0:
+            return
+
+        #remove all reminder(s)/deadline for this interaction
+        reminder_tail = [s for s in schedules
+                         if s.get_type() in ['reminder-schedule', 'deadline-schedule']]
+        to_remove += [s['_id'] for s in reminder_tail]
+
+        if not interaction.has_reminder():
+            return
+        if reminder_tail == [] and is_interaction_history:
+            return
+
+        already_send_reminder_count = max(state.get('outgoings', 0) - 1, 0)
+        reminder_times = interaction.get_reminder_times(interaction_date_time)
+        for reminder_time in reminder_times[already_send_reminder_count:]:
+            to_save.append(ReminderSchedule(**{
+                'participant-phone': participant['phone'],
+                'participant-session-id': participant['session-id'],
+                'date-time': reminder_time,
+                'dialogue-id': dialogue_id,
+                'interaction-id': interaction['interaction-id']}))
+
+        #We don't schedule deadline in the past
+        deadline_time = interaction.get_deadline_time(interaction_date_time)
+        if deadline_time < local_time:
+            deadline_time = local_time
+        to_save.append(DeadlineSchedule(**{
+            'participant-phone': participant['phone'],
+            'participant-session-id': participant['session-id'],
+            'date-time': deadline_time,
+            'dialogue-id': dialogue_id,
+            'interaction-id': interaction['interaction-id']}))
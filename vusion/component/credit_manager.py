@@ -12,6 +12,7 @@ from vusion.utils import (time_to_vusion_format, time_from_vusion_format,
                           date_from_vusion_format)
 from vusion.persist import Model
 from vusion.error import WrongModelInstanciation
+from vusion.const import DATE_TIME_REGEX
 
 
 class CreditManager(object):
@@ -21,6 +22,7 @@ class CreditManager(object):
     STATUS_KEY = 'status'
     CARD_KEY = 'card'
     NOTIFICATION_KEY = 'notifications'
+    BROADCAST_KEY = 'broadcast'
     
     credit_type = 'none'
     credit_number = None
@@ -96,6 +98,9 @@ class CreditManager(object):
     def notification_key(self):
         return ':'.join([self.credit_manager_key(), self.NOTIFICATION_KEY])
 
+    def broadcast_count_key(self, unattach_id):
+        return ':'.join([self.credit_manager_key(), self.BROADCAST_KEY, unicode(unattach_id)])
+
     def received_message(self, message_credits, participant):
         if participant is None:
             return
@@ -182,6 +187,9 @@ class CreditManager(object):
 
     ## This is just a rought estimation based on the message send to the first participant
     def estimate_unattached_required_credit(self, message_credits, schedule):
+        broadcast_count = self.redis.get(self.broadcast_count_key(schedule['unattach-id']))
+        if broadcast_count is not None:
+            return message_credits * int(broadcast_count)
         conditions = {
             'object-type': 'unattach-schedule', 
             'unattach-id': schedule['unattach-id'],
@@ -189,6 +197,15 @@ class CreditManager(object):
         scheduled_count = self.schedule_collection.find(conditions).count()
         return message_credits * scheduled_count + message_credits ##the first one have already been deleted        
 
+    ## The participants of a broadcast are counted once when it starts,
+    ## the count is cleared when it's done or rescheduled
+    def set_broadcast_count(self, unattach_id, participant_count):
+        self.redis.setex(
+            self.broadcast_count_key(unattach_id), participant_count, 1800) ## 30 minutes
+
+    def clear_broadcast_count(self, unattach_id):
+        self.redis.delete(self.broadcast_count_key(unattach_id))
+
     ## Cache a card for a given schedule for 30min
     def cache_card(self, schedule, card):
         if schedule is None or schedule.get_type() != 'unattach-schedule':
@@ -260,7 +277,7 @@ class CreditNotification(Model):
     fields = {
         'timestamp': {
             'required': True,
-            'valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+)(:0?(\d+))$'), v['timestamp'])
+            'valid_value': lambda v: re.match(DATE_TIME_REGEX, v['timestamp'])
             },
         'notification-type': {
             'required': True,
@@ -328,7 +345,7 @@ class CreditStatus(Model):
     fields = {
         'since': {
             'required': True,
-            'valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+)(:0?(\d+))$'), v['since'])
+            'valid_value': lambda v: re.match(DATE_TIME_REGEX, v['since'])
             },
         'status': {
             'required': True,
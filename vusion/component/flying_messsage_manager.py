@@ -21,7 +21,28 @@ class FlyingMessageManager(object):
     def get_message_data(self, message_user_id):
         key = self.data_key(message_user_id)
         data = self.redis.get(key)
+        return self.parse_message_data(data)
+
+    def parse_message_data(self, data):
         if data is None:
             return None, 0, None
         [history_id, credits, status] = re.split(':', data)
-        return ObjectId(history_id), int(credits), status
\ No newline at end of file
+        return ObjectId(history_id), int(credits), status
+
+    ## Pipelined versions, messages_data is a list of
+    ## (message_user_id, history_id, credits, status)
+    def append_messages_data(self, messages_data):
+        pipe = self.redis.pipeline()
+        for message_user_id, history_id, credits, status in messages_data:
+            pipe.setex(
+                self.data_key(message_user_id),
+                ':'.join([str(history_id), str(credits), status]),
+                self.KEY_EXPIRING_TIME)
+        pipe.execute()
+
+    def get_messages_data(self, message_user_ids):
+        if message_user_ids == []:
+            return []
+        datas = self.redis.mget(
+            [self.data_key(message_user_id) for message_user_id in message_user_ids])
+        return [self.parse_message_data(data) for data in datas]
@@ -0,0 +1,210 @@
+# -*- test-case-name: vusion.tests.test_dialogue_worker_schedule -*-
+import json
+from time import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.task import deferLater
+from twisted.internet.threads import deferToThreadPool
+
+from bson import ObjectId
+
+
+## Schedule a mass tag, an unattached message or a dialogue by chunks of documents
+## ordered by _id: the delta of each chunk is computed with a few set
+## queries and applied with unordered bulks, the dialogues are scheduled by
+## the bulk dialogue scheduler. The last _id of each chunk is stored in
+## redis so that an interrupted job is resumed when it's run again with the
+## same signature, the progress is reported in the program's log.
+## The chunks are run one at a time in the thread pool (or on the next
+## reactor iteration without pool) so that the worker keeps handling the
+## messages during a job.
+class MassScheduler(object):
+
+    def __init__(self, participant_collection, schedule_collection,
+                 bulk_scheduler, r_key, r_server, logger, chunk_size=1000,
+                 thread_pool=None):
+        self.participant_collection = participant_collection
+        self.schedule_collection = schedule_collection
+        self.bulk_scheduler = bulk_scheduler
+        self.r_key = r_key
+        self.r_server = r_server
+        self.logger = logger
+        self.chunk_size = chunk_size
+        self.thread_pool = thread_pool
+
+    def log(self, msg, level='msg'):
+        if self.logger is not None:
+            self.logger.log(msg, level)
+
+    def get_progress_key(self):
+        return '%s:mass-scheduling' % self.r_key
+
+    ## return a tuple (phase, last_id) of an interrupted job
+    def get_progress(self, job_id, signature):
+        progress = self.r_server.hget(self.get_progress_key(), job_id)
+        if progress is None:
+            return None, None
+        progress = json.loads(progress)
+        if progress['signature'] != signature:
+            return None, None
+        return progress['phase'], ObjectId(progress['last-id'])
+
+    def set_progress(self, job_id, signature, phase, last_id):
+        self.r_server.hset(
+            self.get_progress_key(), job_id,
+            json.dumps({'signature': signature,
+                        'phase': phase,
+                        'last-id': str(last_id)}))
+
+    def clear_progress(self, job_id):
+        self.r_server.hdel(self.get_progress_key(), job_id)
+
+    def defer(self, function, *args):
+        if self.thread_pool is None:
+            return deferLater(reactor, 0, function, *args)
+        return deferToThreadPool(reactor, self.thread_pool, function, *args)
+
+    ## Process the chunks of the phase, the phases before the one of an
+    ## interrupted job are skipped
+    @inlineCallbacks
+    def run_chunks(self, collection, query, fields, job, phases, phase, process):
+        job_id, signature = job
+        progress_phase, last_id = self.get_progress(job_id, signature)
+        if progress_phase is not None:
+            if phases.index(progress_phase) > phases.index(phase):
+                return
+            if progress_phase != phase:
+                last_id = None
+        while True:
+            last_id = yield self.defer(
+                self.run_chunk, collection, query, fields, job, phase,
+                last_id, process)
+            if last_id is None:
+                return
+
+    ## Return the last _id of the processed chunk, None when there is none
+    def run_chunk(self, collection, query, fields, job, phase, last_id, process):
+        if last_id is not None:
+            query = {'$and': [query, {'_id': {'$gt': last_id}}]}
+        chunk = list(collection.find(
+            query, fields, sort=[('_id', 1)], limit=self.chunk_size))
+        if chunk == []:
+            return None
+        process(chunk)
+        last_id = chunk[-1]['_id']
+        self.set_progress(job[0], job[1], phase, last_id)
+        return last_id
+
+    def log_progress(self, job_id, count, writes, start, status='running'):
+        duration = time() - start
+        self.log("Mass scheduling %s %s: %s participants, %s writes in %.3fs (%.0f participants/s)" % (
+            job_id, status, count, writes, duration,
+            count / duration if duration > 0 else count))
+
+    @inlineCallbacks
+    def schedule_unattach(self, unattach, query):
+        job = ('unattach:%s' % unattach['_id'],
+               repr((unattach['fixed-time'], sorted(query.items()))))
+        phases = ['remove', 'save']
+        stats = {'count': 0, 'writes': 0, 'start': time()}
+
+        ## remove the schedules of the participants not selected anymore
+        def remove(chunk):
+            phones = [item['participant-phone'] for item in chunk]
+            selected = self.participant_collection.find(
+                {'$and': [query, {'phone': {'$in': phones}}]}, ['phone'])
+            selected_phones = set(item['phone'] for item in selected)
+            stats['writes'] += self.schedule_collection.save_unattach_schedules_bulk(
+                unattach, [], [phone for phone in phones
+                               if phone not in selected_phones])
+
+        ## set the schedules of the selected participants
+        def save(chunk):
+            stats['writes'] += self.schedule_collection.save_unattach_schedules_bulk(
+                unattach, chunk)
+            stats['count'] += len(chunk)
+            self.log_progress(job[0], stats['count'], stats['writes'], stats['start'])
+
+        yield self.run_chunks(
+            self.schedule_collection, {'unattach-id': str(unattach['_id'])},
+            ['participant-phone'], job, phases, 'remove', remove)
+        yield self.run_chunks(
+            self.participant_collection, query, ['phone', 'session-id'],
+            job, phases, 'save', save)
+        self.clear_progress(job[0])
+        self.log_progress(job[0], stats['count'], stats['writes'], stats['start'], 'done')
+        returnValue(stats['count'])
+
+    @inlineCallbacks
+    def schedule_mass_tag(self, tag, query, dialogues, unattacheds):
+        if query is None:
+            query = {}
+        job = ('mass-tag:%s' % tag, repr(sorted(query.items())))
+        stats = {'count': 0, 'writes': 0, 'start': time()}
+
+        def schedule(chunk):
+            stats['writes'] += self.schedule_participants(
+                [item['_id'] for item in chunk], dialogues, unattacheds)
+            stats['count'] += len(chunk)
+            self.log_progress(job[0], stats['count'], stats['writes'], stats['start'])
+
+        yield self.run_chunks(
+            self.participant_collection, query, ['_id'],
+            job, ['participants'], 'participants', schedule)
+        self.clear_progress(job[0])
+        self.log_progress(job[0], stats['count'], stats['writes'], stats['start'], 'done')
+        returnValue(stats['count'])
+
+    @inlineCallbacks
+    def schedule_dialogue(self, dialogue):
+        dialogue_id = dialogue['dialogue-id']
+        query = {'enrolled.dialogue-id': dialogue_id, 'session-id': {'$ne': None}}
+        job = ('dialogue:%s' % dialogue_id, repr(dialogue['_id']))
+        stats = {'count': 0, 'writes': 0, 'start': time()}
+
+        def schedule(chunk):
+            participants = [participant for participant in
+                            self.participant_collection.get_participants(
+                                {'_id': {'$in': [item['_id'] for item in chunk]}})
+                            if participant is not None]
+            stats['writes'] += self.bulk_scheduler.schedule_batch(
+                participants, dialogue)
+            stats['count'] += len(participants)
+            self.log_progress(job[0], stats['count'], stats['writes'], stats['start'])
+
+        yield self.run_chunks(
+            self.participant_collection, query, ['_id'],
+            job, ['participants'], 'participants', schedule)
+        self.clear_progress(job[0])
+        self.log_progress(job[0], stats['count'], stats['writes'], stats['start'], 'done')
+        returnValue(stats['count'])
+
+    ## Same as DialogueWorker._schedule_participant on a chunk of participants
+    def schedule_participants(self, participant_ids, dialogues, unattacheds):
+        writes = 0
+        for dialogue in dialogues:
+            auto_enrollment = dialogue.get_auto_enrollment_as_query()
+            if auto_enrollment is not None:
+                self.participant_collection.enrolling_participants(
+                    {'$and': [auto_enrollment, {'_id': {'$in': participant_ids}}]},
+                    dialogue['dialogue-id'])
+        participants = [participant for participant in
+                        self.participant_collection.get_participants(
+                            {'_id': {'$in': participant_ids}})
+                        if participant is not None]
+        for dialogue in dialogues:
+            enrolled = [participant for participant in participants
+                        if participant.is_enrolled(dialogue['dialogue-id'])]
+            if enrolled != []:
+                writes += self.bulk_scheduler.schedule_batch(enrolled, dialogue)
+        for unattach in unattacheds:
+            selected, removed_phones = [], []
+            for participant in participants:
+                if unattach.is_selectable(participant):
+                    selected.append(participant)
+                else:
+                    removed_phones.append(participant['phone'])
+            writes += self.schedule_collection.save_unattach_schedules_bulk(
+                unattach, selected, removed_phones)
+        return writes
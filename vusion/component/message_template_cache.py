@@ -0,0 +1,105 @@
+# -*- test-case-name: vusion.component.tests.test_message_template_cache -*-
+import re
+from threading import Lock
+
+from vusion.utils import dynamic_content_notation_to_string
+
+DYNAMIC_CONTENT_REGEX = re.compile(r'\[(?P<domain>[^\.\]]+)\.(?P<key1>[^\.\]]+)(\.(?P<key2>[^\.\]]+))?(\.(?P<key3>[^\.\]]+))?(\.(?P<otherkey>[^\.\]]+))?\]')
+
+
+## Parse a message into a list of tokens (domain, text, match, keys), the
+## domain of the literal tokens is None. The notation having more than
+## 3 keys are never replaced so they are kept as literal.
+def compile_message(message):
+    tokens = []
+    position = 0
+    for found in DYNAMIC_CONTENT_REGEX.finditer(message):
+        text = found.group(0)
+        match = found.groupdict()
+        domain = match['domain']
+        keys = {k: match[k] for k in ('key1', 'key2', 'key3') if match[k] is not None}
+        if dynamic_content_notation_to_string(domain, keys) != text:
+            continue
+        if domain.lower() in ['participant', 'participants']:
+            domain = 'participant'
+        if found.start() > position:
+            tokens.append((None, message[position:found.start()], None, None))
+        tokens.append((domain, text, match, keys))
+        position = found.end()
+    if position < len(message):
+        tokens.append((None, message[position:], None, None))
+    return tokens
+
+
+## Cache of the compiled messages indexed by their content and of the
+## messages generated from the interaction templates indexed by
+## interaction id, template id and content. The generated messages and
+## the templates are cleared when the version, the dialogues reload
+## count, is changing.
+class MessageTemplateCache(object):
+
+    def __init__(self, max_size=5000):
+        self.max_size = max_size
+        self.compiled_messages = {}
+        self.generated_messages = {}
+        self.templates = {}
+        self.version = None
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, message):
+        tokens = self.compiled_messages.get(message, None)
+        if tokens is not None:
+            self.hits += 1
+            return tokens
+        self.misses += 1
+        tokens = compile_message(message)
+        with self.lock:
+            ## the messages can be user content, so the cache is bounded
+            if len(self.compiled_messages) >= self.max_size:
+                self.compiled_messages.clear()
+            self.compiled_messages[message] = tokens
+        return tokens
+
+    def check_version(self, version):
+        if self.version == version:
+            return
+        with self.lock:
+            self.generated_messages.clear()
+            self.templates.clear()
+            self.version = version
+
+    def get_template(self, template_id):
+        return self.templates.get(template_id, None)
+
+    def set_template(self, template_id, template):
+        with self.lock:
+            self.templates[template_id] = template
+
+    def get_generated_message(self, key):
+        return self.generated_messages.get(key, None)
+
+    def set_generated_message(self, key, message):
+        with self.lock:
+            if len(self.generated_messages) >= self.max_size:
+                self.generated_messages.clear()
+            self.generated_messages[key] = message
+
+    ## The generated messages depend on the program shortcode and templates
+    def clear_generated(self):
+        with self.lock:
+            self.generated_messages.clear()
+            self.templates.clear()
+
+    def clear(self):
+        with self.lock:
+            self.compiled_messages.clear()
+            self.generated_messages.clear()
+            self.templates.clear()
+
+    def get_stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'compiled': len(self.compiled_messages),
+                'generated': len(self.generated_messages)}
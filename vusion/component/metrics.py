@@ -0,0 +1,158 @@
+# -*- test-case-name: vusion.component.tests.test_metrics -*-
+import json
+from bisect import bisect_left
+from functools import wraps
+from threading import Lock
+from time import time
+
+from twisted.internet.defer import Deferred
+from twisted.web.resource import Resource
+
+
+## Histogram of durations in seconds on fixed buckets, the percentiles are
+## the upper bound of their bucket.
+class Histogram(object):
+
+    BOUNDS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+              0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration):
+        self.buckets[bisect_left(self.BOUNDS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def get_percentile(self, percentile):
+        if self.count == 0:
+            return None
+        rank = percentile * self.count
+        cumulated = 0
+        for index, bucket in enumerate(self.buckets):
+            cumulated += bucket
+            if cumulated >= rank:
+                break
+        if index == len(self.BOUNDS):
+            return self.max
+        return self.BOUNDS[index]
+
+    def get_stats(self):
+        to_ms = lambda seconds: (round(seconds * 1000, 3) if seconds is not None else None)
+        return {'sampled': self.count,
+                'mean-ms': to_ms(self.total / self.count if self.count > 0 else None),
+                'max-ms': to_ms(self.max),
+                'p50-ms': to_ms(self.get_percentile(0.5)),
+                'p95-ms': to_ms(self.get_percentile(0.95)),
+                'p99-ms': to_ms(self.get_percentile(0.99))}
+
+
+## Counts and timings of the hot paths of a worker aggregated in memory.
+## Every call is counted but only one in sample_interval is timed, the
+## timings of the deferred calls include the wait on the db thread pool.
+## The lock is required as the managers are called from the db threads.
+class Metrics(object):
+
+    def __init__(self, sample_interval=1):
+        self.sample_interval = max(sample_interval, 1)
+        self.started = time()
+        self.counts = {}
+        self.histograms = {}
+        self.lock = Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    ## Return the start time when the call is sampled, None otherwise
+    def start(self, name):
+        with self.lock:
+            calls = self.counts.get(name, 0) + 1
+            self.counts[name] = calls
+        if calls % self.sample_interval != 0:
+            return None
+        return time()
+
+    def stop(self, name, start):
+        if start is None:
+            return
+        duration = time() - start
+        with self.lock:
+            if not name in self.histograms:
+                self.histograms[name] = Histogram()
+            self.histograms[name].observe(duration)
+
+    def call(self, name, function, *args, **kwargs):
+        start = self.start(name)
+        if start is None:
+            return function(*args, **kwargs)
+        try:
+            result = function(*args, **kwargs)
+        except:
+            self.stop(name, start)
+            raise
+        if isinstance(result, Deferred):
+            def stop(result):
+                self.stop(name, start)
+                return result
+            return result.addBoth(stop)
+        self.stop(name, start)
+        return result
+
+    def get_stats(self):
+        with self.lock:
+            stats = {'uptime': round(time() - self.started, 3),
+                     'sample-interval': self.sample_interval,
+                     'metrics': {}}
+            for name, count in self.counts.iteritems():
+                metric = {'count': count}
+                if name in self.histograms:
+                    metric.update(self.histograms[name].get_stats())
+                stats['metrics'][name] = metric
+        return stats
+
+    def reset(self):
+        with self.lock:
+            self.started = time()
+            self.counts = {}
+            self.histograms = {}
+
+    def flush(self, redis, key, ttl=3600):
+        redis.setex(key, json.dumps(self.get_stats()), ttl)
+
+
+## Time the calls of a worker method with the worker's metrics, the name
+## can be computed from the arguments of the call
+def timed(name):
+    def decorator(method):
+        @wraps(method)
+        def timed_method(self, *args, **kwargs):
+            metrics = getattr(self, 'metrics', None)
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            metric_name = name(*args, **kwargs) if callable(name) else name
+            return metrics.call(metric_name, method, self, *args, **kwargs)
+        return timed_method
+    return decorator
+
+
+## JSON of the metrics of the workers, get_metrics return a dict of
+## name to Metrics
+class MetricsResource(Resource):
+
+    isLeaf = True
+
+    def __init__(self, get_metrics):
+        Resource.__init__(self)
+        self.get_metrics = get_metrics
+
+    def render_GET(self, request):
+        request.setHeader('Content-Type', 'application/json')
+        return json.dumps(dict(
+            (name, metrics.get_stats())
+            for name, metrics in self.get_metrics().iteritems()))
@@ -0,0 +1,162 @@
+# -*- test-case-name: vusion.component.tests.test_schedule_queue -*-
+from calendar import timegm
+from datetime import datetime
+
+from redis.exceptions import WatchError
+
+from vusion.utils import time_from_vusion_format
+
+
+## Queue of the due schedules of a program shared by several worker
+## processes, mirrored in a redis sorted set of the schedule ids scored
+## by their time. The schedules of a participant are leased together by
+## one worker at a time, so that they are sent in order; a lease which
+## is not released (worker crash) expires after lease_time seconds and
+## the remaining schedules are leased by another worker.
+## The schedules collection stay the reference: the queue only partition
+## the work between the workers which still claim the schedules in mongo.
+class RedisScheduleQueue(object):
+
+    QUEUE_KEY = 'schedule-queue'
+
+    def __init__(self, prefix_key, redis, lease_time=60, resync_interval=600):
+        self.prefix_key = prefix_key
+        self.redis = redis
+        self.lease_time = lease_time
+        self.resync_interval = resync_interval
+        self.leased = 0
+        self.acked = 0
+        self.lease_conflicts = 0
+
+    def queue_key(self):
+        return ':'.join([self.prefix_key, self.QUEUE_KEY])
+
+    def phones_key(self):
+        return ':'.join([self.queue_key(), 'phones'])
+
+    def lease_key(self, participant_phone):
+        return ':'.join([self.queue_key(), 'lease', participant_phone])
+
+    def resync_key(self):
+        return ':'.join([self.queue_key(), 'resync'])
+
+    def resync_queue_key(self):
+        return ':'.join([self.queue_key(), 'resyncing'])
+
+    def resync_phones_key(self):
+        return ':'.join([self.resync_queue_key(), 'phones'])
+
+    @staticmethod
+    def get_score(date_time):
+        if not isinstance(date_time, datetime):
+            date_time = time_from_vusion_format(date_time)
+        return timegm(date_time.timetuple())
+
+    def __len__(self):
+        return self.redis.zcard(self.queue_key())
+
+    def push(self, schedule_id, participant_phone, date_time):
+        self.push_many([(schedule_id, participant_phone, date_time)])
+
+    ## schedules is a list of tuple (schedule_id, participant_phone, date_time)
+    def push_many(self, schedules, queue_key=None, phones_key=None):
+        if schedules == []:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zadd(queue_key or self.queue_key(), **dict(
+            (str(schedule_id), self.get_score(date_time))
+            for schedule_id, participant_phone, date_time in schedules))
+        pipeline.hmset(phones_key or self.phones_key(), dict(
+            (str(schedule_id), participant_phone or '')
+            for schedule_id, participant_phone, date_time in schedules))
+        pipeline.execute()
+
+    ## Return the due schedule ids leased by the worker indexed by phone,
+    ## the participants leased by another worker are skipped.
+    def lease(self, worker_id, local_time, limit=100):
+        due = self.redis.zrangebyscore(
+            self.queue_key(), '-inf', '(%s' % self.get_score(local_time),
+            start=0, num=limit)
+        if due == []:
+            return {}
+        phones = self.redis.hmget(self.phones_key(), due)
+        due_by_phone = {}
+        for schedule_id, phone in zip(due, phones):
+            due_by_phone.setdefault(phone or '', []).append(schedule_id)
+        leased = {}
+        for phone, schedule_ids in due_by_phone.iteritems():
+            if self.redis.set(self.lease_key(phone), worker_id,
+                              nx=True, ex=self.lease_time):
+                leased[phone] = schedule_ids
+                self.leased += len(schedule_ids)
+            else:
+                self.lease_conflicts += 1
+        return leased
+
+    ## The schedules have been sent or removed
+    def ack(self, schedule_ids):
+        if schedule_ids == []:
+            return
+        schedule_ids = [str(schedule_id) for schedule_id in schedule_ids]
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.zrem(self.queue_key(), *schedule_ids)
+        pipeline.hdel(self.phones_key(), *schedule_ids)
+        pipeline.execute()
+        self.acked += len(schedule_ids)
+
+    ## The lease is only deleted if still owned by the worker, it might have
+    ## expired and been leased by another worker in the meantime
+    def release(self, worker_id, participant_phone):
+        lease_key = self.lease_key(participant_phone or '')
+        pipeline = self.redis.pipeline()
+        try:
+            pipeline.watch(lease_key)
+            if pipeline.get(lease_key) != worker_id:
+                return
+            pipeline.multi()
+            pipeline.delete(lease_key)
+            pipeline.execute()
+        except WatchError:
+            pass
+        finally:
+            pipeline.reset()
+
+    ## Only one worker at a time is mirroring the schedules collection
+    def acquire_resync(self, worker_id):
+        return self.redis.set(
+            self.resync_key(), worker_id, nx=True, ex=self.resync_interval)
+
+    ## Replace the queue by the schedules of the collection, the new queue
+    ## is built aside and renamed over the live one so that the workers
+    ## never see an empty queue
+    def resync(self, schedules):
+        resync_queue_key = self.resync_queue_key()
+        resync_phones_key = self.resync_phones_key()
+        self.redis.delete(resync_queue_key, resync_phones_key)
+        batch = []
+        count = 0
+        for schedule in schedules:
+            batch.append(schedule)
+            count += 1
+            if len(batch) >= 1000:
+                self.push_many(batch, resync_queue_key, resync_phones_key)
+                batch = []
+        self.push_many(batch, resync_queue_key, resync_phones_key)
+        pipeline = self.redis.pipeline()
+        if count == 0:
+            pipeline.delete(self.queue_key(), self.phones_key())
+        else:
+            pipeline.rename(resync_queue_key, self.queue_key())
+            pipeline.rename(resync_phones_key, self.phones_key())
+        pipeline.execute()
+
+    def clear(self):
+        self.redis.delete(
+            self.queue_key(), self.phones_key(), self.resync_key(),
+            self.resync_queue_key(), self.resync_phones_key())
+
+    def get_stats(self):
+        return {'size': len(self),
+                'leased': self.leased,
+                'acked': self.acked,
+                'lease-conflicts': self.lease_conflicts}
@@ -0,0 +1,60 @@
+# -*- test-case-name: vusion.component.tests.test_shard_ring -*-
+from bisect import bisect
+from hashlib import md5
+
+
+## Consistent hashing of the worker names over the shard processes of the
+## multiworker, each shard having replicas points on the ring. The placement
+## only depends on the name, so that the parent and the shards compute it
+## without exchanging it, and when the number of shards is changed only the
+## workers of the added or removed shards move. A pinned worker has its own
+## shard.
+class ShardRing(object):
+
+    def __init__(self, shard_names, pinned_workers=[], replicas=64):
+        self.replicas = replicas
+        self.pinned_workers = list(pinned_workers)
+        self.ring = []
+        self.loads = {}
+        for shard_name in shard_names:
+            for replica in range(self.replicas):
+                self.ring.append(
+                    (self.get_hash('%s:%s' % (shard_name, replica)), shard_name))
+            self.loads[shard_name] = set()
+        self.ring.sort()
+        self.points = [point for point, name in self.ring]
+        for worker_name in self.pinned_workers:
+            self.loads[self.get_pinned_shard(worker_name)] = set()
+
+    @staticmethod
+    def get_hash(key):
+        return long(md5(key).hexdigest()[:16], 16)
+
+    @staticmethod
+    def get_pinned_shard(worker_name):
+        return 'pinned-%s' % worker_name
+
+    def get_shard_names(self):
+        return sorted(self.loads.keys())
+
+    def get_shard(self, worker_name):
+        if worker_name in self.pinned_workers:
+            return self.get_pinned_shard(worker_name)
+        if self.ring == []:
+            return None
+        index = bisect(self.points, self.get_hash(worker_name)) % len(self.ring)
+        return self.ring[index][1]
+
+    def assign(self, worker_name):
+        shard_name = self.get_shard(worker_name)
+        self.loads[shard_name].add(worker_name)
+        return shard_name
+
+    def unassign(self, worker_name):
+        shard_name = self.get_shard(worker_name)
+        self.loads[shard_name].discard(worker_name)
+        return shard_name
+
+    def get_load(self):
+        return dict((shard_name, sorted(workers))
+                    for shard_name, workers in self.loads.iteritems())
@@ -36,4 +36,15 @@ class FlyingMessageTestCase(TestCase):
         saved_history_id, credit, status = self.fm.get_message_data('1')
         self.assertTrue(saved_history_id is None)
         self.assertTrue(credit == 0)
-        self.assertTrue(status is None)
\ No newline at end of file
+        self.assertTrue(status is None)
+
+    def test_append_get_messages(self):
+        history_ids = [ObjectId(), ObjectId()]
+        self.fm.append_messages_data([
+            ('1', history_ids[0], 3, 'ack'),
+            ('2', history_ids[1], 1, 'delivered')])
+        self.assertEqual(
+            [(history_ids[0], 3, 'ack'),
+             (None, 0, None),
+             (history_ids[1], 1, 'delivered')],
+            self.fm.get_messages_data(['1', '3', '2']))
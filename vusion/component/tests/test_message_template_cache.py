@@ -0,0 +1,63 @@
+from twisted.trial.unittest import TestCase
+
+from vusion.component import MessageTemplateCache, compile_message
+
+
+class MessageTemplateCacheTestCase(TestCase):
+
+    def test_compile_message(self):
+        tokens = compile_message(
+            'Hello [Participants.name], [contentVariable.mombasa.chicken.price] at [time.H:M]')
+        self.assertEqual(
+            [(domain, text) for domain, text, match, keys in tokens],
+            [(None, 'Hello '),
+             ('participant', '[Participants.name]'),
+             (None, ', '),
+             ('contentVariable', '[contentVariable.mombasa.chicken.price]'),
+             (None, ' at '),
+             ('time', '[time.H:M]')])
+        self.assertEqual(
+            tokens[3][3],
+            {'key1': 'mombasa', 'key2': 'chicken', 'key3': 'price'})
+
+    def test_compile_message_literal(self):
+        self.assertEqual(compile_message(''), [])
+        self.assertEqual(
+            compile_message('Hello [a.b.c.d.e] [not customized]'),
+            [(None, 'Hello [a.b.c.d.e] [not customized]', None, None)])
+
+    def test_compile_cache(self):
+        cache = MessageTemplateCache(max_size=2)
+        tokens = cache.compile('Hello [participant.name]')
+        self.assertIs(tokens, cache.compile('Hello [participant.name]'))
+        self.assertEqual(cache.get_stats()['hits'], 1)
+
+        cache.compile('Hello')
+        cache.compile('Bye')
+        self.assertEqual(cache.get_stats()['compiled'], 1)
+
+    def test_generated_message_version(self):
+        cache = MessageTemplateCache()
+        cache.check_version(1)
+        cache.set_template('1', {'template': 'QUESTION'})
+        cache.set_generated_message(('01-01', '1', 'How are you?'), 'How are you?')
+        cache.check_version(1)
+        self.assertEqual(
+            cache.get_generated_message(('01-01', '1', 'How are you?')),
+            'How are you?')
+
+        cache.check_version(2)
+        self.assertEqual(
+            cache.get_generated_message(('01-01', '1', 'How are you?')),
+            None)
+        self.assertEqual(cache.get_template('1'), None)
+
+    def test_clear_generated(self):
+        cache = MessageTemplateCache()
+        cache.compile('Hello [participant.name]')
+        cache.set_template('1', {'template': 'QUESTION'})
+        cache.set_generated_message(('01-01', '1', 'How are you?'), 'How are you?')
+        cache.clear_generated()
+        self.assertEqual(cache.get_template('1'), None)
+        self.assertEqual(cache.get_stats()['generated'], 0)
+        self.assertEqual(cache.get_stats()['compiled'], 1)
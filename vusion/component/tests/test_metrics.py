@@ -0,0 +1,99 @@
+import json
+
+from redis import Redis
+
+from twisted.trial.unittest import TestCase
+from twisted.internet.defer import Deferred
+
+from vusion.component import Metrics, MetricsResource, timed
+from vusion.component.metrics import Histogram
+
+
+class Worker(object):
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @timed('send')
+    def send(self, content):
+        return content
+
+    @timed(lambda action_type: 'run_action.%s' % action_type)
+    def run_action(self, action_type):
+        return action_type
+
+
+class MetricsTestCase(TestCase):
+
+    def setUp(self):
+        self.redis = Redis()
+        self.key = 'unittest:testprogram:metrics'
+
+    def tearDown(self):
+        self.redis.delete(self.key)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.get_percentile(0.5), None)
+        for duration in [0.0002] * 90 + [0.02] * 9 + [20]:
+            histogram.observe(duration)
+        self.assertEqual(histogram.get_percentile(0.5), 0.00025)
+        self.assertEqual(histogram.get_percentile(0.95), 0.025)
+        self.assertEqual(histogram.get_percentile(1), 20)
+        self.assertEqual(histogram.get_stats()['max-ms'], 20000)
+
+    def test_sampling(self):
+        metrics = Metrics(sample_interval=10)
+        for i in range(25):
+            metrics.call('query', lambda: None)
+        stats = metrics.get_stats()['metrics']['query']
+        self.assertEqual(stats['count'], 25)
+        self.assertEqual(stats['sampled'], 2)
+
+    def test_call_deferred(self):
+        metrics = Metrics()
+        d = Deferred()
+        result = metrics.call('consume', lambda: d)
+        self.assertFalse('consume' in metrics.histograms)
+        d.callback('ok')
+        self.assertEqual(self.successResultOf(result), 'ok')
+        self.assertEqual(metrics.histograms['consume'].count, 1)
+
+    def test_timed(self):
+        worker = Worker(Metrics())
+        self.assertEqual(worker.send('hello'), 'hello')
+        worker.run_action('feedback')
+        worker.run_action('feedback')
+        self.assertEqual(
+            dict((name, metric['count'])
+                 for name, metric in worker.metrics.get_stats()['metrics'].iteritems()),
+            {'send': 1, 'run_action.feedback': 2})
+
+        worker.metrics = None
+        self.assertEqual(worker.send('hello'), 'hello')
+
+    def test_flush(self):
+        metrics = Metrics()
+        metrics.count('message')
+        metrics.flush(self.redis, self.key)
+        self.assertEqual(
+            json.loads(self.redis.get(self.key))['metrics'],
+            {'message': {'count': 1}})
+
+    def test_resource(self):
+        metrics = Metrics()
+        metrics.count('message')
+        resource = MetricsResource(lambda: {'program1': metrics})
+        request = DummyRequest()
+        stats = json.loads(resource.render_GET(request))
+        self.assertEqual(stats['program1']['metrics']['message'], {'count': 1})
+        self.assertEqual(request.headers['Content-Type'], 'application/json')
+
+
+class DummyRequest(object):
+
+    def __init__(self):
+        self.headers = {}
+
+    def setHeader(self, name, value):
+        self.headers[name] = value
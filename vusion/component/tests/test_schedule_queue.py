@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from redis import Redis
+
+from twisted.trial.unittest import TestCase
+
+from vusion.component import RedisScheduleQueue
+
+
+class RedisScheduleQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.redis = Redis()
+        self.prefix_key = 'unittest:testprogram'
+        self.queue = RedisScheduleQueue(self.prefix_key, self.redis)
+        self.now = datetime(2014, 1, 1, 10, 0, 0)
+
+    def tearDown(self):
+        self.clearData()
+
+    def clearData(self):
+        keys = self.redis.keys("%s:*" % self.prefix_key)
+        for key in keys:
+            self.redis.delete(key)
+
+    def test_lease_due_by_phone(self):
+        ids = [str(ObjectId()) for i in range(4)]
+        self.queue.push_many([
+            (ids[0], '+1', self.now - timedelta(minutes=2)),
+            (ids[1], '+2', self.now - timedelta(minutes=1)),
+            (ids[2], '+1', '2014-01-01T09:59:30'),
+            (ids[3], '+1', self.now + timedelta(minutes=1))])
+        self.assertEqual(len(self.queue), 4)
+
+        leased = self.queue.lease('worker-1', self.now)
+        self.assertEqual(leased, {'+1': [ids[0], ids[2]], '+2': [ids[1]]})
+
+        ## the participants are leased to one worker at a time
+        self.assertEqual(self.queue.lease('worker-2', self.now), {})
+        self.assertEqual(self.queue.get_stats()['lease-conflicts'], 2)
+
+        self.queue.ack([ids[0], ids[2]])
+        self.queue.release('worker-1', '+1')
+        self.queue.release('worker-2', '+2')
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(
+            self.queue.lease('worker-2', self.now + timedelta(minutes=2)),
+            {'+1': [ids[3]]})
+
+    def test_push_reschedule(self):
+        schedule_id = ObjectId()
+        self.queue.push(schedule_id, '+1', self.now - timedelta(minutes=1))
+        self.queue.push(schedule_id, '+1', self.now + timedelta(minutes=1))
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(self.queue.lease('worker-1', self.now), {})
+
+    def test_resync(self):
+        self.queue.push(ObjectId(), '+1', self.now - timedelta(minutes=1))
+        self.assertTrue(self.queue.acquire_resync('worker-1'))
+        self.assertFalse(self.queue.acquire_resync('worker-2'))
+
+        schedule_id = str(ObjectId())
+        self.queue.resync([(schedule_id, None, self.now - timedelta(minutes=1))])
+        self.assertEqual(len(self.queue), 1)
+        self.assertEqual(
+            self.queue.lease('worker-1', self.now), {'': [schedule_id]})
+        self.assertFalse(self.redis.exists(self.queue.resync_queue_key()))
+
+        self.queue.resync([])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_release_leased_by_other_worker(self):
+        schedule_id = str(ObjectId())
+        self.queue.push(schedule_id, '+1', self.now - timedelta(minutes=1))
+        self.queue.lease('worker-1', self.now)
+        self.queue.release('worker-2', '+1')
+        self.assertEqual(self.queue.lease('worker-2', self.now), {})
+        self.queue.release('worker-1', '+1')
+        self.assertEqual(
+            self.queue.lease('worker-2', self.now), {'+1': [schedule_id]})
@@ -0,0 +1,44 @@
+from twisted.trial.unittest import TestCase
+
+from vusion.component import ShardRing
+
+
+class ShardRingTestCase(TestCase):
+
+    def setUp(self):
+        self.worker_names = ['program%s' % i for i in range(200)]
+
+    def test_get_shard(self):
+        ring = ShardRing(['shard0', 'shard1', 'shard2'])
+        other_ring = ShardRing(['shard2', 'shard1', 'shard0'])
+        for worker_name in self.worker_names:
+            self.assertEqual(
+                ring.get_shard(worker_name), other_ring.get_shard(worker_name))
+            ring.assign(worker_name)
+        ## the workers are spread on all the shards
+        for shard_name, workers in ring.get_load().iteritems():
+            self.assertTrue(len(workers) > 30)
+
+    def test_pinned_worker(self):
+        ring = ShardRing(['shard0', 'shard1'], ['program7'])
+        self.assertEqual(ring.get_shard('program7'), 'pinned-program7')
+        self.assertEqual(
+            ring.get_shard_names(), ['pinned-program7', 'shard0', 'shard1'])
+        ring.assign('program7')
+        ring.assign('program8')
+        load = ring.get_load()
+        self.assertEqual(load['pinned-program7'], ['program7'])
+        ring.unassign('program8')
+        self.assertEqual(
+            sum([len(workers) for workers in ring.get_load().itervalues()]), 1)
+
+    def test_change_shards(self):
+        ring = ShardRing(['shard0', 'shard1', 'shard2'])
+        before = dict((name, ring.get_shard(name)) for name in self.worker_names)
+
+        ring = ShardRing(['shard0', 'shard1', 'shard2', 'shard3'])
+        after = dict((name, ring.get_shard(name)) for name in self.worker_names)
+        moved = [name for name in self.worker_names if before[name] != after[name]]
+        ## only the workers placed on the new shard are moving
+        self.assertTrue(all(after[name] == 'shard3' for name in moved))
+        self.assertTrue(len(moved) < len(self.worker_names) / 2)
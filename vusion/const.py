@@ -6,3 +6,8 @@ LABEL_REGEX = re.compile('^[a-zA-Z0-9\s]+:[a-zA-Z0-9\s\.]+$')
 
 PLUS_REGEX = re.compile("^\+")
 ZEROS_REGEX = re.compile("^(0){1,2}")
+
+DATE_TIME_REGEX = re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+)(:0?(\d+))$')
+TIMESTAMP_REGEX = re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+):0?(\d+)$')
+DATE_REGEX = re.compile('^(\d{4})-0?(\d+)-0?(\d+)$')
+CODE_REGEX = re.compile('^(\+[0-9]*|[0-9]*\-[0-9]*)$')
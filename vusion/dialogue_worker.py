@@ -2,10 +2,14 @@
 import sys
 import traceback
 import re
+from time import time as now_seconds
 
-from twisted.internet.defer import inlineCallbacks, Deferred, returnValue
-from twisted.internet.threads import deferToThread
+from twisted.internet.defer import (
+    inlineCallbacks, Deferred, returnValue, DeferredSemaphore, DeferredList,
+    DeferredLock, succeed)
+from twisted.internet.threads import deferToThread, deferToThreadPool
 from twisted.internet import task, reactor
+from twisted.internet.task import deferLater
 
 from pymongo import MongoClient
 from bson.objectid import ObjectId
@@ -33,7 +37,9 @@ from vusion.error import (
 from vusion.message import DispatcherControl, WorkerControl, StatsWorkerControl
 from vusion.context import Context
 from vusion.component import (
-    DialogueWorkerPropertyHelper, CreditManager, RedisLogger)
+    DialogueWorkerPropertyHelper, CreditManager, RedisLogger,
+    BulkDialogueScheduler, MassScheduler, MessageTemplateCache,
+    RedisScheduleQueue, Metrics, timed)
 
 from vusion.persist.action import (
     Actions, action_generator, FeedbackAction, SmsMoAction, EnrollingAction, OptinAction,
@@ -42,11 +48,18 @@ from vusion.persist import (
     FeedbackSchedule, HistoryManager, ContentVariableManager, DialogueManager,
     RequestManager, ParticipantManager, ScheduleManager,
     ProgramCreditLogManager, ShortcodeManager, UnattachedMessageManager,
-    Interaction)
+    Interaction, set_db_thread_pool_size, get_db_thread_pool)
 
 from vusion.connectors import (
     ReceiveWorkerControlConnector, SendControlConnector)
 
+REGEX_QUESTION = re.compile('QUESTION')
+REGEX_ANSWERS = re.compile('ANSWERS')
+REGEX_ANSWER = re.compile('ANSWER')
+REGEX_SHORTCODE = re.compile('SHORTCODE')
+REGEX_KEYWORD = re.compile('KEYWORD')
+REGEX_BREAKLINE = re.compile('\\r\\n')
+
 
 class DialogueWorker(ApplicationWorker):
 
@@ -88,12 +101,20 @@ class DialogueWorker(ApplicationWorker):
 
         self.logger.startup(self.properties)
 
+        #Counts and sampled timings of the hot paths and of the queries,
+        #flushed in redis every metrics_flush_interval seconds, off by default
+        self.metrics = None
+        if bool(int(self.config.get('metrics', 0))):
+            self.metrics = Metrics(int(self.config.get('metrics_sample_interval', 10)))
+        self.metrics_flusher = task.LoopingCall(self.flush_metrics)
+
         #TODO replace by a loop
         for collection in ['history', 'dialogues', 'requests', 'participants', 
                            'content_variables', 'schedules', 'credit_logs',
                            'shortcodes', 'unattached_messages']:
             self.collections[collection].set_property_helper(self.properties)
             self.collections[collection].set_log_helper(self.logger)
+            self.collections[collection].set_metrics(self.metrics)
 
         self.credit_manager = CreditManager(
            self.r_key, self.r_server,
@@ -103,6 +124,107 @@ class DialogueWorker(ApplicationWorker):
            self.properties, 
            self.logger)
 
+        #Compiled messages and messages generated from the templates
+        self.message_templates = MessageTemplateCache(
+            int(self.config.get('message_template_cache_size', 5000)))
+
+        #Content variable cache, disabled when the size is 0
+        self.collections['content_variables'].set_cache(
+            int(self.config.get('content_variable_cache_size', 0)),
+            float(self.config.get('content_variable_cache_ttl', 60)),
+            bool(int(self.config.get('content_variable_cache_preload', 0))))
+
+        #Participant cache, disabled when the size is 0
+        self.collections['participants'].set_cache(
+            int(self.config.get('participant_cache_size', 0)),
+            float(self.config.get('participant_cache_ttl', 60)))
+
+        #History session cache, disabled when the size is 0
+        self.collections['history'].set_session_cache(
+            int(self.config.get('history_cache_size', 0)),
+            bool(int(self.config.get('history_cache_check', 0))))
+
+        #History write-behind buffer, disabled when the batch is 0
+        self.collections['history'].set_write_buffer(
+            int(self.config.get('history_buffer_batch', 0)),
+            int(self.config.get('history_buffer_max', 10000)))
+        self.history_flusher = task.LoopingCall(self.flush_history)
+        if self.collections['history'].write_buffer is not None:
+            self.history_flusher.start(
+                float(self.config.get('history_buffer_interval', 0.2)), now=False)
+
+        #Sender: claimed batch size, concurrent participants and messages/sec (0 is unlimited)
+        self.sender_batch_size = int(self.config.get('sender_batch_size', 500))
+        self.sender_window = int(self.config.get('sender_window', 10))
+        self.sender_rate = int(self.config.get('sender_rate', 0))
+        self.sender_next_slot = 0
+        self.is_sending = False
+
+        #The daemon wakes up at the next schedule time kept in memory, it is
+        #resynced from the database every schedule_timer_resync seconds
+        self.collections['schedules'].set_timer(
+            float(self.config.get('schedule_timer_resync', 60)))
+
+        #Several workers of a program share the due schedules through a redis
+        #queue, the schedules of a participant are leased to one worker at a time
+        self.schedule_queue = None
+        if bool(int(self.config.get('schedule_queue', 0))):
+            self.schedule_queue = RedisScheduleQueue(
+                self.r_key,
+                self.r_server,
+                int(self.config.get('schedule_queue_lease', 60)),
+                int(self.config.get('schedule_queue_resync', 600)))
+            self.collections['schedules'].set_queue(self.schedule_queue)
+
+        #Unattached messages to all or a selection of participants are sent as
+        #one broadcast schedule expanded by batch of participants at sending time
+        self.unattach_broadcast = bool(int(self.config.get('unattach_broadcast', 0)))
+        self.broadcast_batch_size = int(self.config.get(
+            'broadcast_batch_size', self.sender_batch_size))
+
+        #Credit log counters accumulated in memory, disabled when the interval is 0
+        self.credit_log_flusher = task.LoopingCall(self.flush_credit_logs)
+        credit_log_interval = float(self.config.get('credit_log_flush_interval', 0))
+        if credit_log_interval > 0:
+            self.collections['credit_logs'].set_accumulator(True)
+            self.credit_log_flusher.start(credit_log_interval, now=False)
+
+        #Delivery events are coalesced during event_window seconds (0 is disabled)
+        self.event_window = float(self.config.get('event_window', 0))
+        self.event_batch_size = int(self.config.get('event_batch_size', 1000))
+        self.events = []
+        self.event_flusher = None
+        self.event_lock = DeferredLock()
+
+        #Bounded pool of threads running the blocking database calls
+        set_db_thread_pool_size(int(self.config.get('db_thread_pool_size', 10)))
+
+        #Dialogues and requests are reloaded on control messages, the daemon
+        #can also poll their version stamp in case a control is lost
+        self.program_version_check = bool(int(self.config.get('program_version_check', 1)))
+
+        #The bulk engine is selected per program for large auto-enrollment
+        self.scheduling_engine = self.config.get('scheduling_engine', 'default')
+        self.bulk_scheduler = BulkDialogueScheduler(
+           self.collections['history'],
+           self.collections['schedules'],
+           self.properties,
+           self.logger,
+           int(self.config.get('scheduling_batch_size', 500)))
+        self.mass_scheduler = MassScheduler(
+           self.collections['participants'],
+           self.collections['schedules'],
+           self.bulk_scheduler,
+           self.r_key,
+           self.r_server,
+           self.logger,
+           int(self.config.get('mass_scheduling_chunk_size', 1000)),
+           get_db_thread_pool())
+
+        metrics_flush_interval = float(self.config.get('metrics_flush_interval', 60))
+        if self.metrics is not None and metrics_flush_interval > 0:
+            self.metrics_flusher.start(metrics_flush_interval, now=False)
+
         self.logger.log("Dialogue Worker is starting")
         yield self.setup_dc_connector(self.config['dispatcher_name'])
         yield self.setup_dc_connector('stats')
@@ -116,11 +238,51 @@ class DialogueWorker(ApplicationWorker):
             #TODO unregister from stats
 
     def teardown_application(self):
+        if self.history_flusher.running:
+            self.history_flusher.stop()
+        if self.event_flusher is not None and self.event_flusher.active():
+            self.event_flusher.cancel()
+        if self.credit_log_flusher.running:
+            self.credit_log_flusher.stop()
+        if self.metrics_flusher.running:
+            self.metrics_flusher.stop()
+        try:
+            events, self.events = self.events, []
+            if events != []:
+                self.process_events(events)
+            self.collections['credit_logs'].flush_counters()
+            self.collections['history'].flush_write_buffer()
+            if self.collections['history'].write_buffer is not None:
+                self.log("History buffer stats %r" % (
+                    self.collections['history'].write_buffer.get_stats(),))
+            self.log("Participant cache stats %r" % (
+                self.collections['participants'].get_cache_stats(),))
+            self.log("Schedule timer stats %r" % (
+                self.collections['schedules'].timer.get_stats(),))
+            if self.schedule_queue is not None:
+                self.log("Schedule queue stats %r" % (
+                    self.schedule_queue.get_stats(),))
+            self.flush_metrics()
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log(
+                "Error while flushing on teardown: %r" %
+                traceback.format_exception(exc_type, exc_value, exc_traceback))
         self.logger.stop()
         if (self.sender.active()):
             self.sender.cancel()
         self.log("Worker is stopped.")
 
+    @inlineCallbacks
+    def flush_history(self):
+        try:
+            yield self.collections['history'].deferred.flush_write_buffer()
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log(
+                "Error while flushing the history buffer: %r" %
+                traceback.format_exception(exc_type, exc_value, exc_traceback))
+
     def setup_connectors(self):
         d = super(DialogueWorker, self).setup_connectors()
 
@@ -202,6 +364,8 @@ class DialogueWorker(ApplicationWorker):
             self.log("Control message received to %r" % (message,))
             message = WorkerControl(**message.payload)
             if message['action'] == 'reload_program_settings':
+                ## the templates might have been edited
+                self.message_templates.clear_generated()
                 self.load_properties()
                 return
             if (not self.is_ready()):
@@ -250,17 +414,75 @@ class DialogueWorker(ApplicationWorker):
 
     def dispatch_event(self, message):
         self.log("Event message received %s" % (message,))
+        if self.event_window > 0:
+            self.events.append(message)
+            if len(self.events) >= self.event_batch_size:
+                return self.flush_events()
+            if self.event_flusher is None or not self.event_flusher.active():
+                self.event_flusher = reactor.callLater(
+                    self.event_window, self.flush_events)
+            return
         new_status, old_status, credits = self.collections['history'].update_status_from_event(message)
         if new_status is None:
             return
         self.collections['credit_logs'].increment_event_counter(old_status, new_status, credits)
 
+    @inlineCallbacks
+    def flush_credit_logs(self):
+        try:
+            yield self.collections['credit_logs'].deferred.flush_counters()
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log(
+                "Error while flushing the credit logs: %r" %
+                traceback.format_exception(exc_type, exc_value, exc_traceback))
+
+    def flush_metrics(self):
+        if self.metrics is None:
+            return
+        try:
+            self.metrics.flush(self.r_server, '%s:metrics' % self.r_key)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log(
+                "Error while flushing the metrics: %r" %
+                traceback.format_exception(exc_type, exc_value, exc_traceback))
+
+    ## The flushes are run one at a time to keep the events order
+    @inlineCallbacks
+    def flush_events(self):
+        if self.event_flusher is not None and self.event_flusher.active():
+            self.event_flusher.cancel()
+        yield self.event_lock.acquire()
+        try:
+            events, self.events = self.events, []
+            if events != []:
+                yield deferToThreadPool(
+                    reactor, get_db_thread_pool(), self.process_events, events)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log(
+                "Error while processing events: %r" %
+                traceback.format_exception(exc_type, exc_value, exc_traceback))
+        finally:
+            self.event_lock.release()
+
+    def process_events(self, events):
+        results = self.collections['history'].update_status_from_events(events)
+        self.collections['credit_logs'].increment_event_counters(
+            [(old_status, new_status, credits)
+             for new_status, old_status, credits in results
+             if new_status is not None])
+        self.log("Events processed: %s" % len(events))
+
+    @timed(lambda participant_phone, action, *args, **kwargs: 'run_action.%s' % action.get_type())
     @inlineCallbacks
     def run_action(self, participant_phone, action, context=Context(),
                    participant_session_id=None):
         if action.has_condition():
             query = action.get_condition_mongodb_for(participant_phone, participant_session_id)
-            if not self.collections['participants'].is_matching(query):
+            is_matching = yield self.collections['participants'].deferred.is_matching(query)
+            if not is_matching:
                 self.log(("Participant %s doesn't satify the condition for action for %s" % (participant_phone, action,)))
                 return
         self.log(("Run action for %s action %s context %s" % (participant_phone, action, context)))
@@ -270,14 +492,14 @@ class DialogueWorker(ApplicationWorker):
             else:
                 ## The participant is still optin and opting in again
                 if self.properties['double-optin-error-feedback'] is not None:
-                    self.run_action(
+                    yield self.run_action(
                         participant_phone, 
                         FeedbackAction(**{'content': self.properties['double-optin-error-feedback']}),
                         context,
                         participant_session_id)
         elif (action.get_type() == 'optout'):
-            self.collections['participants'].opting_out(participant_phone)
-            self.collections['schedules'].remove_participant_schedules(participant_phone)
+            yield self.collections['participants'].deferred.opting_out(participant_phone)
+            yield self.collections['schedules'].deferred.remove_participant_schedules(participant_phone)
         elif (action.get_type() == 'feedback'):
             schedule = FeedbackSchedule(**{
                 'participant-phone': participant_phone,
@@ -285,7 +507,7 @@ class DialogueWorker(ApplicationWorker):
                 'date-time': time_to_vusion_format(self.get_local_time()),
                 'content': self.customize_message(action['content'], participant_phone, context, False),
                 'context': context.get_dict_for_history()})
-            self.send_schedule(schedule)
+            yield self.send_schedule(schedule)
         elif (action.get_type() == 'sms-mo'):
             schedule = FeedbackSchedule(**{
                 'mo-sms': True,
@@ -295,7 +517,7 @@ class DialogueWorker(ApplicationWorker):
                 'content': self.customize_message(action['mo-content'], participant_phone, context, False),
                 'context': context.get_dict_for_history()
             })
-            self.send_schedule(schedule)
+            yield self.send_schedule(schedule)
         elif (action.get_type() == 'unmatching-answer'):
             setting = self.collections['program_settings'].find_one({
                 'key': 'default-template-unmatching-answer'})
@@ -315,13 +537,13 @@ class DialogueWorker(ApplicationWorker):
                 'date-time': time_to_vusion_format(self.get_local_time()),
                 'content': error_message,
                 'context': context.get_dict_for_history()})
-            self.send_schedule(schedule)
+            yield self.send_schedule(schedule)
         elif (action.get_type() == 'tagging'):
-            self.collections['participants'].tagging(participant_phone, action['tag'])
+            yield self.collections['participants'].deferred.tagging(participant_phone, action['tag'])
             yield self.schedule_participant(participant_phone)
         elif (action.get_type() == 'enrolling'):
             if not self.collections['participants'].is_optin(participant_phone):
-                self.run_action(
+                yield self.run_action(
                     participant_phone, 
                     OptinAction(), 
                     context, 
@@ -367,8 +589,8 @@ class DialogueWorker(ApplicationWorker):
             participant = self.collections['participants'].get_participant(participant_phone)
             participant_labels = participant['profile']
             participant_tags = participant['tags']
-            self.run_action(participant_phone, OptoutAction())
-            self.run_action(participant_phone, OptinAction())
+            yield self.run_action(participant_phone, OptoutAction())
+            yield self.run_action(participant_phone, OptinAction())
             labels = action.get_keep_labels(participant['profile'])
             tags = action.get_keep_tags(participant['tags'])
             for tag in tags:
@@ -420,7 +642,7 @@ class DialogueWorker(ApplicationWorker):
         for tag in action.get_tags():
             count = yield self.collections['participants'].count_tag_async(tag)
             action.set_tag_count(tag, count)
-        self.run_action(participant_phone, action.get_tagging_action())
+        yield self.run_action(participant_phone, action.get_tagging_action())
 
     @inlineCallbacks
     def run_action_proportional_labelling(self, participant_phone, action, context=None):
@@ -429,7 +651,7 @@ class DialogueWorker(ApplicationWorker):
         for label in action.get_labels():
             count = yield self.collections['participants'].count_label_async(label)
             action.set_count(label['value'], count)
-        self.run_action(participant_phone, action.get_labelling_action())
+        yield self.run_action(participant_phone, action.get_labelling_action())
 
     @inlineCallbacks
     def run_action_sms_forwarding(self, participant_phone, action, context):
@@ -510,10 +732,13 @@ class DialogueWorker(ApplicationWorker):
         self.collections['content_variables'].save_content_variable(
             match, value, action.get_table_id())
 
+    @timed('consume_user_message')
     @inlineCallbacks
     def consume_user_message(self, message):
         self.log("User message received from %s '%s'" % (message['from_addr'],
                                                          message['content']))
+        ## the participant is loaded once for the handling of the message
+        self.collections['participants'].open_scope(message['from_addr'])
         try:
             history = {'object-type': 'unmatching-history'}
             context = Context(message)
@@ -528,10 +753,13 @@ class DialogueWorker(ApplicationWorker):
                 if context.is_matching():
                     history = {'object-type': 'dialogue-history'}
             # High priority to run an optin or enrolling action to get sessionId 
-            if (not self.collections['participants'].is_optin(message['from_addr']) 
-                    and (actions.contains('optin') or actions.contains('enrolling'))):
-                yield self.run_action(message['from_addr'], actions.get_priority_action(), context)
-            participant = self.collections['participants'].get_participant(message['from_addr'], only_optin=True)
+            if (actions.contains('optin') or actions.contains('enrolling')):
+                is_optin = yield self.collections['participants'].deferred.is_optin(
+                    message['from_addr'])
+                if not is_optin:
+                    yield self.run_action(message['from_addr'], actions.get_priority_action(), context)
+            participant = yield self.collections['participants'].deferred.get_participant(
+                message['from_addr'], only_optin=True)
             message_credits = self.properties.use_credits(message['content'])
             history.update({
                 'participant-phone': message['from_addr'],
@@ -540,21 +768,24 @@ class DialogueWorker(ApplicationWorker):
                 'message-direction': 'incoming',
                 'message-credits': message_credits})
             history.update(context.get_dict_for_history())
-            history_id = self.save_history(**history)
+            history_id = yield self.collections['history'].deferred.save_history(**history)
             context['history_id'] = str(history_id)
             self.credit_manager.received_message(message_credits, participant)
-            self.collections['participants'].save_transport_metadata(
+            yield self.collections['participants'].deferred.save_transport_metadata(
                 message['from_addr'], message['transport_metadata'])
             if (context.is_matching() and participant is not None):
                 if ('interaction' in context):
-                    if self.collections['history'].has_oneway_marker(
+                    has_oneway_marker = yield self.collections['history'].deferred.has_oneway_marker(
                         participant['phone'], participant['session-id'],
-                        context['dialogue-id'], context['interaction-id']):
+                        context['dialogue-id'], context['interaction-id'])
+                    if has_oneway_marker:
                         actions.clear_all()
                     else:
                         self.get_program_actions(participant, context, actions)
-                        if self.collections['history'].participant_has_max_unmatching_answers(participant, context['dialogue-id'], context['interaction']):
-                            self.collections['history'].add_oneway_marker(
+                        has_max_unmatching_answers = yield self.collections['history'].deferred.participant_has_max_unmatching_answers(
+                            participant, context['dialogue-id'], context['interaction'])
+                        if has_max_unmatching_answers:
+                            yield self.collections['history'].deferred.add_oneway_marker(
                                 participant['phone'], participant['session-id'], context)
                             context['interaction'].get_max_unmatching_action(context['dialogue-id'], actions)
                 elif ('request-id' in context):
@@ -566,6 +797,8 @@ class DialogueWorker(ApplicationWorker):
             self.log(
                 "Error during consume user message: %r" %
                 traceback.format_exception(exc_type, exc_value, exc_traceback))
+        finally:
+            self.collections['participants'].close_scope(message['from_addr'])
 
     @inlineCallbacks
     def run_actions(self, participant, context, actions):
@@ -593,20 +826,48 @@ class DialogueWorker(ApplicationWorker):
             if self.properties['double-matching-answer-feedback'] is not None:
                 actions.append(FeedbackAction(**{'content': self.properties['double-matching-answer-feedback']}))
 
+    @inlineCallbacks
     def daemon_process(self):
         self.load_properties()
+        next_iteration = None
         if self.is_ready():
             self.credit_manager.check_status()
-            self.send_scheduled()
-        next_iteration = self.get_time_next_daemon_iteration()
+            if self.program_version_check:
+                self.check_program_version()
+            ## the due times are only dropped by the call actually sending
+            if not self.is_sending:
+                local_time = self.get_local_time()
+                claimed = yield self.send_scheduled()
+                self.collections['schedules'].timer.pop_due(local_time, claimed)
+                ## more schedules are due, no need to wait
+                if claimed >= self.sender_batch_size:
+                    next_iteration = 0
+        if next_iteration is None:
+            next_iteration = self.get_time_next_daemon_iteration()
         if not self.sender.active():
             self.sender = reactor.callLater(
                 next_iteration,
                 self.daemon_process)
 
+    def check_program_version(self):
+        try:
+            is_reloaded = self.collections['dialogues'].check_version()
+            is_reloaded = self.collections['requests'].check_version() or is_reloaded
+            if is_reloaded:
+                self.register_keywords_in_dispatcher()
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log(
+                "Error while checking program version: %r" %
+                traceback.format_exception(exc_type, exc_value, exc_traceback))
+
+    ## The next schedule time is kept in memory by the schedule timer,
+    ## the schedules are only queried on its periodic resync.
     def get_time_next_daemon_iteration(self):
         try:
-            schedule_time = self.collections['schedules'].get_next_schedule_time()
+            schedule_time = self.collections['schedules'].get_timer_next_time()
+            if schedule_time is None:
+                return 60
             delta = schedule_time - self.get_local_time()
             if delta < timedelta():
                 return 1
@@ -619,6 +880,10 @@ class DialogueWorker(ApplicationWorker):
 
     def update_time_next_daemon_iteration(self):
         secondsLater = self.get_time_next_daemon_iteration()
+        ## the daemon is already waking up before
+        if (self.sender is not None and self.sender.active()
+                and self.sender.getTime() - reactor.seconds() <= secondsLater):
+            return
         if secondsLater != 60:
             self.log("reschedule daemon in %s" % secondsLater)
             if self.sender.active():
@@ -639,9 +904,15 @@ class DialogueWorker(ApplicationWorker):
                 'credit-from-date': self.credit_manager.set_limit,
                 'credit-to-date': self.credit_manager.set_limit,
                 'timezone': [self.logger.clear_logs,
-                             self.register_on_stats]}
+                             self.register_on_stats],
+                ## the generated messages depend on the shortcode and templates
+                'shortcode': self.message_templates.clear_generated,
+                'default-template-closed-question': self.message_templates.clear_generated,
+                'default-template-open-question': self.message_templates.clear_generated}
             if is_needed_register_keywords == True:
-                callbacks.update({'shortcode': self.register_keywords_in_dispatcher})
+                callbacks.update({'shortcode': [
+                    self.message_templates.clear_generated,
+                    self.register_keywords_in_dispatcher]})
             self.properties.load(callbacks)
         except MissingProperty as e:
             self.log("Missing Mandatory Property: %s" % e.message)
@@ -660,6 +931,14 @@ class DialogueWorker(ApplicationWorker):
 
     @inlineCallbacks
     def schedule_mass_tag(self, tag, query):
+        if self.scheduling_engine == 'bulk':
+            yield self.mass_scheduler.schedule_mass_tag(
+                tag, query,
+                list(self.collections['dialogues'].get_active_dialogues()),
+                [unattached for unattached in
+                 self.collections['unattached_messages'].get_unattached_messages()
+                 if unattached is not None and not self.is_broadcast(unattached)])
+            return
         participants = self.collections['participants'].get_participants(query)
         for participant in participants:
             yield self._schedule_participant(participant)
@@ -686,20 +965,34 @@ class DialogueWorker(ApplicationWorker):
         ## schedule unattach messages
         unattacheds = self.collections['unattached_messages'].get_unattached_messages()
         for unattached in unattacheds:
+            ## the broadcast selects the participants at sending time
+            if self.is_broadcast(unattached):
+                continue
             yield self.collections['schedules'].unattach_schedule(
                 participant, unattached)
 
+    def is_broadcast(self, unattach):
+        return self.unattach_broadcast and unattach['send-to-type'] != 'phone'
+
     ## Scheduling of unattach messages
     @inlineCallbacks
     def schedule_unattach(self, unattach_id):
-        #clear all schedule
-        self.collections['schedules'].remove_unattach(unattach_id)
+        self.credit_manager.clear_broadcast_count(unattach_id)
         unattach = self.collections['unattached_messages'].get_unattached_message(unattach_id)
+        if unattach is None or self.scheduling_engine != 'bulk':
+            #clear all schedule
+            self.collections['schedules'].remove_unattach(unattach_id)
         if unattach is None:
             return
+        if self.is_broadcast(unattach):
+            self.collections['schedules'].save_broadcast_schedule(unattach)
+            return
         selectors = unattach.get_selector_as_query()
         query = {'session-id': {'$ne': None}}
         query.update(selectors)
+        if self.scheduling_engine == 'bulk':
+            yield self.mass_scheduler.schedule_unattach(unattach, query)
+            return
         participants = self.collections['participants'].get_participants(query)
         yield self.schedule_participants_unattach(participants, unattach)
 
@@ -719,7 +1012,11 @@ class DialogueWorker(ApplicationWorker):
         #enroll if they are not already enrolled in auto-enrollment
         query = dialogue.get_auto_enrollment_as_query()
         if query is not None:
-            self.collections['participants'].enrolling_participants(query, dialogue_id)
+            yield self.collections['participants'].deferred.enrolling_participants(
+                query, dialogue_id)
+        if self.scheduling_engine == 'bulk':
+            yield self.mass_scheduler.schedule_dialogue(dialogue)
+            return
         participants = self.collections['participants'].get_participants(
             {'enrolled.dialogue-id': dialogue_id,
              'session-id': {'$ne': None}})
@@ -763,25 +1060,15 @@ class DialogueWorker(ApplicationWorker):
                     continue
 
                 ##Compute the sending date time for the interaction
-                if (interaction['type-schedule'] == 'offset-days'):
-                    enrolled_time = participant.get_enrolled_time(dialogue['dialogue-id'])
-                    sending_date_time = get_offset_date_time(
-                        time_from_vusion_format(enrolled_time),
-                        interaction['days'],
-                        interaction['at-time'])
-                elif (interaction['type-schedule'] == 'offset-time'):
-                    enrolled_time = participant.get_enrolled_time(dialogue['dialogue-id'])
-                    sending_date_time = time_from_vusion_format(enrolled_time) + interaction.get_offset_time_delta()
-                elif (interaction['type-schedule'] == 'fixed-time'):
-                    sending_date_time = time_from_vusion_format(interaction['date-time'])
-                elif (interaction['type-schedule'] == 'offset-condition'):
+                if (interaction['type-schedule'] == 'offset-condition'):
                     previous = self.collections['history'].get_history_of_offset_condition_answer(
                         participant,
                         dialogue["dialogue-id"],
                         interaction["offset-condition-interaction-id"])
                     if  previous is None:
                         continue
-                    sending_date_time = self.get_local_time() + timedelta(minutes=int(interaction['offset-condition-delay']))
+                sending_date_time = interaction.get_sending_date_time(
+                    participant, dialogue['dialogue-id'], self.get_local_time())
 
                 ##Retrived a schedule associate with the interaction
                 schedule = self.collections['schedules'].get_participant_interaction(
@@ -856,7 +1143,7 @@ class DialogueWorker(ApplicationWorker):
         except:
             return datetime.utcnow()
 
-    def from_schedule_to_message(self, schedule):
+    def from_schedule_to_message(self, schedule, unattached_messages={}):
         if schedule.get_type() in ['dialogue-schedule', 'reminder-schedule', 'deadline-schedule']:
             interaction = self.collections['dialogues'].get_dialogue_interaction(
                 schedule['dialogue-id'], schedule['interaction-id'])
@@ -864,8 +1151,11 @@ class DialogueWorker(ApplicationWorker):
                 'dialogue-id': schedule['dialogue-id'],
                 'interaction-id': schedule['interaction-id']})
         elif schedule.get_type() == 'unattach-schedule':
-            interaction = self.collections['unattached_messages'].find_one(
-                {'_id': ObjectId(schedule['unattach-id'])})
+            if schedule['unattach-id'] in unattached_messages:
+                interaction = unattached_messages[schedule['unattach-id']]
+            else:
+                interaction = self.collections['unattached_messages'].find_one(
+                    {'_id': ObjectId(schedule['unattach-id'])})
             context = Context(**{
                 'unattach-id': schedule['unattach-id']})
         elif schedule.get_type() == 'feedback-schedule':
@@ -881,19 +1171,198 @@ class DialogueWorker(ApplicationWorker):
 
     #TODO: fire error feedback if the dialogue do not exit anymore
     #TODO fire action scheduled by reminder if no reply is sent for any reminder
+    @timed('send_scheduled')
     @inlineCallbacks
     def send_scheduled(self):
+        if self.is_sending:
+            returnValue(0)
+        self.is_sending = True
+        claimed = 0
+        leased = None
         try:
             self.log('Checking the schedule list...')
-            due_schedules = self.collections['schedules'].get_due_schedules()
+            claim_id = str(ObjectId())
+            if self.schedule_queue is not None:
+                leased = yield self.lease_queued_schedules(claim_id)
+                due_schedules = self.collections['schedules'].claim_schedules(
+                    claim_id, [ObjectId(schedule_id)
+                               for schedule_ids in leased.itervalues()
+                               for schedule_id in schedule_ids])
+            else:
+                due_schedules = self.collections['schedules'].claim_due_schedules(
+                    claim_id, self.sender_batch_size)
+            claimed = len(due_schedules)
+
+            ## Schedules of a participant are sent in order one after the other
+            participant_schedules = {}
+            phones = []
+            broadcasts = []
             for due_schedule in due_schedules:
-                self.collections['schedules'].remove_schedule(due_schedule)
-                yield self.send_schedule(due_schedule)
+                if due_schedule.get_type() == 'broadcast-schedule':
+                    broadcasts.append(due_schedule)
+                    continue
+                phone = due_schedule['participant-phone']
+                if not phone in participant_schedules:
+                    phones.append(phone)
+                    participant_schedules[phone] = []
+                participant_schedules[phone].append(due_schedule)
+
+            participants = {}
+            for participant in self.collections['participants'].get_participants(
+                    {'phone': {'$in': phones}}):
+                if participant is not None:
+                    participants[participant['phone']] = participant
+            if self.collections['history'].session_cache is not None:
+                self.collections['history'].warm_session_cache(
+                    [(p['phone'], p['session-id']) for p in participants.itervalues()])
+            unattached_messages = {}
+            unattach_ids = [ObjectId(s['unattach-id']) for s in due_schedules
+                            if s.get_type() in ['unattach-schedule', 'broadcast-schedule']]
+            if unattach_ids != []:
+                for unattached_message in self.collections['unattached_messages'].find(
+                        {'_id': {'$in': unattach_ids}}):
+                    unattached_messages[str(unattached_message['_id'])] = unattached_message
+
+            start = now_seconds()
+            semaphore = DeferredSemaphore(self.sender_window)
+            yield DeferredList([
+                semaphore.run(
+                    self.send_participant_schedules,
+                    participant_schedules[phone],
+                    claim_id,
+                    participants.get(phone),
+                    unattached_messages)
+                for phone in phones], consumeErrors=True)
+            for broadcast in broadcasts:
+                sent = yield self.send_broadcast(
+                    broadcast, claim_id, unattached_messages)
+                claimed += sent
+            duration = now_seconds() - start
+            if claimed > 0:
+                self.log("Sender batch of %s schedules done in %.3fs (%.0f msg/s)" % (
+                    claimed, duration, claimed / duration if duration > 0 else claimed))
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             self.log("Error send_scheduled: %r" %
-                     traceback.format_exception(exc_type, exc_value, exc_traceback))     
+                     traceback.format_exception(exc_type, exc_value, exc_traceback))
+        finally:
+            if leased is not None:
+                self.release_queued_schedules(claim_id, leased)
+            self.is_sending = False
+        returnValue(claimed)
+
+    @inlineCallbacks
+    def lease_queued_schedules(self, claim_id):
+        if self.schedule_queue.acquire_resync(claim_id):
+            self.log("Resync the schedule queue")
+            yield self.collections['schedules'].deferred.resync_queue()
+        returnValue(self.schedule_queue.lease(
+            claim_id, self.get_local_time(), self.sender_batch_size))
+
+    def release_queued_schedules(self, claim_id, leased):
+        try:
+            self.collections['schedules'].ack_queued_schedules(
+                [ObjectId(schedule_id)
+                 for schedule_ids in leased.itervalues()
+                 for schedule_id in schedule_ids])
+        finally:
+            for phone in leased.iterkeys():
+                self.schedule_queue.release(claim_id, phone)
+
+    @inlineCallbacks
+    def send_participant_schedules(self, schedules, claim_id, participant,
+                                   unattached_messages):
+        for schedule in schedules:
+            ## The schedule might have been removed by a previous action
+            if not self.collections['schedules'].remove_claimed_schedule(
+                    schedule, claim_id):
+                continue
+            try:
+                yield self.wait_sending_slot()
+                yield self.send_schedule(schedule, participant, unattached_messages)
+            except:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                self.log("Error send_scheduled: %r" %
+                         traceback.format_exception(exc_type, exc_value, exc_traceback))
+            ## Previous schedules might have modified the participant
+            participant = None
+
+    ## Send the next batch of participants of a broadcast, as for the other
+    ## schedules the progress is saved before sending the messages.
+    @inlineCallbacks
+    def send_broadcast(self, schedule, claim_id, unattached_messages):
+        schedules = self.collections['schedules']
+        unattach = self.collections['unattached_messages'].get_unattached_message(
+            schedule['unattach-id'])
+        if unattach is None:
+            schedules.remove_claimed_schedule(schedule, claim_id)
+            self.credit_manager.clear_broadcast_count(schedule['unattach-id'])
+            returnValue(0)
+        query = {'session-id': {'$ne': None}}
+        query.update(unattach.get_selector_as_query())
+
+        ## the credits are estimated once for all the participants
+        if not schedule.is_started():
+            schedule['participant-count'] = self.collections['participants'].find(
+                query).count()
+            self.credit_manager.set_broadcast_count(
+                schedule['unattach-id'], schedule['participant-count'])
+        conditions = query
+        if schedule['last-participant-id'] is not None:
+            conditions = {'$and': [
+                query, {'_id': {'$gt': schedule['last-participant-id']}}]}
+        participants = [participant for participant in
+                        self.collections['participants'].get_participants(
+                            conditions, sort=[('_id', 1)],
+                            limit=self.broadcast_batch_size)
+                        if participant is not None]
+
+        if len(participants) < self.broadcast_batch_size:
+            is_claimed = schedules.remove_claimed_schedule(schedule, claim_id)
+            self.credit_manager.clear_broadcast_count(schedule['unattach-id'])
+            self.log("Broadcast of unattached message %s done to %s participants" % (
+                schedule['unattach-id'], schedule['participant-count']))
+        else:
+            schedule['last-participant-id'] = participants[-1]['_id']
+            is_claimed = schedules.release_broadcast_schedule(schedule, claim_id)
+        ## The broadcast has been rescheduled in the meantime
+        if not is_claimed:
+            returnValue(0)
+
+        semaphore = DeferredSemaphore(self.sender_window)
+        yield DeferredList([
+            semaphore.run(
+                self.send_broadcast_participant,
+                schedule,
+                participant,
+                unattached_messages)
+            for participant in participants], consumeErrors=True)
+        returnValue(len(participants))
+
+    @inlineCallbacks
+    def send_broadcast_participant(self, schedule, participant, unattached_messages):
+        try:
+            yield self.wait_sending_slot()
+            yield self.send_schedule(
+                schedule.generate_unattach_schedule(participant),
+                participant,
+                unattached_messages)
+        except:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            self.log("Error send_broadcast: %r" %
+                     traceback.format_exception(exc_type, exc_value, exc_traceback))
+
+    def wait_sending_slot(self):
+        if self.sender_rate <= 0:
+            return succeed(None)
+        now = now_seconds()
+        slot = max(now, self.sender_next_slot)
+        self.sender_next_slot = slot + 1.0 / self.sender_rate
+        if slot <= now:
+            return succeed(None)
+        return deferLater(reactor, slot - now, lambda: None)
 
+    @inlineCallbacks
     def run_deadline(self, schedule, interaction, context):
         actions = Actions()
         if interaction.has_reminder():
@@ -904,26 +1373,27 @@ class DialogueWorker(ApplicationWorker):
                 schedule['participant-session-id'],
                 context.get_dict_for_history())
         for action in actions.items():
-            self.run_action(
+            yield self.run_action(
                 schedule['participant-phone'],
                 action,
                 context,
                 schedule['participant-session-id'])
 
+    @inlineCallbacks
     def run_schedule_action(self, schedule):
         local_time = self.get_local_time()
         action = action_generator(**schedule['action'])
         if schedule.is_expired(local_time):
             self.collections['history'].add_datepassed_action_marker(action, schedule)
             return
-        self.run_action(
+        yield self.run_action(
             schedule['participant-phone'], 
             action,
             schedule.get_context(),
             schedule['participant-session-id'])
 
     @inlineCallbacks
-    def send_message(self, schedule, interaction, context):
+    def send_message(self, schedule, interaction, context, participant=None):
         ## Reaching this line can only be message to be send
         message_content = self.generate_message(interaction)
         message_content = self.customize_message(
@@ -951,7 +1421,9 @@ class DialogueWorker(ApplicationWorker):
 
         ## Necessary for some transport that require tocken to be reuse for MT message
         #TODO only fetch when participant has transport metadata...
-        participant = self.collections['participants'].get_participant(schedule['participant-phone'])
+        if participant is None:
+            participant = yield self.collections['participants'].deferred.get_participant(
+                schedule['participant-phone'])
         if (participant['transport_metadata'] is not {}):
             options['transport_metadata'].update(participant['transport_metadata'])
 
@@ -970,41 +1442,46 @@ class DialogueWorker(ApplicationWorker):
                 transport_metadata = {},
                 helper_metadata = ''
                 )
-            self.consume_user_message(msg)
+            yield self.consume_user_message(msg)
             #self.dispatch_user_message(msg)
             return
 
         ## message for simulated participant are not actually send
         if participant.is_simulated():
-            self.collections['history'].add_outgoing_simulated(
+            yield self.collections['history'].deferred.add_outgoing_simulated(
                 schedule['participant-phone'], message_content, context, schedule)
             return
 
         message_credits = self.properties.use_credits(message_content)
         if self.credit_manager.is_allowed(message_credits, participant, schedule):
-            message = yield self.send_to(
+            ## the history is recorded before the message is published, so
+            ## that its events always find the history in the flying messages
+            message = TransportUserMessage.send(
                 schedule['participant-phone'], message_content, **options)
-            self.collections['history'].add_outgoing(
+            yield self.collections['history'].deferred.add_outgoing(
                 message, message_credits, context, schedule)
+            yield self._publish_message(message)
         elif self.credit_manager.is_timeframed():
-            self.collections['history'].add_nocredit(
+            yield self.collections['history'].deferred.add_nocredit(
                 message_content, context, schedule)
         else:
-            self.collections['history'].add_nocredittimeframe(
+            yield self.collections['history'].deferred.add_nocredittimeframe(
                 message_content, context, schedule)
 
+    @timed('send_schedule')
     @inlineCallbacks
-    def send_schedule(self, schedule):
+    def send_schedule(self, schedule, participant=None, unattached_messages={}):
         try:
             local_time = self.get_local_time()
 
             ## Delayed action are always run even if there original interaction has been deleted
             if schedule.get_type() == 'action-schedule':
-                self.run_schedule_action(schedule)
+                yield self.run_schedule_action(schedule)
                 return
 
             ## Get source unattached, interaction or request
-            interaction, context = self.from_schedule_to_message(schedule)
+            interaction, context = self.from_schedule_to_message(
+                schedule, unattached_messages)
 
             if not interaction:
                 self.log("Sender failure, no interaction  %r" % schedule)
@@ -1012,20 +1489,20 @@ class DialogueWorker(ApplicationWorker):
 
             ## Run the Deadline
             if schedule.get_type() == 'deadline-schedule':
-                self.run_deadline(schedule, interaction, context)
+                yield self.run_deadline(schedule, interaction, context)
                 return
 
             ## Do not run expired schedule
             if schedule.is_expired(local_time):
-                self.collections['history'].add_datepassed_marker(
+                yield self.collections['history'].deferred.add_datepassed_marker(
                     schedule, context)
             else:
-                yield self.send_message(schedule, interaction, context)
+                yield self.send_message(schedule, interaction, context, participant)
 
             if isinstance(interaction, Interaction):
                 actions = interaction.get_sending_actions()
                 for action in actions.items():
-                    self.run_action(
+                    yield self.run_action(
                         schedule['participant-phone'],
                         action,
                         context,
@@ -1044,7 +1521,7 @@ class DialogueWorker(ApplicationWorker):
         self.log("Sending all dialogue %s messages to %s"
                  % (dialogue['name'], phone_number,))
         for interaction in dialogue['interactions']:
-            message_content = self.generate_message(interaction)
+            message_content = self.generate_message(interaction, False)
             options = {
                 'from_addr': self.properties['shortcode'],
                 'transport_name': self.transport_name,
@@ -1105,71 +1582,90 @@ class DialogueWorker(ApplicationWorker):
         return publisher.publish_control(message, None)
 
     #TODO no template defined and no default template defined... what to do?
-    def generate_message(self, interaction):
-        regex_QUESTION = re.compile('QUESTION')
-        regex_ANSWERS = re.compile('ANSWERS')
-        regex_ANSWER = re.compile('ANSWER')
-        regex_SHORTCODE = re.compile('SHORTCODE')
-        regex_KEYWORD = re.compile('KEYWORD')
-        regex_Breakline = re.compile('\\r\\n')
-
-        message = interaction['content']
-        if ('type-interaction' in interaction
+    def generate_message(self, interaction, use_cache=True):
+        if not ('type-interaction' in interaction
                 and interaction['type-interaction'] == 'question-answer'
                 and interaction['set-use-template'] is not None):
-            default_template = None
-            if (interaction['type-question'] == 'closed-question'):
-                default_template = self.properties['default-template-closed-question']
-            elif (interaction['type-question'] == 'open-question'):
-                default_template = self.properties['default-template-open-question']
-            else:
-                pass
-            if (default_template is None):
-                raise MissingTemplate(
-                    "Cannot find default template for %s" %
-                    (interaction['type-question'],))
-            template = self.collections['templates'].find_one({"_id": ObjectId(default_template)})
-            if (template is None):
-                raise MissingTemplate(
-                    "Cannot find specified template id %s" %
-                    (default_template,))
-            #replace question
-            message = re.sub(regex_QUESTION, interaction['content'], template['template'])
-            #replace answers
-            if (interaction['type-question'] == 'closed-question'):
-                i = 1
-                answers = ""
-                for answer in interaction['answers']:
-                    answers = ('%s%s. %s\\n' % (answers, i, answer['choice']))
-                    i = i + 1
-                message = re.sub(regex_ANSWERS, answers, message)
-            #replace keyword
-            keyword = split_keywords(interaction['keyword'])[0]
-            message = re.sub(regex_KEYWORD, keyword.upper(), message)
-            #replace shortcode
-            message = re.sub(regex_SHORTCODE,
-                             get_shortcode_value(self.properties['shortcode']),
+            return interaction['content']
+        default_template = None
+        if (interaction['type-question'] == 'closed-question'):
+            default_template = self.properties['default-template-closed-question']
+        elif (interaction['type-question'] == 'open-question'):
+            default_template = self.properties['default-template-open-question']
+        else:
+            pass
+        if (default_template is None):
+            raise MissingTemplate(
+                "Cannot find default template for %s" %
+                (interaction['type-question'],))
+        if not use_cache:
+            template = self.get_template(default_template)
+            return self.generate_template_message(interaction, template)
+        self.message_templates.check_version(
+            self.collections['dialogues'].cache_reloads)
+        key = (interaction.get('interaction-id', None),
+               default_template,
+               interaction['content'])
+        message = self.message_templates.get_generated_message(key)
+        if message is None:
+            template = self.message_templates.get_template(default_template)
+            if template is None:
+                template = self.get_template(default_template)
+                self.message_templates.set_template(default_template, template)
+            message = self.generate_template_message(interaction, template)
+            self.message_templates.set_generated_message(key, message)
+        return message
+
+    def get_template(self, template_id):
+        template = self.collections['templates'].find_one({"_id": ObjectId(template_id)})
+        if (template is None):
+            raise MissingTemplate(
+                "Cannot find specified template id %s" %
+                (template_id,))
+        return template
+
+    def generate_template_message(self, interaction, template):
+        #replace question
+        message = re.sub(REGEX_QUESTION, interaction['content'], template['template'])
+        #replace answers
+        if (interaction['type-question'] == 'closed-question'):
+            i = 1
+            answers = ""
+            for answer in interaction['answers']:
+                answers = ('%s%s. %s\\n' % (answers, i, answer['choice']))
+                i = i + 1
+            message = re.sub(REGEX_ANSWERS, answers, message)
+        #replace keyword
+        keyword = split_keywords(interaction['keyword'])[0]
+        message = re.sub(REGEX_KEYWORD, keyword.upper(), message)
+        #replace shortcode
+        message = re.sub(REGEX_SHORTCODE,
+                         get_shortcode_value(self.properties['shortcode']),
+                         message)
+        if (interaction['type-question'] == 'open-question'):
+            message = re.sub(REGEX_ANSWER,
+                             interaction['answer-label'],
                              message)
-            if (interaction['type-question'] == 'open-question'):
-                message = re.sub(regex_ANSWER,
-                                 interaction['answer-label'],
-                                 message)
-            message = re.sub(regex_Breakline, '\n', message)
+        message = re.sub(REGEX_BREAKLINE, '\n', message)
         return message
 
+    ## The message is compiled once into tokens and rendered in one pass,
+    ## the participant and the local time are only loaded once.
+    @timed('customize_message')
     def customize_message(self, message, participant_phone=None, context=None, fail=True):
+        tokens = self.message_templates.compile(message)
+        if len(tokens) < 2 and (tokens == [] or tokens[0][0] is None):
+            return message
         participant = None
-        custom_regexp = re.compile(r'\[(?P<domain>[^\.\]]+)\.(?P<key1>[^\.\]]+)(\.(?P<key2>[^\.\]]+))?(\.(?P<key3>[^\.\]]+))?(\.(?P<otherkey>[^\.\]]+))?\]')
-        matches = re.finditer(custom_regexp, message)
-        for match in matches:
-            match = match.groupdict() if match is not None else None
-            if match is None:
+        local_time = None
+        content_variables = {}
+        customized = []
+        for domain, text, match, keys in tokens:
+            if domain is None:
+                customized.append(text)
                 continue
             try:
-                domain = match['domain']
-                keys = {k: match[k] for k in ('key1', 'key2', 'key3') if match[k] is not None}
-                replace_match = dynamic_content_notation_to_string(domain, keys)
-                if domain.lower() in ['participant', 'participants']:
+                if domain == 'participant':
                     if participant_phone is None:
                         raise MissingData(
                             'No participant supplied for this message.',
@@ -1181,14 +1677,16 @@ class DialogueWorker(ApplicationWorker):
                         raise MissingData(
                             "Participant %s doesn't have a label %s" % (participant_phone, match['key1']),
                             message)
-                    message = message.replace(replace_match, participant_label_value) 
+                    customized.append(participant_label_value)
                 elif domain == 'contentVariable':
-                    content_variable = self.collections['content_variables'].get_content_variable_from_match(match)
+                    if text not in content_variables:
+                        content_variables[text] = self.collections['content_variables'].get_content_variable_from_match(match)
+                    content_variable = content_variables[text]
                     if content_variable is None:
                         raise MissingData(
-                            "The program doesn't have a content variable %s" % replace_match,
+                            "The program doesn't have a content variable %s" % text,
                             message)
-                    message = message.replace(replace_match, content_variable['value'])
+                    customized.append(content_variable['value'])
                 elif domain == 'context':
                     if context is None:
                         raise MissingData(
@@ -1197,16 +1695,19 @@ class DialogueWorker(ApplicationWorker):
                     context_data = context.get_data_from_notation(**keys)
                     if context_data is None:
                         raise MissingData(
-                            "No context data for %s" % replace_match,
+                            "No context data for %s" % text,
                             message)
-                    message = message.replace(replace_match, context_data)
+                    customized.append(context_data)
                 elif domain == 'time':
-                    local_time = self.get_local_time()
-                    replace_time = local_time.strftime(add_char_to_pattern(match['key1'], '[a-zA-Z]'))
-                    message = message.replace(replace_match, replace_time)
+                    if local_time is None:
+                        local_time = self.get_local_time()
+                    customized.append(local_time.strftime(
+                        add_char_to_pattern(match['key1'], '[a-zA-Z]')))
                 else:
-                    self.log("Customized message domain not supported %s" % match['domain'])
+                    self.log("Customized message domain not supported %s" % domain)
+                    customized.append(text)
             except Exception, e:
                 if fail:
                     raise e
-        return message
+                customized.append(text)
+        return ''.join(customized)
@@ -1,21 +1,30 @@
 # -*- test-case-name: tests.test_multiworker
+import os
 import MySQLdb
+import yaml
 from pymongo import MongoClient
 
 from copy import deepcopy
+from tempfile import mkstemp
 
+from twisted.internet import reactor, task
 from twisted.internet.defer import (
     Deferred, DeferredList, inlineCallbacks, maybeDeferred)
+from twisted.internet.protocol import ProcessProtocol
+from twisted.python.procutils import which
+from twisted.web.server import Site
 
-from vumi.config import ConfigText, ConfigInt
+from vumi.config import ConfigText, ConfigInt, ConfigList
 from vumi.worker import BaseWorker
 from vumi.service import WorkerCreator
 from vumi.message import Message
 from vumi import log
 
-from vusion.connectors import ReceiveMultiworkerControlConnector
+from vusion.connectors import (
+    ReceiveMultiworkerControlConnector, SendControlConnector)
 from vusion.persist import WorkerConfig, WorkerConfigManager, ProgramManager
 from vusion.message import MultiWorkerControl
+from vusion.component import ShardRing, MetricsResource
 
 
 class VusionMultiworkerConfig(BaseWorker.CONFIG_CLASS):
@@ -53,6 +62,60 @@ class VusionMultiworkerConfig(BaseWorker.CONFIG_CLASS):
         "The db of the mysql instance.",
         required=True, static=True)
 
+    shards = ConfigInt(
+        "The number of shard processes running the workers, 0 is running "
+        "all the workers in this process.",
+        default=0, static=True)
+    shard_name = ConfigText(
+        "The shard of a shard process, set by the parent multiworker.",
+        default=None, static=True)
+    pinned_workers = ConfigList(
+        "The workers running in their own shard process.",
+        default=[], static=True)
+    shard_vumi_config = ConfigText(
+        "The vumi config of the shard processes.",
+        default='./etc/vumi_config.yaml', static=True)
+    shard_report_interval = ConfigInt(
+        "The seconds between the logs of the shards load.",
+        default=300, static=True)
+    metrics_port = ConfigInt(
+        "The localhost port serving the metrics of the workers in json, "
+        "the shards are using the next ports, 0 is disabled.",
+        default=0, static=True)
+
+
+## Child process of a shard, its output is forwarded to the parent log
+class ShardProcessProtocol(ProcessProtocol):
+
+    def __init__(self, shard_name, on_ended):
+        self.shard_name = shard_name
+        self.on_ended = on_ended
+        self.ended = Deferred()
+
+    def outReceived(self, data):
+        for line in data.splitlines():
+            log.msg('[%s] %s' % (self.shard_name, line))
+
+    errReceived = outReceived
+
+    def processEnded(self, reason):
+        self.ended.callback(None)
+        self.on_ended(self.shard_name, reason)
+
+    def get_pid(self):
+        if self.transport is None:
+            return None
+        return self.transport.pid
+
+    ## The user and system cpu seconds of the process, only on linux
+    def get_cpu_time(self):
+        try:
+            with open('/proc/%s/stat' % self.get_pid()) as stat_file:
+                stat = stat_file.read().rsplit(')', 1)[1].split()
+        except IOError:
+            return None
+        return (int(stat[11]) + int(stat[12])) / float(os.sysconf('SC_CLK_TCK'))
+
 
 class VusionMultiWorker(BaseWorker):
 
@@ -63,10 +126,14 @@ class VusionMultiWorker(BaseWorker):
     def _validate_config(self):
         config = self.get_static_config()
         self.application_name = config.application_name
+        self.shard_name = config.shard_name
+        self.control_name = self.application_name
+        if self.shard_name is not None:
+            self.control_name = '%s.%s' % (self.application_name, self.shard_name)
         self.validate_config()
 
     def setup_connectors(self):
-        d = self.setup_connector(ReceiveMultiworkerControlConnector, self.application_name)
+        d = self.setup_connector(ReceiveMultiworkerControlConnector, self.control_name)
 
         def cb(connector):
             connector.set_control_handler(self.dispatch_control)
@@ -80,6 +147,7 @@ class VusionMultiWorker(BaseWorker):
             d.addCallback(lambda r: self.unpause_connectors())
         return d
 
+    @inlineCallbacks
     def setup_application(self):
         config = self.get_static_config()
         log.debug('Starting Multiworker %s' % (config,))
@@ -87,6 +155,18 @@ class VusionMultiWorker(BaseWorker):
         self.workers = {}
         self.worker_creator = self.WORKER_CREATOR(self.options)
 
+        #The workers are spread on shard processes by consistent hashing of
+        #their name, the parent only forwards the controls to the shards
+        self.shard_ring = None
+        self.shard_processes = {}
+        self.shard_connectors = {}
+        self.shard_config_files = {}
+        self.is_stopping_shards = False
+        if config.shards > 0:
+            self.shard_ring = ShardRing(
+                ['shard%s' % i for i in range(config.shards)],
+                config.pinned_workers)
+
         self.mongo_client = MongoClient(
             config.mongodb_host,
             config.mongodb_port,
@@ -106,6 +186,103 @@ class VusionMultiWorker(BaseWorker):
         self.reload_workers_from_config_file()
         self.reload_workers_from_db()
 
+        if self.is_shards_parent():
+            yield self.setup_shards()
+
+        self.metrics_listener = None
+        if config.metrics_port > 0 and not self.is_shards_parent():
+            self.metrics_listener = reactor.listenTCP(
+                config.metrics_port,
+                Site(MetricsResource(self.get_workers_metrics)),
+                interface='127.0.0.1')
+
+    def get_workers_metrics(self):
+        return dict((name, worker.metrics)
+                    for name, worker in self.workers.iteritems()
+                    if getattr(worker, 'metrics', None) is not None)
+
+    def is_shards_parent(self):
+        return self.shard_ring is not None and self.shard_name is None
+
+    @inlineCallbacks
+    def setup_shards(self):
+        config = self.get_static_config()
+        for shard_name in self.shard_ring.get_shard_names():
+            self.shard_connectors[shard_name] = yield self.setup_connector(
+                SendControlConnector,
+                '%s.%s' % (self.application_name, shard_name))
+            self.spawn_shard(shard_name)
+        self.shard_reporter = task.LoopingCall(self.report_shard_load)
+        self.shard_reporter.start(config.shard_report_interval, now=False)
+        self.report_shard_load()
+
+    def spawn_shard(self, shard_name):
+        config = self.get_static_config()
+        if not shard_name in self.shard_config_files:
+            shard_config = deepcopy(self.config)
+            shard_config['shard_name'] = shard_name
+            if config.metrics_port > 0:
+                shard_config['metrics_port'] = (
+                    config.metrics_port + 1
+                    + self.shard_ring.get_shard_names().index(shard_name))
+            fd, path = mkstemp(prefix='%s_%s_' % (self.application_name, shard_name),
+                               suffix='.yaml')
+            with os.fdopen(fd, 'w') as config_file:
+                yaml.safe_dump(shard_config, config_file, default_flow_style=False)
+            self.shard_config_files[shard_name] = path
+        args = [which('twistd')[0], '-n', '--pidfile=',
+                'start_worker',
+                '--vumi-config=%s' % config.shard_vumi_config,
+                '--worker-class=vusion.VusionMultiWorker',
+                '--config=%s' % self.shard_config_files[shard_name]]
+        protocol = ShardProcessProtocol(shard_name, self.shard_ended)
+        reactor.spawnProcess(protocol, args[0], args, env=os.environ)
+        self.shard_processes[shard_name] = protocol
+        log.msg('Shard %s started with pid %s' % (shard_name, protocol.get_pid()))
+
+    def shard_ended(self, shard_name, reason):
+        if self.is_stopping_shards:
+            return
+        log.error('Shard %s ended, restarting it: %s' % (shard_name, reason.getErrorMessage()))
+        reactor.callLater(5, self.spawn_shard, shard_name)
+
+    def get_shard_load(self):
+        load = {}
+        for shard_name, workers in self.shard_ring.get_load().iteritems():
+            process = self.shard_processes.get(shard_name, None)
+            load[shard_name] = {
+                'workers': workers,
+                'pid': process.get_pid() if process is not None else None,
+                'cpu-time': process.get_cpu_time() if process is not None else None}
+        return load
+
+    def report_shard_load(self):
+        log.msg('Shards load %r' % (self.get_shard_load(),))
+
+    @inlineCallbacks
+    def teardown_shards(self):
+        self.is_stopping_shards = True
+        if self.shard_reporter.running:
+            self.shard_reporter.stop()
+        ended = []
+        for process in self.shard_processes.itervalues():
+            if process.get_pid() is not None:
+                process.transport.signalProcess('TERM')
+                ended.append(process.ended)
+        yield DeferredList(ended)
+        for path in self.shard_config_files.itervalues():
+            os.remove(path)
+
+    def forward_control(self, msg):
+        worker_name = msg['worker_name']
+        if msg['message_type'] == 'add_worker':
+            shard_name = self.shard_ring.assign(worker_name)
+        else:
+            shard_name = self.shard_ring.unassign(worker_name)
+        log.msg('Forward %s of %s to %s' % (
+            msg['message_type'], worker_name, shard_name))
+        return self.shard_connectors[shard_name].publish_control(msg)
+
     def teardown_worker(self):
         d = self.pause_connectors()
         d.addCallback(lambda r: self.teardown_application())
@@ -113,6 +290,10 @@ class VusionMultiWorker(BaseWorker):
 
     @inlineCallbacks
     def teardown_application(self):
+        if self.is_shards_parent():
+            yield self.teardown_shards()
+        if self.metrics_listener is not None:
+            yield self.metrics_listener.stopListening()
         for worker in self.workers.itervalues():
             #in the unit test the worker.running is at 0 so the worker is not stopped
             if "before_teardown_application" in dir(worker):
@@ -159,6 +340,10 @@ class VusionMultiWorker(BaseWorker):
             self.add_worker(worker_config)
 
     def add_worker(self, worker_config):
+        if self.shard_ring is not None:
+            shard_name = self.shard_ring.assign(worker_config['name'])
+            if shard_name != self.shard_name:
+                return
         if worker_config['name'] in self.workers:
             log.error('Cannot create worker, name already exist: %s'
                       % (worker_config['name'],))
@@ -181,6 +366,8 @@ class VusionMultiWorker(BaseWorker):
         #self.config.pop(worker_name)
         self.collections['worker_config'].remove_worker_config(worker_name)
         self.workers.pop(worker_name)
+        if self.shard_ring is not None:
+            self.shard_ring.unassign(worker_name)
         log.msg('Worker has been removed %s' % worker_name)
 
     @inlineCallbacks
@@ -191,6 +378,9 @@ class VusionMultiWorker(BaseWorker):
     def consume_control(self, msg):
         log.debug('Received Control %r' % (msg,))
         try:
+            if self.is_shards_parent():
+                yield self.forward_control(msg)
+                return
             if msg['message_type'] == 'add_worker':
                 self.add_worker(WorkerConfig(**{
                     'name': msg['worker_name'],
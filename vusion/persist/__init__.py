@@ -1,5 +1,7 @@
 from model import Model
-from model_manager import ModelManager
+from model_manager import (ModelManager, DeferredManager,
+                           get_db_thread_pool, set_db_thread_pool_size)
+from keyword_index import KeywordIndex
 
 from content_variable.content_variable import ContentVariable
 from content_variable.content_variable_table import ContentVariableTable
@@ -11,7 +13,7 @@ from dialogue.dialogue_manager import DialogueManager
 
 from history.history import (DialogueHistory, RequestHistory, UnattachHistory,
                      OnewayMarkerHistory, DatePassedActionMarkerHistory,
-                     history_generator)
+                     history_generator, trusted_history_generator)
 from history.history_manager import HistoryManager
 
 from participant.participant import Participant
@@ -22,7 +24,7 @@ from request.request_manager import RequestManager
 
 from schedule.schedule import (FeedbackSchedule, DeadlineSchedule, ReminderSchedule,
                       DialogueSchedule, UnattachSchedule, ActionSchedule,
-                      schedule_generator)
+                      BroadcastSchedule, schedule_generator, trusted_schedule_generator)
 from schedule.schedule_manager import ScheduleManager
 
 from credit_log.credit_log import (CreditLog, ProgramCreditLog,
@@ -54,15 +56,17 @@ from program.program_manager import ProgramManager
 
 from program_setting.program_setting_manager import ProgramSettingManager
 
-__all__ = ["Model", "ModelManager",
+__all__ = ["Model", "ModelManager", "DeferredManager",
+           "get_db_thread_pool", "set_db_thread_pool_size",
            "Dialogue", "DialogueManager", 
            "Interaction",
            "DialogueHistory", "RequestHistory", "UnattachHistory",
            "OnewayMarkerHistory", "DatePassedActionMarkerHistory",
-           "history_generator", "HistoryManager",
-           "schedule_generator", "FeedbackSchedule",
+           "history_generator", "trusted_history_generator", "HistoryManager",
+           "schedule_generator", "trusted_schedule_generator", "FeedbackSchedule",
            "DeadlineSchedule","ReminderSchedule", "DialogueSchedule",
-           "UnattachSchedule", "ActionSchedule", "ScheduleManager",
+           "UnattachSchedule", "ActionSchedule", "BroadcastSchedule",
+           "ScheduleManager",
            "CreditLog", "ProgramCreditLog", "GrabageCreditLog",
            "DeletedProgramCreditLog",
            "ProgramCreditLogManager", "GarbageCreditLogManager",
@@ -75,7 +79,7 @@ __all__ = ["Model", "ModelManager",
            "Template", "TemplateManager",
            "ContentVariable", "ContentVariableManager",
            "ContentVariableTable",
-           "CursorInstanciator",
+           "CursorInstanciator", "KeywordIndex",
            "Export", "ExportManager",
            "WorkerManager", 
            "ProgramSettingManager"]
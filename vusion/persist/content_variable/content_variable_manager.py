@@ -1,3 +1,7 @@
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
 from bson import ObjectId
 
 from vusion.persist import ModelManager, ContentVariable, ContentVariableTable
@@ -16,9 +20,97 @@ class ContentVariableManager(ModelManager):
             self.collection_table = db.create_collection(
                 collection_name_table)
 
+        self.cache = None
+        self.cache_max_size = 0
+        self.cache_ttl = 0
+        self.cache_lock = Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     def drop(self):
         self.collection.drop()
         self.collection_table.drop()
+        self.clear_cache()
+
+    ## The cache is disabled by default. As the content variables are also
+    ## edited by the frontend, the cached ones expire after ttl seconds
+    ## (0 never expire). The missing content variables are cached as None.
+    def set_cache(self, max_size, ttl=60, preload=False):
+        if max_size <= 0:
+            self.cache = None
+            return
+        self.cache = OrderedDict()
+        self.cache_max_size = max_size
+        self.cache_ttl = ttl
+        if preload:
+            self.preload_cache()
+
+    def preload_cache(self):
+        if self.cache is None:
+            return
+        for content_variable in self.collection.find().limit(self.cache_max_size):
+            content_variable = ContentVariable(**content_variable)
+            self._set_cached(
+                self._get_cache_key_from_content_variable(content_variable),
+                content_variable)
+
+    def clear_cache(self):
+        if self.cache is None:
+            return
+        with self.cache_lock:
+            self.cache.clear()
+
+    def get_cache_stats(self):
+        return {'size': len(self.cache) if self.cache is not None else 0,
+                'hits': self.cache_hits,
+                'misses': self.cache_misses}
+
+    def _get_cache_key(self, match):
+        key = (match['key1'],)
+        if 'key2' in match and match['key2'] is not None:
+            key += (match['key2'],)
+            if 'key3' in match and match['key3'] is not None:
+                key += (match['key3'],)
+        return key
+
+    def _get_cache_key_from_content_variable(self, content_variable):
+        return tuple(key['key'] for key in content_variable['keys'])
+
+    def _get_cached(self, key):
+        with self.cache_lock:
+            if key not in self.cache:
+                self.cache_misses += 1
+                return False, None
+            cached_time, content_variable = self.cache.pop(key)
+            if self.cache_ttl > 0 and time() - cached_time > self.cache_ttl:
+                self.cache_misses += 1
+                return False, None
+            self.cache[key] = (cached_time, content_variable)
+            self.cache_hits += 1
+            return True, content_variable
+
+    def _set_cached(self, key, content_variable):
+        with self.cache_lock:
+            self.cache.pop(key, None)
+            self.cache[key] = (time(), content_variable)
+            while len(self.cache) > self.cache_max_size:
+                self.cache.popitem(last=False)
+
+    def _invalidate_cached(self, key):
+        if self.cache is None:
+            return
+        with self.cache_lock:
+            self.cache.pop(key, None)
+
+    def _invalidate_cached_table(self, table_id):
+        if self.cache is None:
+            return
+        with self.cache_lock:
+            for key, (cached_time, content_variable) in self.cache.items():
+                if (content_variable is not None
+                        and content_variable.belong_to_table()
+                        and str(content_variable.get_table_id()) == str(table_id)):
+                    self.cache.pop(key)
 
     def get_value(self, match):
         cv = self.get_content_variable_from_match(match)
@@ -27,6 +119,17 @@ class ContentVariableManager(ModelManager):
         return cv['value']
 
     def get_content_variable_from_match(self, match):
+        if self.cache is None:
+            return self._find_content_variable(match)
+        key = self._get_cache_key(match)
+        is_cached, content_variable = self._get_cached(key)
+        if is_cached:
+            return content_variable
+        content_variable = self._find_content_variable(match)
+        self._set_cached(key, content_variable)
+        return content_variable
+
+    def _find_content_variable(self, match):
         condition = self._from_match_to_condition(match)
         content_variable = self.collection.find_one(condition)
         if content_variable is None:
@@ -34,7 +137,8 @@ class ContentVariableManager(ModelManager):
         return ContentVariable(**content_variable)
 
     def save_content_variable(self, match, value, table_id=None):
-        cv = self.get_content_variable_from_match(match)
+        ## not from the cache to not create a duplicate
+        cv = self._find_content_variable(match)
         if not cv is None:
             self._update_content_variable(match, value)
             self._update_table(match, cv, value)
@@ -68,13 +172,18 @@ class ContentVariableManager(ModelManager):
         instance.validate_fields()
         if isinstance(instance, ContentVariableTable):
             c = self.collection_table
+            if instance.is_already_saved():
+                self._invalidate_cached_table(instance['_id'])
         elif isinstance(instance, ContentVariable):
             c = self.collection
+            self._invalidate_cached(
+                self._get_cache_key_from_content_variable(instance))
         return c.save(instance.get_as_dict())
 
     def _update_content_variable(self, match, value):
         condition = self._from_match_to_condition(match)
         self.collection.update(condition, {'$set': {'value': value}})
+        self._invalidate_cached(self._get_cache_key(match))
 
     def exits(self, match):
         condition = self._from_match_to_condition(match)
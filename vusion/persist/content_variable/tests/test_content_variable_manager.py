@@ -150,3 +150,46 @@ class TestContentVariableManager(TestCase, ObjectMaker):
         self.manager.save_object(content_variable_night)
 
         self.assertFalse(self.manager.exits(match))
+
+    def test_cache(self):
+        self.manager.set_cache(10, ttl=0)
+        match = {
+            'key1': 'temperature',
+            'key2': 'night'}
+        self.assertEqual(self.manager.get_content_variable_from_match(match), None)
+
+        self.manager.save_content_variable(match, '12 C')
+        self.assertEqual(self.manager.get_value(match), '12 C')
+
+        ## Not written by the manager, the cached value is returned
+        self.manager.collection.update({}, {'$set': {'value': '15 C'}})
+        self.assertEqual(self.manager.get_value(match), '12 C')
+        self.assertEqual(
+            self.manager.get_cache_stats(),
+            {'size': 1, 'hits': 1, 'misses': 2})
+
+        self.manager.save_content_variable(match, '14 C')
+        self.assertEqual(self.manager.get_value(match), '14 C')
+
+    def test_cache_table(self):
+        table = self.mkobj_content_variable_two_key_table('Temperature')
+        saved_table = self.manager.save_object(table)
+        temperature_night = self.mkobj_content_variables_three_keys(
+            key1='Nairobi', key2='2015/01/01', key3='temperature',
+            value='10 C', table_id=str(saved_table))
+        self.manager.save_object(temperature_night)
+        self.manager.set_cache(1, ttl=0, preload=True)
+        match = {
+            'key1': 'Nairobi',
+            'key2': '2015/01/01',
+            'key3': 'temperature'}
+        self.assertEqual(self.manager.get_value(match), '10 C')
+        self.assertEqual(self.manager.get_cache_stats()['hits'], 1)
+
+        self.manager.collection.update({}, {'$set': {'value': '12 C'}})
+        table = self.manager.get_content_variable_table(str(saved_table))
+        self.manager.save_object(table)
+        self.assertEqual(self.manager.get_value(match), '12 C')
+
+        self.manager.get_value({'key1': 'temperature'})
+        self.assertEqual(self.manager.get_cache_stats()['size'], 1)
@@ -2,6 +2,7 @@ import re
 
 from vusion.persist import Model
 from vusion.error import VusionError
+from vusion.const import DATE_REGEX, CODE_REGEX
 
 
 class CreditLog(Model):
@@ -10,12 +11,12 @@ class CreditLog(Model):
         'date': {
             'required': True,
             '1_valid_string': lambda v: isinstance(v['date'], basestring),
-            '2_valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)$'), v['date'])
+            '2_valid_value': lambda v: re.match(DATE_REGEX, v['date'])
             },
         'code': {
             'required': True,
             '1_not_none': lambda v: v['code'] is not None,
-            '2_valid_format': lambda v: re.match(re.compile('^(\+[0-9]*|[0-9]*\-[0-9]*)$'), v['code']),
+            '2_valid_format': lambda v: re.match(CODE_REGEX, v['code']),
             },
         'incoming': {
             'required': True,
@@ -2,6 +2,7 @@ from bson.code import Code
 from abc import ABCMeta, abstractmethod
 
 from datetime import datetime
+from threading import Lock
 
 from vusion.persist.model_manager import ModelManager
 from vusion.persist import (CreditLog, GarbageCreditLog,
@@ -20,28 +21,53 @@ class CreditLogManager(ModelManager):
         self.collection.ensure_index(
             'date',
             background=True)
+        self.day_credit_logs = set()
+        self.accumulated_counters = None
+        self.accumulator_lock = Lock()
 
     @abstractmethod
-    def _has_today_credit_log(self):
+    def _get_day_credit_log_selector(self):
         pass
 
     @abstractmethod
     def _create_today_credit_log(self):
         pass
 
-    @abstractmethod
-    def _increment_credit_log_counter(self):
-        pass
-    
     @abstractmethod
     def _set_credit_log_counter(self):
         pass
 
+    ## The day credit logs known to exist are kept in memory, they are
+    ## created by upsert so concurrent workers cannot create duplicates.
     def _create_no_exist_day_credit_log(self, **kwargs):
-        if self._has_today_credit_log(**kwargs):
+        selector = self._get_day_credit_log_selector(**kwargs)
+        key = tuple(sorted(selector.iteritems()))
+        if key in self.day_credit_logs:
             return
+        self._upsert_day_credit_log(selector, {}, **kwargs)
+        self.day_credit_logs.add(key)
+
+    def _upsert_day_credit_log(self, selector, counters, **kwargs):
         credit_log = self._create_today_credit_log(**kwargs)
-        self.save_document(credit_log)
+        credit_log.validate_fields()
+        document = credit_log.get_as_dict()
+        for field in selector.keys() + counters.keys() + ['_id']:
+            document.pop(field, None)
+        update_query = {'$setOnInsert': document}
+        if counters != {}:
+            update_query['$inc'] = counters
+        self.collection.update(selector, update_query, upsert=True)
+
+    def _increment_day_credit_log(self, selector, counters, **kwargs):
+        key = tuple(sorted(selector.iteritems()))
+        if key in self.day_credit_logs:
+            result = self.collection.update(selector, {'$inc': counters})
+            if result['n'] == 1:
+                return
+            ## the credit log has been removed in the meantime
+            self.day_credit_logs.discard(key)
+        self._upsert_day_credit_log(selector, counters, **kwargs)
+        self.day_credit_logs.add(key)
 
     def _set_counters(self, counters, **kwargs):
         self._create_no_exist_day_credit_log(**kwargs)
@@ -63,23 +89,56 @@ class CreditLogManager(ModelManager):
         self._set_counters(counters, **kwargs)
 
     def _increment_counter(self, credit_type, credit_number, **kwargs):
-        self._create_no_exist_day_credit_log(**kwargs)
-        self._increment_credit_log_counter(credit_type, credit_number, **kwargs)
+        self._increment_counters({credit_type: credit_number}, **kwargs)
+
+    def _increment_counters(self, counters, **kwargs):
+        selector = self._get_day_credit_log_selector(**kwargs)
+        if self.accumulated_counters is None:
+            self._increment_day_credit_log(selector, counters, **kwargs)
+            return
+        key = tuple(sorted(selector.iteritems()))
+        with self.accumulator_lock:
+            accumulated = self.accumulated_counters.setdefault(
+                key, (selector, kwargs, {}))[2]
+            for credit_type, credit_number in counters.iteritems():
+                accumulated[credit_type] = accumulated.get(credit_type, 0) + credit_number
+
+    ## The accumulator is disabled by default, when enabled the counters are
+    ## only written to the database by flush_counters.
+    def set_accumulator(self, enabled):
+        if not enabled:
+            self.flush_counters()
+            self.accumulated_counters = None
+        elif self.accumulated_counters is None:
+            self.accumulated_counters = {}
+
+    def flush_counters(self):
+        with self.accumulator_lock:
+            if not self.accumulated_counters:
+                return 0
+            accumulated_counters = self.accumulated_counters
+            self.accumulated_counters = {}
+        for selector, kwargs, counters in accumulated_counters.itervalues():
+            self._increment_day_credit_log(selector, counters, **kwargs)
+        return len(accumulated_counters)
 
     def increment_incoming(self, credit_number, **kwargs):
         self._increment_counter('incoming', credit_number, **kwargs)
 
     def increment_outgoing(self, credit_number, **kwargs):
-        self._increment_counter('outgoing', credit_number, **kwargs)
-        self._increment_counter('outgoing-pending', credit_number, **kwargs)
+        self._increment_counters({
+            'outgoing': credit_number,
+            'outgoing-pending': credit_number}, **kwargs)
 
     def increment_acked(self, credit_number, **kwargs):
-        self._increment_counter('outgoing-acked', credit_number, **kwargs)
-        self._increment_counter('outgoing-pending', -1 * credit_number, **kwargs)
-    
+        self._increment_counters({
+            'outgoing-acked': credit_number,
+            'outgoing-pending': -1 * credit_number}, **kwargs)
+
     def increment_nacked(self, credit_number, **kwargs):
-        self._increment_counter('outgoing-nacked', credit_number, **kwargs)
-        self._increment_counter('outgoing-pending', -1 * credit_number, **kwargs)
+        self._increment_counters({
+            'outgoing-nacked': credit_number,
+            'outgoing-pending': -1 * credit_number}, **kwargs)
     
     def increment_delivered(self, credit_number, **kwargs):
         self._increment_counter('outgoing-delivered', credit_number, **kwargs)
@@ -88,26 +147,42 @@ class CreditLogManager(ModelManager):
         self._increment_counter('outgoing-failed', credit_number, **kwargs)
 
     def increment_event_counter(self, prev_status, current_status, credit_number, **kwargs):
+        self.increment_event_counters(
+            [(prev_status, current_status, credit_number)], **kwargs)
+
+    ## The counter changes of many status changes are applied in one $inc
+    def increment_event_counters(self, status_changes, **kwargs):
+        counters = {}
+        for prev_status, current_status, credit_number in status_changes:
+            for credit_type, number in self.get_event_counters(
+                    prev_status, current_status, credit_number):
+                counters[credit_type] = counters.get(credit_type, 0) + number
+        if counters == {}:
+            return
+        self._increment_counters(counters, **kwargs)
+
+    def get_event_counters(self, prev_status, current_status, credit_number):
         if current_status == 'ack':
-            self.increment_acked(credit_number, **kwargs)
+            return [('outgoing-acked', credit_number),
+                    ('outgoing-pending', -1 * credit_number)]
         elif current_status == 'nack':
-            self.increment_nacked(credit_number, **kwargs)
-        elif current_status == 'delivered':
-            if prev_status == 'pending':
-                self._increment_counter('outgoing-pending', -1 * credit_number, **kwargs)
-            self.increment_delivered(credit_number, **kwargs)
-        elif current_status == 'failed':
+            return [('outgoing-nacked', credit_number),
+                    ('outgoing-pending', -1 * credit_number)]
+        elif current_status in ['delivered', 'failed']:
+            counters = []
             if prev_status == 'pending':
-                self._increment_counter('outgoing-pending', -1 * credit_number, **kwargs)
-            self.increment_failed(credit_number, **kwargs)
-        else:
-            self.log("Credit Log event counter is not supporing %s" % current_status)
+                counters.append(('outgoing-pending', -1 * credit_number))
+            counters.append(('outgoing-%s' % current_status, credit_number))
+            return counters
+        self.log("Credit Log event counter is not supporing %s" % current_status)
+        return []
 
     @abstractmethod
     def _get_count_conditions(self):
         pass
 
     def get_count(self, from_date, to_date=None, counters=['outgoing','incoming'], **kwargs):
+        self.flush_counters()
         counter_line = 'prev.count'
         for counter in counters:
             counter_line = ("%s + ('%s' in obj? obj['%s']: 0)" % (counter_line, counter, counter))
@@ -130,14 +205,12 @@ class ProgramCreditLogManager(CreditLogManager):
             background=True,
             spare=True)
 
-    def _has_today_credit_log(self, date=None):
+    def _get_day_credit_log_selector(self, date=None):
         if date is None:
             date = self.property_helper.get_local_time('datetime')
-        return 0 != self.collection.find(
-            {'date': time_to_vusion_format_date(date),
-             'program-database': self.program_database,
-             'code': self.property_helper['shortcode']
-             }).count()
+        return {'date': time_to_vusion_format_date(date),
+                'program-database': self.program_database,
+                'code': self.property_helper['shortcode']}
     
     def _create_today_credit_log(self, date=None):
         if date is None:
@@ -149,13 +222,6 @@ class ProgramCreditLogManager(CreditLogManager):
             'incoming': 0,
             'outgoing': 0})
     
-    def _increment_credit_log_counter(self, credit_type, credit_number):
-        self.collection.update(
-            {'date': self.property_helper.get_local_time("iso_date"),
-             'program-database': self.program_database,
-             'code': self.property_helper['shortcode']},
-            {'$inc': {credit_type: credit_number}})
-
     def _set_credit_log_counter(self, counters, date):
         if date is None:
             date = self.property_helper.get_local_time()
@@ -175,6 +241,7 @@ class ProgramCreditLogManager(CreditLogManager):
             "program-database": self.program_database}
 
     def deleting_program(self, program_name):
+        self.day_credit_logs.clear()
         self.collection.update(
             {'program-database': self.program_database},
             {'$set': {
@@ -189,13 +256,12 @@ class GarbageCreditLogManager(CreditLogManager):
     def __init__(self, db, collection_name, **kwargs):
         super(GarbageCreditLogManager, self).__init__(db, collection_name, **kwargs)
 
-    def _has_today_credit_log(self, code, date=None):
+    def _get_day_credit_log_selector(self, code, date=None):
         if date is None:
             date = datetime.now()
-        return 0 != self.collection.find({
-            'object-type': 'garbage-credit-log',
-            'date': time_to_vusion_format_date(date),
-            'code': code}).count()
+        return {'object-type': 'garbage-credit-log',
+                'date': time_to_vusion_format_date(date),
+                'code': code}
     
     def _create_today_credit_log(self, code, date=None):
         if date is None:
@@ -206,13 +272,6 @@ class GarbageCreditLogManager(CreditLogManager):
             'incoming': 0,
             'outgoing': 0})
     
-    def _increment_credit_log_counter(self, credit_type, credit_number, code):
-        self.collection.update(
-            {'object-type': 'garbage-credit-log',
-             'date': time_to_vusion_format_date(datetime.now()),
-             'code': code},
-            {'$inc': {credit_type: credit_number}})
-
     def _set_credit_log_counter(self, counters, date, code):
         self.collection.update(
             {'object-type': 'garbage-credit-log',
@@ -110,6 +110,66 @@ class TestProgramCreditLogManager(TestCase, ObjectMaker):
         self.assertEqual(0, credit_log['outgoing-pending'])
         self.assertEqual(1, credit_log['outgoing-delivered'])
 
+    def test_increment_event_counters(self):
+        now = self.property_helper.get_local_time()
+        self.clm.set_counters(
+            {'incoming': 0,
+             'outgoing': 4,
+             'outgoing-pending': 4},
+            date=now)
+
+        self.clm.increment_event_counters([
+            ('pending', 'ack', 1),
+            ('ack', 'delivered', 1),
+            ('pending', 'nack', 2),
+            ('pending', 'failed', 1)])
+        credit_log = self.clm.find_one()
+        self.assertEqual(0, credit_log['outgoing-pending'])
+        self.assertEqual(1, credit_log['outgoing-acked'])
+        self.assertEqual(1, credit_log['outgoing-delivered'])
+        self.assertEqual(2, credit_log['outgoing-nacked'])
+        self.assertEqual(1, credit_log['outgoing-failed'])
+
+
+    def test_increment_day_credit_log_cache(self):
+        self.clm.increment_outgoing(2)
+        self.assertEqual(1, len(self.clm.day_credit_logs))
+        credit_log = self.clm.find_one()
+        self.assertEqual('program-credit-log', credit_log['object-type'])
+        self.assertEqual(0, credit_log['incoming'])
+        self.assertEqual(2, credit_log['outgoing'])
+        self.assertEqual(2, credit_log['outgoing-pending'])
+
+        self.clm.increment_incoming(1)
+        self.assertEqual(1, self.clm.find_one()['incoming'])
+
+        ## removed by another process
+        self.clm.collection.remove()
+        self.clm.increment_incoming(1)
+        self.assertEqual(1, self.clm.count())
+        self.assertEqual(1, self.clm.find_one()['incoming'])
+        self.assertEqual(0, self.clm.find_one()['outgoing'])
+
+    def test_accumulator(self):
+        self.clm.set_accumulator(True)
+        self.clm.increment_outgoing(2)
+        self.clm.increment_acked(1)
+        self.clm.increment_incoming(1)
+        self.assertEqual(0, self.clm.count())
+
+        self.assertEqual(1, self.clm.flush_counters())
+        credit_log = self.clm.find_one()
+        self.assertEqual(2, credit_log['outgoing'])
+        self.assertEqual(1, credit_log['outgoing-pending'])
+        self.assertEqual(1, credit_log['outgoing-acked'])
+        self.assertEqual(1, credit_log['incoming'])
+
+        ## flushed when disabled
+        self.clm.increment_incoming(1)
+        self.clm.set_accumulator(False)
+        self.assertEqual(None, self.clm.accumulated_counters)
+        self.assertEqual(2, self.clm.find_one()['incoming'])
+
 
 class TestGarbageCreditLogManager(TestCase, ObjectMaker):
 
@@ -53,7 +53,10 @@ class Dialogue(Model):
         if self.payload['interactions'] is None:
             return
         for interaction_raw in self.payload['interactions']:
-            self.interactions.append(Interaction(**interaction_raw))
+            if self.is_trusted:
+                self.interactions.append(Interaction.from_trusted(**interaction_raw))
+            else:
+                self.interactions.append(Interaction(**interaction_raw))
         self.payload['interactions'] = []
         for interaction in self.interactions:
             self.payload['interactions'].append(interaction.get_as_dict())
@@ -3,8 +3,9 @@ import sys, traceback
 import pymongo
 from bson.objectid import ObjectId
 
-from vusion.persist import ModelManager, Dialogue
+from vusion.persist import ModelManager, Dialogue, KeywordIndex
 from vusion.persist.action import Actions
+from vusion.utils import get_keyword
 
 
 class DialogueManager(ModelManager):
@@ -13,45 +14,141 @@ class DialogueManager(ModelManager):
         super(DialogueManager, self).__init__(db, collection_name, **kwargs)
         self.collection.ensure_index('dialogue-id', background=True)
         self.loaded_dialogues = {}
+        self.keyword_index = KeywordIndex()
+        self.loaded_version = None
+        self.is_loaded_dirty = False
+        self.cache_hits = 0
+        self.cache_reloads = 0
+        self.compiled_dialogues = {}
+        self.compiled_hits = 0
+        self.compiled_misses = 0
         self.load_dialogues()
 
     def load_dialogues(self):
-        self._get_active_dialogues()
-    
+        self.clear_loaded_dialogues()
+        dialogues = self._get_active_dialogues()
+        ## forget the compiled dialogues which are not active anymore
+        active_ids = set(dialogue['_id'] for dialogue in dialogues)
+        for dialogue_obj_id in self.compiled_dialogues.keys():
+            if dialogue_obj_id not in active_ids:
+                del self.compiled_dialogues[dialogue_obj_id]
+        self.loaded_version = self.get_version()
+        self.is_loaded_dirty = False
+        self.cache_reloads += 1
+        return dialogues
+
     def load_dialogue(self, dialogue_id):
         self.loaded_dialogues.pop(dialogue_id, False)
+        self.keyword_index.remove(dialogue_id)
         dialogue = self._get_active_dialogues({'dialogue-id': dialogue_id})
+        self.loaded_version = self.get_version()
+        self.cache_reloads += 1
 
     def clear_loaded_dialogues(self):
         self.loaded_dialogues.clear()
+        self.keyword_index.clear()
 
+    ## The loaded dialogues are only reloaded on a control message or when
+    ## written through this manager, no database read on the hot path.
     def get_active_dialogues(self, conditions=None):
         if conditions is None:
-            #In case there are difference in the number of loaded_dialogue
-            # and the one in the database reload all
-            conditions = {}
-            if len(self.loaded_dialogues) == self._count_active_dialogues():
-                return self.loaded_dialogues.itervalues()
-            self.clear_loaded_dialogues()
+            if self.is_loaded_dirty:
+                return self.load_dialogues()
+            self.cache_hits += 1
+            return self.loaded_dialogues.itervalues()
         return self._get_active_dialogues(conditions)
 
+    ## The version stamp of the active dialogues: their count and the most
+    ## recent modified stamp, which the frontend bump on every save.
+    def get_version(self):
+        cursor = self.find(
+            {'activated': 1}, ['modified']).sort('modified', -1).limit(1)
+        modifieds = [dialogue.get('modified', None) for dialogue in cursor]
+        return (self._count_active_dialogues(),
+                modifieds[0] if modifieds != [] else None)
+
+    ## Polled by the daemon in case a control message has been lost.
+    def check_version(self):
+        if self.get_version() == self.loaded_version:
+            return False
+        self.log("Dialogues have been modified, reloading all dialogues.")
+        self.load_dialogues()
+        return True
+
+    def get_cache_stats(self):
+        return {'hits': self.cache_hits,
+                'reloads': self.cache_reloads,
+                'compiled': len(self.compiled_dialogues),
+                'compiled-hits': self.compiled_hits,
+                'compiled-misses': self.compiled_misses}
+
+    ## The documents written through the manager may keep their modified stamp
+    def set_loaded_dirty(self):
+        self.is_loaded_dirty = True
+        self.compiled_dialogues.clear()
+
+    def save(self, *args, **kwargs):
+        self.set_loaded_dirty()
+        return self.collection.save(*args, **kwargs)
+
+    def insert(self, *args, **kwargs):
+        self.set_loaded_dirty()
+        return self.collection.insert(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.set_loaded_dirty()
+        return self.collection.update(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        self.set_loaded_dirty()
+        return self.collection.remove(*args, **kwargs)
+
+    def drop(self):
+        self.set_loaded_dirty()
+        super(DialogueManager, self).drop()
+
+    ## Only the dialogues not compiled yet or modified since are fetched and
+    ## instanciated, the others are reused from the previous load.
     def _get_active_dialogues(self, conditions={}):
         conditions['activated'] = 1
-        dialogues = self.find(conditions)
+        stamps = list(self.find(conditions, ['_id', 'modified']))
+        compile_ids = []
+        for stamp in stamps:
+            compiled = self.compiled_dialogues.get(stamp['_id'], None)
+            modified = stamp.get('modified', None)
+            if (compiled is not None and modified is not None
+                    and compiled[0] == modified):
+                self.compiled_hits += 1
+            else:
+                compile_ids.append(stamp['_id'])
+        if compile_ids != []:
+            self._compile_dialogues(compile_ids)
         active_dialogues = []
-        for dialogue in dialogues:
+        for stamp in stamps:
+            if stamp['_id'] not in self.compiled_dialogues:
+                continue
+            active_dialogue = self.compiled_dialogues[stamp['_id']][1]
+            active_dialogues.append(active_dialogue)
+            # as soon a dialogue loaded we keep it
+            self.loaded_dialogues[active_dialogue['dialogue-id']] = active_dialogue
+            self.keyword_index.add(
+                active_dialogue['dialogue-id'], active_dialogue.get_all_keywords())
+        return active_dialogues
+
+    def _compile_dialogues(self, dialogue_obj_ids):
+        for dialogue in self.find({'_id': {'$in': dialogue_obj_ids}}):
             try:
-                active_dialogue = Dialogue(**dialogue)
-                active_dialogues.append(active_dialogue)
-                # as soon a dialogue loaded we keep it
-                self.loaded_dialogues[dialogue['dialogue-id']] = active_dialogue
+                self.compiled_dialogues[dialogue['_id']] = (
+                    dialogue.get('modified', None),
+                    Dialogue.from_trusted(**dialogue))
+                self.compiled_misses += 1
             except:
+                self.compiled_dialogues.pop(dialogue['_id'], None)
                 exc_type, exc_value, exc_traceback = sys.exc_info()
                 self.log(
                     "Error while applying dialogue model on dialogue %s: %r" %
                     (dialogue['name'],
                      traceback.format_exception(exc_type, exc_value, exc_traceback)))
-        return active_dialogues
 
     def _count_active_dialogues(self):
         return self.find({'activated': 1}).count()
@@ -66,15 +163,17 @@ class DialogueManager(ModelManager):
 
     def get_dialogue_obj(self, dialogue_obj_id):
         dialogue = self.find_one({'_id': ObjectId(dialogue_obj_id)})
-        return Dialogue(**dialogue)
+        return Dialogue.from_trusted(**dialogue)
 
     def get_matching_dialogue_actions(self, message_content, actions, context):
-        active_dialogues = self.get_active_dialogues()
-        for dialogue in active_dialogues:
-            dialogue.get_matching_reference_and_actions(
-                message_content, actions, context)
-            if context.is_matching():
-                return
+        #make sure the loaded dialogues are in sync
+        self.get_active_dialogues()
+        dialogue_id = self.keyword_index.get(
+            get_keyword(message_content), self.loaded_dialogues)
+        if dialogue_id is None:
+            return
+        self.loaded_dialogues[dialogue_id].get_matching_reference_and_actions(
+            message_content, actions, context)
 
     def get_actions(self, dialogue_id, interaction_id, answer):
         actions = Actions()
@@ -10,7 +10,9 @@ from vusion.persist.action import (action_generator, FeedbackAction,
                                    RemoveDeadlineAction, RemoveQuestionAction,
                                    RemoveRemindersAction, Actions)
 from vusion.utils import (time_from_vusion_format, time_to_vusion_format,
-                          get_default)
+                          get_default, get_offset_date_time)
+
+REGEX_MINUTES_SECONDS = re.compile(r'(?P<minutes>\d{1,4}):?(?P<seconds>\d{2})?')
 
 
 class Interaction(Model):
@@ -224,6 +226,23 @@ class Interaction(Model):
     def __init__(self, **kwargs):
         super(Interaction, self).__init__(**kwargs)
         self.keywords = self._get_keywords()
+        self.keyword_set = set(self.keywords)
+        self.compiled = {}
+
+    ## The answer regexes and reminder offsets are compiled on first use
+    def __setitem__(self, key, value):
+        super(Interaction, self).__setitem__(key, value)
+        self.compiled = {}
+
+    ## The signature detect the modifications of nested fields like answers
+    def get_compiled(self, name, compile_function, signature=None):
+        if name not in self.compiled or self.compiled[name][0] != signature:
+            self.compiled[name] = (signature, compile_function())
+        return self.compiled[name][1]
+
+    def _get_answers_signature(self):
+        return (self.payload['keyword'],
+                tuple(answer['choice'] for answer in self.payload['answers']))
     
     @staticmethod
     def validate_actions(actions):
@@ -321,7 +340,7 @@ class Interaction(Model):
         return self['prioritized']
 
     def is_matching(self, keyword):
-        return keyword in self.keywords
+        return keyword in self.keyword_set
 
     def is_multi_keyword(self):
         if 'answer-keywords' in self.payload:
@@ -341,21 +360,27 @@ class Interaction(Model):
     def generate_reminder_times(self, interaction_date_time):
         if not self.has_reminder:
             return None
-        generate_times = []
+        offsets, sending_time = self.get_compiled(
+            'reminder-offsets', self._compile_reminder_offsets)
+        if sending_time is None:
+            return [interaction_date_time + offset for offset in offsets]
+        return [datetime.combine(interaction_date_time + offset, sending_time)
+                for offset in offsets]
+
+    ## The offsets of the reminders and deadline from the interaction time
+    def _compile_reminder_offsets(self):
         generate_number = int(self['reminder-number']) + 1
         if (self['type-schedule-reminder'] == 'reminder-offset-time'):
-            running_date_time = interaction_date_time
-            for number in range(0, generate_number):            
-                running_date_time += timedelta(minutes=int(self['reminder-minutes']))
-                generate_times.append(running_date_time)
+            minutes = int(self['reminder-minutes'])
+            return [timedelta(minutes=minutes * number)
+                    for number in range(1, generate_number + 1)], None
         elif (self['type-schedule-reminder'] == 'reminder-offset-days'):
-            sending_day = interaction_date_time
-            sending_time = self['reminder-at-time'].split(':', 1)                            
-            for number in range(0, generate_number):                        
-                sending_day += timedelta(days=int(self['reminder-days']))
-                sending_date_time = datetime.combine(sending_day, time(int(sending_time[0]), int(sending_time[1])))
-                generate_times.append(sending_date_time)
-        return generate_times
+            days = int(self['reminder-days'])
+            sending_time = self['reminder-at-time'].split(':', 1)
+            return ([timedelta(days=days * number)
+                     for number in range(1, generate_number + 1)],
+                    time(int(sending_time[0]), int(sending_time[1])))
+        return [], None
 
     def get_reminder_times(self, interaction_date_time):
         times = self.generate_reminder_times(interaction_date_time)
@@ -512,17 +537,17 @@ class Interaction(Model):
 
     def get_matching_answer_closed_question(self, keyword, reply):
         answers = self.payload['answers']
+        signature = self._get_answers_signature()
         if self.payload['set-answer-accept-no-space'] is not None:
-            keywords = self.split_keywords(self.payload['keyword'])
-            answer_index_count = 0
-            for answer in answers:
-                answer_index_count +=1
-                if keyword in self.get_answer_keywords_accept_no_space(keywords, answer, answer_index_count):
-                    return answer
+            answer = self.get_compiled(
+                'answer-keywords', self._compile_answer_keywords,
+                signature).get(keyword, None)
+            if answer is not None:
+                return answer
         if reply is None:
             return None
-        for answer in answers:
-            regex_CHOICE = re.compile(("^%s(\s|$)" % clean_keyword(answer['choice'])))
+        for regex_CHOICE, answer in self.get_compiled(
+                'answer-regexes', self._compile_answer_regexes, signature):
             if re.match(regex_CHOICE, reply) is not None:
                 return answer
         try:
@@ -534,6 +559,21 @@ class Interaction(Model):
         except:
             return None
 
+    ## the first answer matching a keyword without space is kept
+    def _compile_answer_keywords(self):
+        keywords = self.split_keywords(self.payload['keyword'])
+        answer_keywords = {}
+        answer_index_count = 0
+        for answer in self.payload['answers']:
+            answer_index_count +=1
+            for keyword in self.get_answer_keywords_accept_no_space(keywords, answer, answer_index_count):
+                answer_keywords.setdefault(keyword, answer)
+        return answer_keywords
+
+    def _compile_answer_regexes(self):
+        return [(re.compile(("^%s(\s|$)" % clean_keyword(answer['choice']))), answer)
+                for answer in self.payload['answers']]
+
     def _get_keywords(self):
         keywords = []
         if self.payload['type-interaction'] == 'announcement':
@@ -556,11 +596,28 @@ class Interaction(Model):
     def get_keywords(self):
         return self.keywords
 
+    ## For offset-condition the caller has to check first that the
+    ## conditioning interaction has been answered. The enrolled time of the
+    ## participant is only needed by the offset-days and offset-time.
+    def get_sending_date_time(self, participant, dialogue_id, local_time):
+        if (self['type-schedule'] == 'offset-days'):
+            return get_offset_date_time(
+                time_from_vusion_format(participant.get_enrolled_time(dialogue_id)),
+                self['days'],
+                self['at-time'])
+        elif (self['type-schedule'] == 'offset-time'):
+            return (time_from_vusion_format(participant.get_enrolled_time(dialogue_id))
+                    + self.get_offset_time_delta())
+        elif (self['type-schedule'] == 'fixed-time'):
+            return time_from_vusion_format(self['date-time'])
+        elif (self['type-schedule'] == 'offset-condition'):
+            return local_time + timedelta(minutes=int(self['offset-condition-delay']))
+        return None
+
     def get_offset_time_delta(self):
         if self['type-schedule'] != 'offset-time':
             return None
-        regex_MinutesSeconds = re.compile(r'(?P<minutes>\d{1,4}):?(?P<seconds>\d{2})?')
-        for minutes, seconds in re.findall(regex_MinutesSeconds, self['minutes']):
+        for minutes, seconds in re.findall(REGEX_MINUTES_SECONDS, self['minutes']):
             return timedelta(minutes=int(minutes), seconds=int(seconds) if seconds!='' else 0)
 
     def has_sending_actions(self):
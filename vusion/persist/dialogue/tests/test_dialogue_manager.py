@@ -153,3 +153,81 @@ class TestDialogueManager(TestCase, ObjectMaker):
 
         self.assertEqual(labels, ['status','name', 'gender'])
 
+
+    def test_get_active_dialogues_cache(self):
+        self.dialogue_manager.save(self.mkobj_dialogue_question_answer())
+        self.dialogue_manager.get_active_dialogues()
+        stats = self.dialogue_manager.get_cache_stats()
+
+        ## no database read as long as the dialogues are not modified
+        for i in range(3):
+            self.assertEqual(len(list(self.dialogue_manager.get_active_dialogues())), 1)
+        self.assertEqual(
+            self.dialogue_manager.get_cache_stats()['hits'], stats['hits'] + 3)
+        self.assertEqual(
+            self.dialogue_manager.get_cache_stats()['reloads'], stats['reloads'])
+
+        ## modified by another process, only reloaded on control or version check
+        dialogue = self.mkobj_dialogue_open_question()
+        dialogue['dialogue-id'] = '02'
+        self.dialogue_manager.collection.save(dialogue)
+        self.assertEqual(len(list(self.dialogue_manager.get_active_dialogues())), 1)
+        self.dialogue_manager.load_dialogue('02')
+        self.assertEqual(len(list(self.dialogue_manager.get_active_dialogues())), 2)
+        self.assertFalse(self.dialogue_manager.check_version())
+
+        dialogue.pop('_id')
+        dialogue['dialogue-id'] = '03'
+        self.dialogue_manager.collection.save(dialogue)
+        self.assertTrue(self.dialogue_manager.check_version())
+        self.assertEqual(len(list(self.dialogue_manager.get_active_dialogues())), 3)
+        self.assertEqual(
+            self.dialogue_manager.get_cache_stats()['reloads'], stats['reloads'] + 2)
+
+        ## edited in place by another process
+        self.dialogue_manager.collection.update(
+            {'dialogue-id': '03'},
+            {'$set': {'name': 'edited',
+                      'modified': Timestamp(datetime.now() + timedelta(minutes=1), 0)}})
+        self.assertTrue(self.dialogue_manager.check_version())
+        self.assertEqual(
+            self.dialogue_manager.get_current_dialogue('03')['name'], 'edited')
+
+    def test_get_active_dialogues_compiled(self):
+        dialogue = self.mkobj_dialogue_question_answer()
+        dialogue['modified'] = Timestamp(datetime.now(), 0)
+        self.dialogue_manager.collection.save(dialogue)
+        dialogue_two = self.mkobj_dialogue_open_question()
+        dialogue_two['modified'] = Timestamp(datetime.now(), 0)
+        self.dialogue_manager.collection.save(dialogue_two)
+
+        self.dialogue_manager.load_dialogues()
+        compiled = self.dialogue_manager.get_current_dialogue(dialogue['dialogue-id'])
+        stats = self.dialogue_manager.get_cache_stats()
+        self.assertEqual(stats['compiled'], 2)
+
+        ## unmodified dialogues are reused on reload
+        self.dialogue_manager.load_dialogues()
+        self.assertIs(
+            self.dialogue_manager.get_current_dialogue(dialogue['dialogue-id']),
+            compiled)
+        self.assertEqual(
+            self.dialogue_manager.get_cache_stats()['compiled-hits'],
+            stats['compiled-hits'] + 2)
+
+        ## a modified dialogue is compiled again
+        dialogue['modified'] = Timestamp(datetime.now() + timedelta(minutes=1), 0)
+        self.dialogue_manager.collection.save(dialogue)
+        self.dialogue_manager.load_dialogues()
+        self.assertIsNot(
+            self.dialogue_manager.get_current_dialogue(dialogue['dialogue-id']),
+            compiled)
+        self.assertEqual(
+            self.dialogue_manager.get_cache_stats()['compiled-misses'],
+            stats['compiled-misses'] + 1)
+
+        ## an deactivated dialogue is dropped
+        dialogue_two['activated'] = 0
+        self.dialogue_manager.collection.save(dialogue_two)
+        self.dialogue_manager.load_dialogues()
+        self.assertEqual(self.dialogue_manager.get_cache_stats()['compiled'], 1)
@@ -242,6 +242,22 @@ class TestInteraction(TestCase, ObjectMaker):
         self.assertEqual(time_from_vusion_format('2012-04-06T09:00:00'), reminder_times[0])
         self.assertEqual(time_from_vusion_format('2012-04-08T09:00:00'), reminder_times[1])
 
+    def test_get_reminder_times_compiled(self):
+        dialogue = self.mkobj_dialogue_open_question_reminder_offset_time()
+        interaction = Interaction(**dialogue['interactions'][0])
+
+        reminder_times = interaction.get_reminder_times(
+            time_from_vusion_format('2012-04-04T09:00:00'))
+        self.assertEqual(time_from_vusion_format('2012-04-04T09:30:00'), reminder_times[0])
+        self.assertTrue('reminder-offsets' in interaction.compiled)
+
+        ## the compiled offsets are dropped on modification
+        interaction['reminder-minutes'] = '10'
+        self.assertEqual(interaction.compiled, {})
+        reminder_times = interaction.get_reminder_times(
+            time_from_vusion_format('2012-04-04T09:00:00'))
+        self.assertEqual(time_from_vusion_format('2012-04-04T09:10:00'), reminder_times[0])
+
     def test_get_deadline_time_offset_time(self):
         dialogue = self.mkobj_dialogue_open_question_reminder_offset_time()
         interaction_offset_time = Interaction(**dialogue['interactions'][0])
@@ -3,6 +3,7 @@ import re
 from vusion.persist import Model
 from vusion.error import InvalidField, VusionError
 from vusion.utils import time_from_vusion_format
+from vusion.const import TIMESTAMP_REGEX
 
 
 class History(Model):
@@ -10,7 +11,7 @@ class History(Model):
     fields = {
         'timestamp': {
             'required': True,
-            'valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+):0?(\d+)$'), v['timestamp'])
+            'valid_value': lambda v: re.match(TIMESTAMP_REGEX, v['timestamp'])
             },
         'participant-phone': {
             'required': True,
@@ -113,7 +114,7 @@ class MessageHistory(History):
             },
         'timestamp': {
             'required': True,
-            'valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+):0?(\d+)$'), v['timestamp'])
+            'valid_value': lambda v: re.match(TIMESTAMP_REGEX, v['timestamp'])
             },
         'to-addr': {
             'required': True,
@@ -272,6 +273,15 @@ class DatePassedActionMarkerHistory(History):
 
 
 def history_generator(**kwargs):
+    return get_history_class(kwargs)(**kwargs)
+
+
+## Instanciate an history read from the database
+def trusted_history_generator(**kwargs):
+    return get_history_class(kwargs).from_trusted(**kwargs)
+
+
+def get_history_class(kwargs):
     if 'object-type' not in kwargs:
         if 'dialogue-id' in kwargs:
             kwargs['object-type'] = 'dialogue-history'
@@ -283,19 +293,19 @@ def history_generator(**kwargs):
             kwargs['object-type'] = None
 
     if kwargs['object-type'] == 'dialogue-history':
-        return DialogueHistory(**kwargs)
+        return DialogueHistory
     elif kwargs['object-type'] == 'request-history':
-        return RequestHistory(**kwargs)
+        return RequestHistory
     elif kwargs['object-type'] == 'unattach-history':
-        return UnattachHistory(**kwargs)
+        return UnattachHistory
     elif kwargs['object-type'] == 'unmatching-history':
-        return UnmatchingHistory(**kwargs)
+        return UnmatchingHistory
     elif kwargs['object-type'] == 'oneway-marker-history':
-        return OnewayMarkerHistory(**kwargs)
+        return OnewayMarkerHistory
     elif kwargs['object-type'] == 'datepassed-marker-history':
-        return DatePassedMarkerHistory(**kwargs)
+        return DatePassedMarkerHistory
     elif kwargs['object-type'] == 'datepassed-action-marker-history':
-        return DatePassedActionMarkerHistory(**kwargs)
+        return DatePassedActionMarkerHistory
     elif kwargs['object-type'] == 'feedback-history':
-        return FeedbackHistory(**kwargs)
+        return FeedbackHistory
     raise VusionError("%s not supported" % kwargs['object-type'])
@@ -11,7 +11,21 @@ from vusion.utils import (time_to_vusion_format, time_to_vusion_format_date,
                           date_from_vusion_format)
 from vusion.component.flying_messsage_manager import FlyingMessageManager
 from vusion.persist.cursor_instanciator import CursorInstanciator
-from history import history_generator
+from history import history_generator, trusted_history_generator
+from participant_session_cache import (ParticipantSessionCache,
+                                       ParticipantSessionState)
+from history_write_buffer import HistoryWriteBuffer
+
+
+def is_history(history_id):
+    history_id = str(history_id)
+    return lambda history: str(history['_id']) == history_id
+
+
+def is_session_history(participant_phone, participant_session_id):
+    return lambda history: (
+        history.get('participant-phone') == participant_phone
+        and history.get('participant-session-id') == participant_session_id)
 
 
 class HistoryManager(ModelManager):
@@ -32,6 +46,9 @@ class HistoryManager(ModelManager):
         self.collection.ensure_index('unattach-id',
                                      sparce=True,
                                      background=True)
+        self.session_cache = None
+        self.session_cache_check = False
+        self.write_buffer = None
         self.has_fly_manager = False
         if not prefix_key is None and not redis is None:
             self.has_fly_manager = True
@@ -39,16 +56,22 @@ class HistoryManager(ModelManager):
             self.flying_manager = FlyingMessageManager(prefix_key, redis)
 
     def get_history(self, history_id):
-        result = self.collection.find_one({'_id': ObjectId(history_id)})
+        history_id = ObjectId(history_id)
+        def read(pending):
+            if pending != []:
+                return pending[0]
+            return self.collection.find_one({'_id': history_id})
+        result = self.read_with_pending(is_history(history_id), read)
         if result is None:
             return None
-        return history_generator(**result)
+        return trusted_history_generator(**result)
 
     def get_historys(self, query=None, sort=None):
+        self.flush_write_buffer()
         def log(exception, item=None):
             self.log("Exception %r while instanciating an history %r" % (exception, item))
         return CursorInstanciator(
-            self.collection.find(query, sort=sort), history_generator, [log])
+            self.collection.find(query, sort=sort), trusted_history_generator, [log])
 
     def save_history(self, simulated=False, **kwargs):
         if 'timestamp' in kwargs and not isinstance(kwargs['timestamp'], str):
@@ -58,7 +81,13 @@ class HistoryManager(ModelManager):
         if 'interaction' in kwargs:
             kwargs.pop('interaction')
         history = history_generator(**kwargs)
-        history_id = self.save_document(history)
+        if self.write_buffer is None:
+            history_id = self.save_document(history)
+        else:
+            history.validate_fields()
+            history_id = self.write_buffer.append(history.get_as_dict())
+        if self.session_cache is not None:
+            self.session_cache.add_history(history.get_as_dict())
         if not simulated and history.is_message() and history.is_outgoing() and self.has_fly_manager:
             self.flying_manager.append_message_data(
                 history['message-id'],
@@ -74,6 +103,72 @@ class HistoryManager(ModelManager):
         if history_id is None:
             self.log("Cannot find flying message %s, cannot proceed updating the history" % event['user_message_id'])
             return event['event_type'], None, credits
+        status, new_status = self.get_status_from_event(event)
+        if self.is_forwarded_event(event):
+            self.update_forwarded_status(history_id, event['user_message_id'], status)
+        else:
+            self.update_status(history_id, status)
+        self.flying_manager.append_message_data(
+            event['user_message_id'],
+            history_id,
+            credits,
+            new_status)
+        return new_status, old_status, credits
+
+    ## Batch version of update_status_from_event, the events of a message are
+    ## applied in their order: the flying messages are read and written in
+    ## one redis pipeline and the history receive its last status in one bulk.
+    def update_status_from_events(self, events):
+        if self.has_fly_manager == False:
+            raise Exception('Fly manager not instanciated')
+        message_ids = []
+        for event in events:
+            if not event['user_message_id'] in message_ids:
+                message_ids.append(event['user_message_id'])
+        flying_messages = dict(zip(
+            message_ids, self.flying_manager.get_messages_data(message_ids)))
+        history_ids = set(str(history_id) for history_id, credits, status
+                          in flying_messages.itervalues() if history_id is not None)
+        self.flush_write_buffer(
+            lambda history: str(history['_id']) in history_ids)
+        updates = {}
+        results = []
+        for event in events:
+            message_id = event['user_message_id']
+            history_id, credits, old_status = flying_messages[message_id]
+            if history_id is None:
+                self.log("Cannot find flying message %s, cannot proceed updating the history" % message_id)
+                results.append((event['event_type'], None, credits))
+                continue
+            status, new_status = self.get_status_from_event(event)
+            if self.is_forwarded_event(event):
+                selector_query, update_query = self._get_forwarded_status_update(
+                    history_id, message_id, status)
+            else:
+                selector_query, update_query = self._get_status_update(history_id, status)
+            ## the later $set are applied on top of the earlier ones
+            if message_id in updates:
+                updates[message_id][1]['$set'].update(update_query['$set'])
+                update_query = updates[message_id][1]
+            updates[message_id] = (selector_query, update_query)
+            flying_messages[message_id] = (history_id, credits, new_status)
+            results.append((new_status, old_status, credits))
+        if updates == {}:
+            return results
+        bulk = self.collection.initialize_unordered_bulk_op()
+        for selector_query, update_query in updates.itervalues():
+            bulk.find(selector_query).update_one(update_query)
+        bulk.execute()
+        self.flying_manager.append_messages_data(
+            [(message_id,) + flying_messages[message_id] for message_id in updates])
+        return results
+
+    def is_forwarded_event(self, event):
+        return ('transport_type' in event['transport_metadata']
+                and event['transport_metadata']['transport_type'] == 'http_api')
+
+    ## Return the history status and the credit status of an event
+    def get_status_from_event(self, event):
         if (event['event_type'] == 'ack'):
             status = event['event_type']
             new_status = status
@@ -93,19 +188,14 @@ class HistoryManager(ModelManager):
                       event.get('failure_code', 'unknown'),
                       event.get('failure_reason', 'unknown')))}
                 credit_status = event['delivery_status']
-        if ('transport_type' in event['transport_metadata']
-           and event['transport_metadata']['transport_type'] == 'http_api'):
-            self.update_forwarded_status(history_id, event['user_message_id'], status)
-        else:
-            self.update_status(history_id, status)
-        self.flying_manager.append_message_data(
-            event['user_message_id'],
-            history_id,
-            credits,
-            new_status)
-        return new_status, old_status, credits
+        return status, new_status
 
     def update_status(self, history_id, status):
+        self.flush_write_buffer(is_history(history_id))
+        selector_query, update_query = self._get_status_update(history_id, status)
+        self.collection.update(selector_query, update_query)
+
+    def _get_status_update(self, history_id, status):
         message_status = None
         failure_reason = None        
         if isinstance(status, dict):
@@ -117,9 +207,15 @@ class HistoryManager(ModelManager):
         update_query = {'$set': {'message-status': message_status}}
         if failure_reason is not None:
             update_query['$set'].update({'failure-reason': failure_reason})
-        self.collection.update(selector_query, update_query)              
+        return selector_query, update_query
 
     def update_forwarded_status(self, history_id, message_id, status):
+        self.flush_write_buffer(is_history(history_id))
+        selector_query, update_query = self._get_forwarded_status_update(
+            history_id, message_id, status)
+        self.collection.update(selector_query, update_query)
+
+    def _get_forwarded_status_update(self, history_id, message_id, status):
         message_status = None
         failure_reason = None
         if isinstance(status, dict):
@@ -134,9 +230,10 @@ class HistoryManager(ModelManager):
         update_query = {'$set': {'forwards.$.status': message_status}}
         if failure_reason is not None:
             update_query['$set'].update({'forwards.$.failure-reason': failure_reason})
-        self.collection.update(selector_query, update_query)
+        return selector_query, update_query
 
     def update_forwarding(self, history_id, message_id, to_addr):
+        self.flush_write_buffer(is_history(history_id))
         selector_query = {'_id': ObjectId(str(history_id))}
         update_query = {
             '$set': {'message-status': 'forwarded'},
@@ -148,6 +245,7 @@ class HistoryManager(ModelManager):
         self.flying_manager.append_message_data(message_id, history_id, 0, 'pending')
 
     def count_day_credits(self, date):
+        self.flush_write_buffer()
         reducer = Code("function(obj, prev) {"
                        "    credits = 0;"
                        "    if ('message-credits' in obj) {"
@@ -200,6 +298,7 @@ class HistoryManager(ModelManager):
         return {k : int(float(counters[k])) for k in counters.iterkeys()}
 
     def get_older_date(self, date=None):
+        self.flush_write_buffer()
         if date is None:
             date = self.get_local_time() + timedelta(days=1)
         date = date.replace(hour=0, minute=0, second=0)
@@ -208,13 +307,15 @@ class HistoryManager(ModelManager):
         if cursor.count() == 0:
             return None
         try:
-            history = history_generator(**cursor.next())
+            history = trusted_history_generator(**cursor.next())
             return date_from_vusion_format(history['timestamp'])
         except Exception as e:
             self.log_helper.log(e.message)
             return None
 
     def get_status_and_credits(self, user_message_id):
+        self.flush_write_buffer(
+            lambda history: history.get('message-id') == user_message_id)
         limit_timesearch = self.get_local_time() - timedelta(hours=self.TIMESTAMP_LIMIT_ACK)
         return self.collection.find_one(
             {'message-id': user_message_id,
@@ -228,69 +329,116 @@ class HistoryManager(ModelManager):
         yield d
 
     def _was_unattach_sent(self, participant_phone, unattach_id):
-        unattach_history = self.collection.find_one({
-            'participant-phone': participant_phone,
-            'unattach-id': str(unattach_id)})
+        def read(pending):
+            if pending != []:
+                return pending[0]
+            return self.collection.find_one({
+                'participant-phone': participant_phone,
+                'unattach-id': str(unattach_id)})
+        unattach_history = self.read_with_pending(
+            lambda history: (history.get('participant-phone') == participant_phone
+                             and history.get('unattach-id') == str(unattach_id)),
+            read)
         if unattach_history is None:
             returnValue(False)
         returnValue(True)
 
     def get_history_of_interaction(self, participant, dialogue_id, interaction_id):
-        result = self.collection.find_one(
-            {'participant-phone': participant['phone'],
-             'participant-session-id': participant['session-id'],
-             'dialogue-id': dialogue_id,
-             'interaction-id': interaction_id,
-             '$or': [{'message-direction': 'outgoing'},
-                     {'message-direction': 'incoming',
-                      'matching-answer': {'$ne':None}}]},
-            sort=[('timestamp', ASCENDING)])
+        is_session = is_session_history(
+            participant['phone'], participant['session-id'])
+        def is_matching(history):
+            return (is_session(history)
+                    and history.get('dialogue-id') == dialogue_id
+                    and history.get('interaction-id') == interaction_id
+                    and (history.get('message-direction') == 'outgoing'
+                         or (history.get('message-direction') == 'incoming'
+                             and history.get('matching-answer') is not None)))
+        def read(pending):
+            result = self.collection.find_one(
+                {'participant-phone': participant['phone'],
+                 'participant-session-id': participant['session-id'],
+                 'dialogue-id': dialogue_id,
+                 'interaction-id': interaction_id,
+                 '$or': [{'message-direction': 'outgoing'},
+                         {'message-direction': 'incoming',
+                          'matching-answer': {'$ne':None}}]},
+                sort=[('timestamp', ASCENDING)])
+            results = ([] if result is None else [result]) + pending
+            if results == []:
+                return None
+            return min(results, key=lambda history: history['timestamp'])
+        result = self.read_with_pending(is_matching, read)
         if result is None:
             return None
-        return history_generator(**result)
+        return trusted_history_generator(**result)
 
     def get_history_of_offset_condition_answer(self, participant, dialogue_id,
                                                interaction_id):
-        result = self.collection.find_one(
-            {"participant-phone": participant['phone'],
-             "participant-session-id": participant['session-id'],
-             "message-direction": 'incoming',
-             "dialogue-id": dialogue_id,
-             "interaction-id": interaction_id,
-             "$or": [{'matching-answer': {'$exists': False}},
-                     {'matching-answer': {'$ne': None}}]})
+        is_session = is_session_history(
+            participant['phone'], participant['session-id'])
+        def is_matching(history):
+            return (is_session(history)
+                    and history.get('message-direction') == 'incoming'
+                    and history.get('dialogue-id') == dialogue_id
+                    and history.get('interaction-id') == interaction_id
+                    and ('matching-answer' not in history
+                         or history['matching-answer'] is not None))
+        def read(pending):
+            result = self.collection.find_one(
+                {"participant-phone": participant['phone'],
+                 "participant-session-id": participant['session-id'],
+                 "message-direction": 'incoming',
+                 "dialogue-id": dialogue_id,
+                 "interaction-id": interaction_id,
+                 "$or": [{'matching-answer': {'$exists': False}},
+                         {'matching-answer': {'$ne': None}}]})
+            if result is None and pending != []:
+                return pending[0]
+            return result
+        result = self.read_with_pending(is_matching, read)
         if result is None:
             return None
-        return history_generator(**result)
+        return trusted_history_generator(**result)
 
     def has_oneway_marker(self, participant_phone, participant_session_id,
                           dialogue_id, interaction_id):
-        return self.collection.find_one({
-            'object-type': 'oneway-marker-history',
-            'participant-phone': participant_phone,
-            'participant-session-id':participant_session_id,
-            'dialogue-id': dialogue_id,
-            'interaction-id': interaction_id
-        }) is not None
+        return self._get_session_answer(
+            participant_phone, participant_session_id,
+            lambda state: state.has_marker(
+                dialogue_id, interaction_id, 'oneway-marker-history'),
+            lambda: self.collection.find_one({
+                'object-type': 'oneway-marker-history',
+                'participant-phone': participant_phone,
+                'participant-session-id':participant_session_id,
+                'dialogue-id': dialogue_id,
+                'interaction-id': interaction_id
+            }) is not None)
 
     def has_marker(self, participant, dialogue_id, interaction_id):
-        return self.collection.find_one(
-            {'participant-phone': participant['phone'],
-             'participant-session-id': participant['session-id'],
-             'dialogue-id': dialogue_id,
-             'interaction-id': interaction_id,
-             '$or': [{'object-type': 'oneway-marker-history'},
-                     {'object-type': 'datepassed-marker-history'}]
-             }) is not None
+        return self._get_session_answer(
+            participant['phone'], participant['session-id'],
+            lambda state: state.has_marker(dialogue_id, interaction_id),
+            lambda: self.collection.find_one(
+                {'participant-phone': participant['phone'],
+                 'participant-session-id': participant['session-id'],
+                 'dialogue-id': dialogue_id,
+                 'interaction-id': interaction_id,
+                 '$or': [{'object-type': 'oneway-marker-history'},
+                         {'object-type': 'datepassed-marker-history'}]
+                 }) is not None)
 
     def has_datepassed_marker(self, participant, dialogue_id, interaction_id):
-        return self.collection.find_one(
-            {'participant-phone': participant['phone'],
-             'participant-session-id': participant['session-id'],
-             'dialogue-id': dialogue_id,
-             'interaction-id': interaction_id,
-             'object-type': 'datepassed-marker-history'
-            }) is not None
+        return self._get_session_answer(
+            participant['phone'], participant['session-id'],
+            lambda state: state.has_marker(
+                dialogue_id, interaction_id, 'datepassed-marker-history'),
+            lambda: self.collection.find_one(
+                {'participant-phone': participant['phone'],
+                 'participant-session-id': participant['session-id'],
+                 'dialogue-id': dialogue_id,
+                 'interaction-id': interaction_id,
+                 'object-type': 'datepassed-marker-history'
+                }) is not None)
 
     def participant_has_max_unmatching_answers(self, participant, dialogue_id, interaction):
         if (not interaction.has_max_unmatching_answers()):
@@ -301,8 +449,12 @@ class HistoryManager(ModelManager):
                  'dialogue-id': dialogue_id,
                  'interaction-id': interaction['interaction-id'],
                  'matching-answer': None}
-        history = self.collection.find(query)
-        if history.count() == int(interaction['max-unmatching-answer-number']):
+        count = self._get_session_answer(
+            participant['phone'], participant['session-id'],
+            lambda state: state.count_unmatching_answers(
+                dialogue_id, interaction['interaction-id']),
+            lambda: self.collection.find(query).count())
+        if count == int(interaction['max-unmatching-answer-number']):
             return True
         return False
     
@@ -314,11 +466,115 @@ class HistoryManager(ModelManager):
                  'matching-answer': {'$ne': None},
                  'dialogue-id': dialogue_id,
                  'interaction-id': interaction_id}
-        history = self.collection.find(query)
-        if history is None or history.count() <= number:
+        count = self._get_session_answer(
+            participant['phone'], participant['session-id'],
+            lambda state: state.count_valid_answers(dialogue_id, interaction_id),
+            lambda: self.collection.find(query).count())
+        if count <= number:
             return False
         return True
 
+    ## The session cache is disabled by default, in check mode the answers
+    ## are compared to the database ones which are always returned.
+    def set_session_cache(self, max_size, check=False):
+        if max_size <= 0:
+            self.session_cache = None
+            return
+        self.session_cache = ParticipantSessionCache(max_size)
+        self.session_cache_check = check
+
+    def load_session_state(self, participant_phone, participant_session_id):
+        return self.warm_session_cache(
+            [(participant_phone, participant_session_id)])[0]
+
+    ## Load in one query the state of sessions given as (phone, session-id)
+    def warm_session_cache(self, sessions):
+        if sessions == []:
+            return []
+        keys = set(sessions)
+        states = self.read_with_pending(
+            lambda history: ('dialogue-id' in history and (
+                history.get('participant-phone'),
+                history.get('participant-session-id')) in keys),
+            lambda pending: self._load_session_states(sessions, pending))
+        if self.session_cache is not None:
+            for session in sessions:
+                self.session_cache.set(session[0], session[1], states[session])
+        return [states[session] for session in sessions]
+
+    def _load_session_states(self, sessions, pending):
+        states = {}
+        for session in sessions:
+            states[session] = ParticipantSessionState()
+        cursor = self.collection.find(
+            {'participant-phone': {'$in': [phone for phone, s in sessions]},
+             'participant-session-id': {'$in': [s for phone, s in sessions]},
+             'dialogue-id': {'$exists': True}},
+            ['participant-phone', 'participant-session-id', 'object-type',
+             'dialogue-id', 'interaction-id', 'message-direction',
+             'matching-answer'])
+        for history in list(cursor) + pending:
+            key = (history['participant-phone'], history['participant-session-id'])
+            if key in states:
+                states[key].add_history(history)
+        return states
+
+    def _get_session_answer(self, participant_phone, participant_session_id,
+                            from_state, from_db):
+        if self.session_cache is None:
+            return self._get_db_session_answer(
+                participant_phone, participant_session_id, from_state, from_db)
+        state = self.session_cache.get(participant_phone, participant_session_id)
+        if state is None:
+            state = self.load_session_state(participant_phone, participant_session_id)
+        answer = from_state(state)
+        if not self.session_cache_check:
+            return answer
+        db_answer = self._get_db_session_answer(
+            participant_phone, participant_session_id, from_state, from_db)
+        if answer != db_answer:
+            self.session_cache.mismatches += 1
+            self.log("Session cache mismatch for %s session %s: %r instead of %r" % (
+                participant_phone, participant_session_id, answer, db_answer))
+        return db_answer
+
+    ## With pending histories of the session, the answer is computed from the
+    ## state of the session loaded from the collection and the pending ones
+    def _get_db_session_answer(self, participant_phone, participant_session_id,
+                               from_state, from_db):
+        session = (participant_phone, participant_session_id)
+        def read(pending):
+            if pending == []:
+                return from_db()
+            return from_state(self._load_session_states([session], pending)[session])
+        is_session = is_session_history(participant_phone, participant_session_id)
+        return self.read_with_pending(
+            lambda history: 'dialogue-id' in history and is_session(history),
+            read)
+
+    ## The write buffer is disabled by default. The reads of a participant
+    ## session or of a history take the pending histories into account, the
+    ## buffer is flushed before the update of a pending history and before
+    ## the queries over many participants.
+    def set_write_buffer(self, max_batch, max_buffered=10000):
+        if max_batch <= 0:
+            self.write_buffer = None
+            return
+        self.write_buffer = HistoryWriteBuffer(
+            self.collection, max_batch, max_buffered, self)
+
+    def flush_write_buffer(self, is_matching=None):
+        if self.write_buffer is None:
+            return 0
+        if is_matching is None:
+            return self.write_buffer.flush()
+        return self.write_buffer.flush_matching(is_matching)
+
+    def read_with_pending(self, is_matching, read):
+        if self.write_buffer is None:
+            return read([])
+        return self.write_buffer.read(is_matching, read)
+
     def add_outgoing_simulated(self, phone, content, context, schedule):
         self.log("Simulated message has been sent to %s '%s'" % (phone, content))
         history = {
@@ -419,15 +675,96 @@ class HistoryManager(ModelManager):
         return self.save_history(**history)
 
     def count_reminders(self, participant, dialogue_id, interaction_id):
-        count = self.collection.find({
-            'participant-phone': participant['phone'],
-            'participant-session-id': participant['session-id'],
-            'message-direction': 'outgoing',
-            'dialogue-id': dialogue_id,
-            'interaction-id': interaction_id}).count()
+        count = self._get_session_answer(
+            participant['phone'], participant['session-id'],
+            lambda state: state.count_outgoings(dialogue_id, interaction_id),
+            lambda: self.collection.find({
+                'participant-phone': participant['phone'],
+                'participant-session-id': participant['session-id'],
+                'message-direction': 'outgoing',
+                'dialogue-id': dialogue_id,
+                'interaction-id': interaction_id}).count())
         return count - 1 if count > 0 else 0
 
+    ## Return for a batch of participants the interaction states of a dialogue
+    ## indexed by (phone, session-id, interaction-id) in three aggregations
+    def get_dialogue_interaction_states(self, participants, dialogue_id):
+        self.flush_write_buffer()
+        selector = {
+            'participant-phone': {'$in': [p['phone'] for p in participants]},
+            'dialogue-id': dialogue_id}
+        states = {}
+
+        def aggregate(conditions, group_by=None):
+            match = dict(selector)
+            match.update(conditions)
+            group_id = {
+                'phone': '$participant-phone',
+                'session-id': '$participant-session-id',
+                'interaction-id': '$interaction-id'}
+            if group_by is not None:
+                group_id[group_by] = '$%s' % group_by
+            pipeline = [
+                {'$match': match},
+                {'$group': {
+                    '_id': group_id,
+                    'count': {'$sum': 1},
+                    'first-timestamp': {'$min': '$timestamp'}}}]
+            for item in self.collection.aggregate(pipeline):
+                key = (item['_id']['phone'],
+                       item['_id']['session-id'],
+                       item['_id']['interaction-id'])
+                state = states.setdefault(key, {
+                    'markers': 0,
+                    'oneway-markers': 0,
+                    'outgoings': 0,
+                    'valid-answers': 0,
+                    'first-timestamp': None})
+                yield item, state
+
+        def update_first_timestamp(item, state):
+            if (state['first-timestamp'] is None
+                    or item['first-timestamp'] < state['first-timestamp']):
+                state['first-timestamp'] = item['first-timestamp']
+
+        for item, state in aggregate(
+                {'object-type': {'$in': ['oneway-marker-history',
+                                         'datepassed-marker-history']}},
+                'object-type'):
+            state['markers'] += item['count']
+            if item['_id']['object-type'] == 'oneway-marker-history':
+                state['oneway-markers'] += item['count']
+        for item, state in aggregate({'message-direction': 'outgoing'}):
+            state['outgoings'] += item['count']
+            update_first_timestamp(item, state)
+        for item, state in aggregate({'message-direction': 'incoming',
+                                      'matching-answer': {'$ne': None}}):
+            state['valid-answers'] += item['count']
+            update_first_timestamp(item, state)
+        return states
+
+    ## Batch version of get_history_of_offset_condition_answer, return the set
+    ## of (phone, session-id, interaction-id) having answered
+    def get_offset_condition_answered(self, participants, dialogue_id,
+                                      interaction_ids):
+        self.flush_write_buffer()
+        if interaction_ids == []:
+            return set()
+        cursor = self.collection.find(
+            {"participant-phone": {'$in': [p['phone'] for p in participants]},
+             "participant-session-id": {'$in': [p['session-id'] for p in participants]},
+             "message-direction": 'incoming',
+             "dialogue-id": dialogue_id,
+             "interaction-id": {'$in': interaction_ids},
+             "$or": [{'matching-answer': {'$exists': False}},
+                     {'matching-answer': {'$ne': None}}]},
+            ['participant-phone', 'participant-session-id', 'interaction-id'])
+        return set([(item['participant-phone'],
+                     item['participant-session-id'],
+                     item['interaction-id']) for item in cursor])
+
     def aggregate_count_per_day(self):
+        self.flush_write_buffer()
         pipeline = [
             {'$match': {
                 'message-direction': {'$exists': 1}}},
@@ -0,0 +1,112 @@
+# -*- test-case-name: vusion.persist.history.tests.test_history_write_buffer -*-
+from threading import Lock
+from time import time
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+
+## Write-behind buffer of history documents: the ids are allocated on
+## append and the documents are inserted by batch of max_batch, or when
+## flushed by the worker timer. The documents failing to be inserted are
+## kept in the buffer, above max_buffered the append raise the error.
+## The flushes are serialised and the reads wait for the documents being
+## inserted by another thread, so a document is either pending or in the
+## collection during a read.
+class HistoryWriteBuffer(object):
+
+    def __init__(self, collection, max_batch=500, max_buffered=10000, logger=None):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_buffered = max_buffered
+        self.logger = logger
+        self.documents = []
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.flush_count = 0
+        self.flushed_documents = 0
+        self.flush_duration = 0
+        self.max_flush_duration = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def log(self, msg, level='msg'):
+        if self.logger is not None:
+            self.logger.log(msg, level)
+
+    def append(self, document):
+        if document.get('_id', None) is None:
+            document['_id'] = ObjectId()
+        with self.lock:
+            self.documents.append(document)
+            buffered = len(self.documents)
+        if buffered >= self.max_buffered:
+            self.flush()
+        elif buffered >= self.max_batch:
+            try:
+                self.flush()
+            except Exception as e:
+                self.log("History buffer flush failed, %s documents kept: %r" % (
+                    len(self.documents), e))
+        return document['_id']
+
+    def flush(self):
+        with self.flush_lock:
+            return self._flush()
+
+    ## Flush only when some pending documents are matching
+    def flush_matching(self, is_matching):
+        with self.flush_lock:
+            with self.lock:
+                matching = any(is_matching(document) for document in self.documents)
+            if not matching:
+                return 0
+            return self._flush()
+
+    ## Return the result of read called with the pending documents matching
+    def read(self, is_matching, read):
+        with self.flush_lock:
+            with self.lock:
+                pending = [document for document in self.documents
+                           if is_matching(document)]
+            return read(pending)
+
+    def _flush(self):
+        with self.lock:
+            documents = self.documents
+            self.documents = []
+        if documents == []:
+            return 0
+        start = time()
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            ## the documents already inserted are not kept
+            failed = [error['index'] for error in e.details['writeErrors']
+                      if error['code'] != 11000]
+            self.requeue([documents[index] for index in failed])
+            raise
+        except:
+            self.requeue(documents)
+            raise
+        duration = time() - start
+        with self.lock:
+            self.flush_count += 1
+            self.flushed_documents += len(documents)
+            self.flush_duration += duration
+            self.max_flush_duration = max(self.max_flush_duration, duration)
+        return len(documents)
+
+    def requeue(self, documents):
+        with self.lock:
+            self.documents = documents + self.documents
+
+    def get_stats(self):
+        return {
+            'buffered': len(self.documents),
+            'flushes': self.flush_count,
+            'documents': self.flushed_documents,
+            'avg-flush-duration': (self.flush_duration / self.flush_count
+                                   if self.flush_count > 0 else 0),
+            'max-flush-duration': self.max_flush_duration}
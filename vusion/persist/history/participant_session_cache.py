@@ -0,0 +1,105 @@
+# -*- test-case-name: vusion.persist.history.tests.test_participant_session_cache -*-
+from collections import OrderedDict
+from threading import Lock
+
+
+MARKER_TYPES = ['oneway-marker-history', 'datepassed-marker-history']
+
+
+## Compact state of a participant session: per (dialogue-id, interaction-id)
+## the markers, the outgoing count, the valid and unmatching answer counts.
+class ParticipantSessionState(object):
+
+    def __init__(self):
+        self.markers = {}
+        self.outgoings = {}
+        self.valid_answers = {}
+        self.unmatching_answers = {}
+
+    def add_history(self, history):
+        if not 'dialogue-id' in history or not 'interaction-id' in history:
+            return
+        key = (history['dialogue-id'], history['interaction-id'])
+        if history['object-type'] in MARKER_TYPES:
+            self.markers.setdefault(key, set()).add(history['object-type'])
+        direction = history.get('message-direction', None)
+        if direction == 'outgoing':
+            self.outgoings[key] = self.outgoings.get(key, 0) + 1
+        elif direction == 'incoming':
+            if history.get('matching-answer', None) is None:
+                self.unmatching_answers[key] = self.unmatching_answers.get(key, 0) + 1
+            else:
+                self.valid_answers[key] = self.valid_answers.get(key, 0) + 1
+
+    def has_marker(self, dialogue_id, interaction_id, marker_type=None):
+        markers = self.markers.get((dialogue_id, interaction_id), set())
+        if marker_type is None:
+            return len(markers) > 0
+        return marker_type in markers
+
+    def count_outgoings(self, dialogue_id, interaction_id):
+        return self.outgoings.get((dialogue_id, interaction_id), 0)
+
+    def count_valid_answers(self, dialogue_id, interaction_id):
+        return self.valid_answers.get((dialogue_id, interaction_id), 0)
+
+    def count_unmatching_answers(self, dialogue_id, interaction_id):
+        return self.unmatching_answers.get((dialogue_id, interaction_id), 0)
+
+
+## LRU cache of participant session states indexed by (phone, session-id)
+## the lock is required as the history manager is called from the db threads.
+class ParticipantSessionCache(object):
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.states = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.mismatches = 0
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, key):
+        return key in self.states
+
+    def get(self, phone, session_id):
+        key = (phone, session_id)
+        with self.lock:
+            if not key in self.states:
+                self.misses += 1
+                return None
+            self.hits += 1
+            state = self.states.pop(key)
+            self.states[key] = state
+            return state
+
+    def set(self, phone, session_id, state):
+        key = (phone, session_id)
+        with self.lock:
+            if key in self.states:
+                self.states.pop(key)
+            self.states[key] = state
+            while len(self.states) > self.max_size:
+                self.states.popitem(last=False)
+
+    ## Only the cached sessions are updated, the others will be loaded
+    ## from the database with the history.
+    def add_history(self, history):
+        key = (history.get('participant-phone', None),
+               history.get('participant-session-id', None))
+        with self.lock:
+            if key in self.states:
+                self.states[key].add_history(history)
+
+    def clear(self):
+        with self.lock:
+            self.states.clear()
+
+    def get_stats(self):
+        return {'size': len(self.states),
+                'hits': self.hits,
+                'misses': self.misses,
+                'mismatches': self.mismatches}
@@ -358,6 +358,43 @@ class TestHistoryManager(TestCase, ObjectMaker, MessageMaker):
         self.assertEqual(old_status, 'failed')
         self.assertEqual(credits, 1)
 
+    def test_update_status_from_events(self):
+        for message_id in ['1', '2']:
+            self.history_manager.save_history(**self.mkobj_history_unattach(
+                unattach_id='2',
+                timestamp='2014-01-01T10:10:00',
+                message_id=message_id,
+                message_status='pending',
+                message_credits=1))
+        events = [
+            self.mkmsg_ack(user_message_id='1'),
+            self.mkmsg_ack(user_message_id='2'),
+            self.mkmsg_delivery(
+                user_message_id='1',
+                delivery_status='failed',
+                failure_level='http',
+                failure_code='500',
+                failure_reason='SOME INTERNAL STUFF HAPPEN'),
+            self.mkmsg_ack(user_message_id='3'),
+            self.mkmsg_delivery(user_message_id='1')]
+
+        results = self.history_manager.update_status_from_events(events)
+        self.assertEqual(
+            [('ack', 'pending', 1),
+             ('ack', 'pending', 1),
+             ('failed', 'ack', 1),
+             ('ack', None, 0),
+             ('delivered', 'failed', 1)],
+            results)
+        history = self.history_manager.find_one({'message-id': '1'})
+        self.assertEqual('delivered', history['message-status'])
+        self.assertTrue('failure-reason' in history)
+        history = self.history_manager.find_one({'message-id': '2'})
+        self.assertEqual('ack', history['message-status'])
+        self.assertEqual(
+            'delivered',
+            self.history_manager.flying_manager.get_message_data('1')[2])
+
     def test_update_status_from_event_flyingmanager_expired(self):
         history = self.mkobj_history_unattach(
             unattach_id='2',
@@ -425,6 +462,64 @@ class TestHistoryManager(TestCase, ObjectMaker, MessageMaker):
         self.assertTrue(self.history_manager.has_already_valid_answer(
             participant, '1', '1'))
 
+    def test_session_cache(self):
+        dNow = datetime.now()
+        participant = self.mkobj_participant()
+        self.history_manager.set_session_cache(10)
+
+        self.assertFalse(self.history_manager.has_marker(participant, '1', '1'))
+        self.assertEqual(0, self.history_manager.count_reminders(participant, '1', '1'))
+
+        for direction, matching_answer in [('outgoing', None),
+                                           ('outgoing', None),
+                                           ('incoming', None),
+                                           ('incoming', 'yes')]:
+            self.history_manager.save_history(**self.mkobj_history_dialogue(
+                '1', '1', time_to_vusion_format(dNow),
+                direction=direction, matching_answer=matching_answer))
+        self.history_manager.save_history(**self.mkobj_history_one_way_marker(
+            '1', '1', time_to_vusion_format(dNow)))
+
+        ## answers are only coming from the cache
+        self.history_manager.collection.remove()
+        self.assertTrue(self.history_manager.has_marker(participant, '1', '1'))
+        self.assertTrue(self.history_manager.has_oneway_marker('06', '1', '1', '1'))
+        self.assertFalse(self.history_manager.has_datepassed_marker(participant, '1', '1'))
+        self.assertEqual(1, self.history_manager.count_reminders(participant, '1', '1'))
+        self.assertTrue(self.history_manager.has_already_valid_answer(
+            participant, '1', '1', 0))
+        self.assertFalse(self.history_manager.has_already_valid_answer(
+            participant, '1', '1'))
+        self.assertEqual(
+            {'size': 1, 'hits': 7, 'misses': 1, 'mismatches': 0},
+            self.history_manager.session_cache.get_stats())
+
+    def test_session_cache_warm(self):
+        dNow = datetime.now()
+        self.history_manager.save(self.mkobj_history_datepassed_marker(
+            '1', '1', time_to_vusion_format(dNow), participant_phone='07'))
+        self.history_manager.set_session_cache(10)
+
+        self.history_manager.warm_session_cache([('06', '1'), ('07', '1')])
+
+        self.assertEqual(2, len(self.history_manager.session_cache))
+        self.assertTrue(self.history_manager.has_datepassed_marker(
+            self.mkobj_participant('07'), '1', '1'))
+        self.assertEqual(0, self.history_manager.session_cache.misses)
+
+    def test_session_cache_check(self):
+        dNow = datetime.now()
+        participant = self.mkobj_participant()
+        self.history_manager.set_session_cache(10, check=True)
+
+        self.assertFalse(self.history_manager.has_marker(participant, '1', '1'))
+        ## written without going through save_history
+        self.history_manager.save(self.mkobj_history_one_way_marker(
+            '1', '1', time_to_vusion_format(dNow)))
+
+        self.assertTrue(self.history_manager.has_marker(participant, '1', '1'))
+        self.assertEqual(1, self.history_manager.session_cache.mismatches)
+
     def test_has_marker(self):
         dNow = datetime.now()
         participant = self.mkobj_participant()
@@ -458,6 +553,52 @@ class TestHistoryManager(TestCase, ObjectMaker, MessageMaker):
                 '1',
                 '1'))
 
+    def test_get_dialogue_interaction_states(self):
+        dNow = datetime.now()
+        participants = [self.mkobj_participant('06'), self.mkobj_participant('07')]
+
+        self.history_manager.save(self.mkobj_history_dialogue(
+            '1', '1', time_to_vusion_format(dNow - timedelta(minutes=2))))
+        self.history_manager.save(self.mkobj_history_dialogue(
+            '1', '1', time_to_vusion_format(dNow - timedelta(minutes=1))))
+        self.history_manager.save(self.mkobj_history_dialogue(
+            '1', '1', time_to_vusion_format(dNow), direction='incoming',
+            matching_answer='yes'))
+        self.history_manager.save(self.mkobj_history_one_way_marker(
+            '1', '2', time_to_vusion_format(dNow), participant_phone='07'))
+        self.history_manager.save(self.mkobj_history_dialogue(
+            '2', '1', time_to_vusion_format(dNow)))
+
+        states = self.history_manager.get_dialogue_interaction_states(
+            participants, '1')
+
+        self.assertEqual(2, len(states))
+        self.assertEqual(
+            {'markers': 0, 'oneway-markers': 0, 'outgoings': 2,
+             'valid-answers': 1,
+             'first-timestamp': time_to_vusion_format(dNow - timedelta(minutes=2))},
+            states[('06', '1', '1')])
+        self.assertEqual(
+            {'markers': 1, 'oneway-markers': 1, 'outgoings': 0,
+             'valid-answers': 0, 'first-timestamp': None},
+            states[('07', '1', '2')])
+
+    def test_get_offset_condition_answered(self):
+        dNow = datetime.now()
+        participants = [self.mkobj_participant('06'), self.mkobj_participant('07')]
+
+        self.history_manager.save(self.mkobj_history_dialogue(
+            '1', '1', time_to_vusion_format(dNow), direction='incoming',
+            matching_answer='yes'))
+        self.history_manager.save(self.mkobj_history_dialogue(
+            '1', '1', time_to_vusion_format(dNow), direction='incoming',
+            participant_phone='07'))
+
+        answered = self.history_manager.get_offset_condition_answered(
+            participants, '1', ['1', '2'])
+
+        self.assertEqual(set([('06', '1', '1')]), answered)
+
     def test_get_historys(self):
         dPast = datetime.now() - timedelta(hours=2)
         dMorePast = datetime.now() - timedelta(hours=4)
@@ -555,3 +696,62 @@ class TestHistoryManager(TestCase, ObjectMaker, MessageMaker):
               'outgoing': 1}
              ],
             results)
+
+    def test_write_buffer(self):
+        dNow = datetime.now()
+        participant = self.mkobj_participant()
+        self.history_manager.set_write_buffer(10)
+
+        history_id = self.history_manager.save_history(**self.mkobj_history_dialogue(
+            '1', '1', time_to_vusion_format(dNow), direction='outgoing'))
+        self.assertEqual(0, self.history_manager.collection.count())
+
+        ## buffered histories are read from the buffer
+        self.assertEqual(
+            history_id, self.history_manager.get_history(history_id)['_id'])
+        self.assertEqual(0, self.history_manager.collection.count())
+
+        self.history_manager.save_history(**self.mkobj_history_one_way_marker(
+            '1', '1', time_to_vusion_format(dNow)))
+        self.assertTrue(self.history_manager.has_oneway_marker('06', '1', '1', '1'))
+
+        self.history_manager.save_history(**self.mkobj_history_dialogue(
+            '1', '2', time_to_vusion_format(dNow), direction='outgoing'))
+        self.assertEqual(3, self.history_manager.flush_write_buffer())
+        self.assertEqual(3, self.history_manager.collection.count())
+
+        ## buffered histories are flushed before being updated
+        history_id = self.history_manager.save_history(**self.mkobj_history_dialogue(
+            '1', '3', time_to_vusion_format(dNow), direction='outgoing',
+            message_status='pending'))
+        self.history_manager.update_status(history_id, 'ack')
+        self.assertEqual(
+            'ack', self.history_manager.find_one({'_id': history_id})['message-status'])
+
+    def test_write_buffer_burst_incoming(self):
+        dNow = datetime.now()
+        self.history_manager.set_write_buffer(100)
+
+        for phone in ['01', '02', '03', '04', '05']:
+            participant = self.mkobj_participant(participant_phone=phone)
+            self.history_manager.save_history(**self.mkobj_history_dialogue(
+                '1', '1', time_to_vusion_format(dNow), direction='incoming',
+                participant_phone=phone, matching_answer='yes'))
+            self.assertFalse(self.history_manager.has_oneway_marker(
+                phone, '1', '1', '1'))
+            self.assertTrue(self.history_manager.has_already_valid_answer(
+                participant, '1', '1', 0))
+            self.assertEqual(
+                'incoming',
+                self.history_manager.get_history_of_interaction(
+                    participant, '1', '1')['message-direction'])
+            self.assertTrue(
+                self.history_manager.get_history_of_offset_condition_answer(
+                    participant, '1', '1') is not None)
+
+        ## the incoming histories are inserted in one batch
+        self.assertEqual(0, self.history_manager.collection.count())
+        self.assertEqual(5, self.history_manager.flush_write_buffer())
+        stats = self.history_manager.write_buffer.get_stats()
+        self.assertEqual(1, stats['flushes'])
+        self.assertEqual(5, stats['documents'])
@@ -0,0 +1,102 @@
+"""Tests for vusion.persist.history.history_write_buffer"""
+from threading import Event, Thread
+
+from pymongo import MongoClient
+from bson import ObjectId
+
+from twisted.trial.unittest import TestCase
+
+from vusion.persist.history.history_write_buffer import HistoryWriteBuffer
+
+
+class TestHistoryWriteBuffer(TestCase):
+
+    def setUp(self):
+        c = MongoClient(w=1)
+        self.collection = c.test_program_db['history']
+        self.collection.drop()
+
+    def tearDown(self):
+        self.collection.drop()
+
+    def test_append_flush_by_size(self):
+        write_buffer = HistoryWriteBuffer(self.collection, max_batch=3)
+
+        ids = [write_buffer.append({'content': 'hello %s' % i}) for i in range(2)]
+        self.assertTrue(isinstance(ids[0], ObjectId))
+        self.assertEqual(2, len(write_buffer))
+        self.assertEqual(0, self.collection.count())
+
+        ids.append(write_buffer.append({'content': 'hello 3'}))
+        self.assertEqual(0, len(write_buffer))
+        self.assertEqual(3, self.collection.count())
+        self.assertEqual('hello 3', self.collection.find_one({'_id': ids[2]})['content'])
+
+        write_buffer.append({'content': 'hello 4'})
+        self.assertEqual(1, write_buffer.flush())
+        self.assertEqual(0, write_buffer.flush())
+        stats = write_buffer.get_stats()
+        self.assertEqual(2, stats['flushes'])
+        self.assertEqual(4, stats['documents'])
+        self.assertEqual(0, stats['buffered'])
+
+    def test_flush_failure(self):
+        write_buffer = HistoryWriteBuffer(self.collection, max_batch=2, max_buffered=3)
+        insert_many = self.collection.insert_many
+        def failing_insert_many(documents, ordered=True):
+            raise Exception('database down')
+        self.collection.insert_many = failing_insert_many
+
+        ## the documents are kept until max buffered is reached
+        write_buffer.append({'content': 'hello 1'})
+        write_buffer.append({'content': 'hello 2'})
+        self.assertEqual(2, len(write_buffer))
+        self.assertRaises(Exception, write_buffer.append, {'content': 'hello 3'})
+        self.assertEqual(3, len(write_buffer))
+
+        self.collection.insert_many = insert_many
+        self.assertEqual(3, write_buffer.flush())
+        self.assertEqual(3, self.collection.count())
+
+    def test_flush_wait_inflight_insert(self):
+        write_buffer = HistoryWriteBuffer(self.collection)
+        insert_many = self.collection.insert_many
+        inserting, insert_done = Event(), Event()
+        def slow_insert_many(documents, ordered=True):
+            inserting.set()
+            insert_done.wait(5)
+            return insert_many(documents, ordered=ordered)
+        self.collection.insert_many = slow_insert_many
+
+        write_buffer.append({'content': 'hello 1'})
+        flusher = Thread(target=write_buffer.flush)
+        flusher.start()
+        inserting.wait(5)
+
+        ## the reader flush returns once the document is inserted
+        reader = Thread(target=write_buffer.flush)
+        reader.start()
+        reader.join(0.2)
+        self.assertTrue(reader.is_alive())
+        insert_done.set()
+        reader.join(5)
+        flusher.join(5)
+        self.assertEqual(1, self.collection.count())
+
+    def test_read_and_flush_matching(self):
+        write_buffer = HistoryWriteBuffer(self.collection)
+        write_buffer.append({'participant-phone': '+1'})
+        write_buffer.append({'participant-phone': '+2'})
+
+        is_matching = lambda document: document['participant-phone'] == '+1'
+        pending, count = write_buffer.read(
+            is_matching, lambda pending: (pending, self.collection.count()))
+        self.assertEqual(['+1'], [d['participant-phone'] for d in pending])
+        self.assertEqual(0, count)
+
+        self.assertEqual(
+            0, write_buffer.flush_matching(
+                lambda document: document['participant-phone'] == '+3'))
+        self.assertEqual(2, len(write_buffer))
+        self.assertEqual(2, write_buffer.flush_matching(is_matching))
+        self.assertEqual(2, self.collection.count())
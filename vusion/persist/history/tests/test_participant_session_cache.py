@@ -0,0 +1,64 @@
+"""Tests for vusion.persist.history.participant_session_cache"""
+from twisted.trial.unittest import TestCase
+
+from vusion.persist.history.participant_session_cache import (
+    ParticipantSessionCache, ParticipantSessionState)
+
+
+class TestParticipantSessionState(TestCase):
+
+    def test_add_history(self):
+        state = ParticipantSessionState()
+        state.add_history({
+            'object-type': 'dialogue-history',
+            'dialogue-id': '1',
+            'interaction-id': '1',
+            'message-direction': 'incoming',
+            'matching-answer': None})
+        state.add_history({
+            'object-type': 'datepassed-marker-history',
+            'dialogue-id': '1',
+            'interaction-id': '2'})
+        state.add_history({
+            'object-type': 'unattach-history',
+            'message-direction': 'outgoing'})
+
+        self.assertEqual(1, state.count_unmatching_answers('1', '1'))
+        self.assertEqual(0, state.count_valid_answers('1', '1'))
+        self.assertFalse(state.has_marker('1', '1'))
+        self.assertTrue(state.has_marker('1', '2'))
+        self.assertFalse(state.has_marker('1', '2', 'oneway-marker-history'))
+
+
+class TestParticipantSessionCache(TestCase):
+
+    def test_lru_eviction(self):
+        cache = ParticipantSessionCache(max_size=2)
+        cache.set('01', '1', ParticipantSessionState())
+        cache.set('02', '1', ParticipantSessionState())
+        self.assertTrue(cache.get('01', '1') is not None)
+        cache.set('03', '1', ParticipantSessionState())
+
+        self.assertTrue(('01', '1') in cache)
+        self.assertFalse(('02', '1') in cache)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(None, cache.get('02', '1'))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_add_history_only_cached_session(self):
+        cache = ParticipantSessionCache()
+        cache.set('01', '1', ParticipantSessionState())
+        history = {
+            'object-type': 'dialogue-history',
+            'participant-phone': '01',
+            'participant-session-id': '1',
+            'dialogue-id': '1',
+            'interaction-id': '1',
+            'message-direction': 'outgoing'}
+        cache.add_history(history)
+        history['participant-phone'] = '02'
+        cache.add_history(history)
+
+        self.assertEqual(1, cache.get('01', '1').count_outgoings('1', '1'))
+        self.assertFalse(('02', '1') in cache)
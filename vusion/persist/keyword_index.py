@@ -0,0 +1,46 @@
+# -*- test-case-name: vusion.persist.tests.test_keyword_index -*-
+
+
+## Index from a cleaned keyword to the owners (dialogue or request) using it.
+## In case several owners share a keyword, the precedence is given at lookup
+## by the owners iteration order so the result is the same as a linear scan.
+class KeywordIndex(object):
+
+    def __init__(self):
+        self.keywords = {}
+        self.owners = {}
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def add(self, owner_id, keywords):
+        self.remove(owner_id)
+        self.owners[owner_id] = []
+        for keyword in keywords:
+            if keyword in self.owners[owner_id]:
+                continue
+            self.owners[owner_id].append(keyword)
+            self.keywords.setdefault(keyword, set()).add(owner_id)
+
+    def remove(self, owner_id):
+        for keyword in self.owners.pop(owner_id, []):
+            owner_ids = self.keywords[keyword]
+            owner_ids.discard(owner_id)
+            if len(owner_ids) == 0:
+                del self.keywords[keyword]
+
+    def clear(self):
+        self.keywords.clear()
+        self.owners.clear()
+
+    def get(self, keyword, owners_order):
+        owner_ids = self.keywords.get(keyword, None)
+        if owner_ids is None:
+            return None
+        if len(owner_ids) == 1:
+            owner_id = iter(owner_ids).next()
+            return owner_id if owner_id in owners_order else None
+        for owner_id in owners_order:
+            if owner_id in owner_ids:
+                return owner_id
+        return None
@@ -9,6 +9,12 @@ class Model(object):
 
     fields = []
 
+    ## During a trusted construction the validation rules are skipped
+    is_trusted = False
+
+    ## The validation rules sorted once for each fields dict
+    compiled_rules = {}
+
     def __init__(self, **kwargs):
         if kwargs == {}:
             kwargs = self.create_instance()
@@ -24,6 +30,20 @@ class Model(object):
         self.before_validate()
         self.validate_fields()
 
+    ## Instanciate a document read from the database, at the current model
+    ## version the upgrade and the validation rules are skipped.
+    @classmethod
+    def from_trusted(cls, **kwargs):
+        if kwargs.get('model-version', None) != cls.MODEL_VERSION:
+            return cls(**kwargs)
+        instance = cls.__new__(cls)
+        instance.is_trusted = True
+        try:
+            instance.__init__(**kwargs)
+        finally:
+            del instance.is_trusted
+        return instance
+
     def __eq__(self, other):
         if isinstance(other, Model):
             return self.payload == other.payload
@@ -95,17 +115,29 @@ class Model(object):
         pass    
 
     def _validate(self, data, field_rules):
-        for field, rules in field_rules.items():
-            if rules['required'] is False and not field in data:
+        if self.is_trusted:
+            return
+        for field, required, rules in self._get_compiled_rules(field_rules):
+            if required is False and not field in data:
                 continue
-            elif rules['required'] and not field in data:
+            elif required and not field in data:
                 raise MissingField("%s is missing" % field)
-            for rule_name, rule in iter(sorted(rules.iteritems())):
-                if rule_name is 'required':
-                    continue
+            for rule_name, rule in rules:
                 if not rule(data):
                     raise InvalidField("%s=%s is not %s" % (field, data[field], rule_name))
 
+    def _get_compiled_rules(self, field_rules):
+        compiled = Model.compiled_rules.get(id(field_rules), None)
+        if compiled is None or compiled[0] is not field_rules:
+            compiled = (field_rules, [
+                (field,
+                 rules['required'],
+                 [(rule_name, rule) for rule_name, rule in sorted(rules.iteritems())
+                  if rule_name != 'required'])
+                for field, rules in field_rules.items()])
+            Model.compiled_rules[id(field_rules)] = compiled
+        return compiled[1]
+
     def required_subfields(self, field, subfields):
         if field is None:
             return True
@@ -1,5 +1,76 @@
 from datetime import datetime
 
+from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadable import isInIOThread
+from twisted.python.threadpool import ThreadPool
+
+
+DB_THREAD_POOL_SIZE = 10
+db_thread_pool = None
+
+
+## Bounded thread pool shared by all the managers of the process, so that
+## the blocking pymongo calls of every program are not run by the reactor.
+def get_db_thread_pool():
+    global db_thread_pool
+    if db_thread_pool is None:
+        db_thread_pool = ThreadPool(1, DB_THREAD_POOL_SIZE, 'vusion-db')
+        db_thread_pool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', db_thread_pool.stop)
+    return db_thread_pool
+
+
+def set_db_thread_pool_size(max_size):
+    global DB_THREAD_POOL_SIZE
+    DB_THREAD_POOL_SIZE = max_size
+    if db_thread_pool is not None:
+        db_thread_pool.adjustPoolsize(maxthreads=max_size)
+
+
+## Deferred-returning version of a manager: manager.deferred.method(...)
+## run manager.method(...) in the db thread pool. Outside the reactor
+## thread (ie control in deferToThread) the method is simply called.
+class DeferredManager(object):
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getattr__(self, attr):
+        method = getattr(self.manager, attr)
+        def deferred_method(*args, **kwargs):
+            if not isInIOThread():
+                return maybeDeferred(method, *args, **kwargs)
+            return deferToThreadPool(
+                reactor, get_db_thread_pool(), method, *args, **kwargs)
+        return deferred_method
+
+
+## Collection timing its queries with the metrics of the worker, the
+## queries are named <collection>.<method>. The cursors being lazy, only
+## the call of a find is timed.
+class MetricsCollection(object):
+
+    def __init__(self, collection, metrics):
+        self.collection = collection
+        self.metrics = metrics
+
+    def __getattr__(self, attr):
+        orig_attr = getattr(self.collection, attr)
+        if not callable(orig_attr):
+            return orig_attr
+        name = '%s.%s' % (self.collection.name, attr)
+        def timed(*args, **kwargs):
+            return self.metrics.call(name, orig_attr, *args, **kwargs)
+        return timed
+
+    def __getitem__(self, key):
+        return self.collection[key]
+
+    def __eq__(self, other):
+        return self.collection == other
+
 
 class ModelManager(object):
 
@@ -8,6 +79,7 @@ class ModelManager(object):
         self.log_helper = None
         self.collection_name = collection_name
         self.db = db
+        self.deferred = DeferredManager(self)
         if 'logger' in kwargs:
             self.log_helper = kwargs['logger']
         if collection_name in self.db.collection_names():
@@ -42,8 +114,14 @@ class ModelManager(object):
     def set_log_helper(self, log_helper):
         self.log_helper = log_helper
 
+    def set_metrics(self, metrics):
+        if isinstance(self.collection, MetricsCollection):
+            self.collection = self.collection.collection
+        if metrics is not None:
+            self.collection = MetricsCollection(self.collection, metrics)
+
     def __getattr__(self,attr):
-        orig_attr = self.collection.__getattribute__(attr)
+        orig_attr = getattr(self.collection, attr)
         if callable(orig_attr):
             def hooked(*args, **kwargs):
                 result = orig_attr(*args, **kwargs)
@@ -55,6 +55,10 @@ class Participant(Model):
         'any-subconditions': '$or'}
 
     def validate_fields(self):
+        if self.is_trusted:
+            for field in self.FIELDS_THAT_SHOULD_BE_ARRAY:
+                self.modify_field_that_should_be_array(field)
+            return
         super(Participant, self).validate_fields()
         for field, check in self.PARTICIPANT_FIELDS.items():
             self.assert_field_present(field)
@@ -0,0 +1,103 @@
+# -*- test-case-name: vusion.persist.participant.tests.test_participant_manager -*-
+from collections import OrderedDict
+from threading import Lock
+from time import time
+
+
+## LRU cache of the participants indexed by phone, the missing participants
+## are cached as None. As the participants are also edited by the frontend,
+## the cached ones expire after ttl seconds (0 never expire). The phones
+## in a scope, a message being handled, keep their loaded participant
+## until the scope is closed even when the LRU is disabled (max_size 0).
+## The lock is required as the manager is called from the db threads.
+class ParticipantCache(object):
+
+    def __init__(self, max_size=0, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.participants = OrderedDict()
+        self.scopes = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.participants)
+
+    def open_scope(self, phone):
+        with self.lock:
+            if phone in self.scopes:
+                self.scopes[phone][0] += 1
+            else:
+                self.scopes[phone] = [1, False, None]
+
+    def close_scope(self, phone):
+        with self.lock:
+            if phone not in self.scopes:
+                return
+            self.scopes[phone][0] -= 1
+            if self.scopes[phone][0] <= 0:
+                self.scopes.pop(phone)
+
+    ## return a tuple (is_cached, participant)
+    def get(self, phone):
+        with self.lock:
+            scope = self.scopes.get(phone, None)
+            if scope is not None and scope[1]:
+                self.hits += 1
+                return True, scope[2]
+            if phone not in self.participants:
+                self.misses += 1
+                return False, None
+            cached_time, participant = self.participants.pop(phone)
+            if self.ttl > 0 and time() - cached_time > self.ttl:
+                self.misses += 1
+                return False, None
+            self.participants[phone] = (cached_time, participant)
+            self.hits += 1
+            if scope is not None:
+                scope[1], scope[2] = True, participant
+            return True, participant
+
+    def set(self, phone, participant):
+        with self.lock:
+            scope = self.scopes.get(phone, None)
+            if scope is not None:
+                scope[1], scope[2] = True, participant
+            if self.max_size <= 0:
+                return
+            self.participants.pop(phone, None)
+            self.participants[phone] = (time(), participant)
+            while len(self.participants) > self.max_size:
+                self.participants.popitem(last=False)
+
+    ## Update in place the cached participant, if any
+    def update(self, phone, key, value):
+        with self.lock:
+            scope = self.scopes.get(phone, None)
+            if scope is not None and scope[2] is not None:
+                scope[2][key] = value
+            if phone in self.participants and self.participants[phone][1] is not None:
+                self.participants[phone][1][key] = value
+
+    def invalidate(self, phone):
+        with self.lock:
+            scope = self.scopes.get(phone, None)
+            if scope is not None:
+                scope[1], scope[2] = False, None
+            self.participants.pop(phone, None)
+
+    def clear(self):
+        with self.lock:
+            for scope in self.scopes.itervalues():
+                scope[1], scope[2] = False, None
+            self.participants.clear()
+
+    def get_stats(self):
+        requests = self.hits + self.misses
+        return {'size': len(self.participants),
+                'scopes': len(self.scopes),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit-ratio': (float(self.hits) / requests if requests > 0 else 0),
+                'saved-queries': self.hits}
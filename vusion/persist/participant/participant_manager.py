@@ -13,6 +13,7 @@ from twisted.internet.defer import returnValue, inlineCallbacks
 from vusion.utils import time_to_vusion_format
 from vusion.persist import Participant, ModelManager
 from vusion.persist.cursor_instanciator import CursorInstanciator
+from vusion.persist.participant.participant_cache import ParticipantCache
 
 
 class ParticipantManager(ModelManager):
@@ -20,6 +21,41 @@ class ParticipantManager(ModelManager):
     def __init__(self, db, collection_name, **kwargs):
         super(ParticipantManager, self).__init__(db, collection_name, True, **kwargs)
         self.collection.ensure_index('phone', background=True)
+        self.cache = ParticipantCache()
+
+    ## The cache is disabled by default, only the participants of the
+    ## opened scopes are kept.
+    def set_cache(self, max_size, ttl=60):
+        self.cache = ParticipantCache(max_size, ttl)
+
+    def open_scope(self, participant_phone):
+        self.cache.open_scope(participant_phone)
+
+    def close_scope(self, participant_phone):
+        self.cache.close_scope(participant_phone)
+
+    def get_cache_stats(self):
+        return self.cache.get_stats()
+
+    def save(self, *args, **kwargs):
+        self.cache.clear()
+        return self.collection.save(*args, **kwargs)
+
+    def insert(self, *args, **kwargs):
+        self.cache.clear()
+        return self.collection.insert(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.cache.clear()
+        return self.collection.update(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        self.cache.clear()
+        return self.collection.remove(*args, **kwargs)
+
+    def drop(self):
+        self.cache.clear()
+        super(ParticipantManager, self).drop()
 
     ## return False if the participant is already optin
     def opting_in(self, participant_phone, simulated=False):
@@ -55,12 +91,14 @@ class ParticipantManager(ModelManager):
                       'tags': [],
                       'enrolled': [],
                       'profile': []}})
+        self.cache.invalidate(participant_phone)
 
     def opting_out(self, participant_phone):
         self.collection.update(
             {'phone': participant_phone},
             {'$set': {'session-id': None,
                       'last-optout-date': time_to_vusion_format(self.get_local_time())}})
+        self.cache.invalidate(participant_phone)
 
     def tagging(self, participant_phone, tag):
         self.collection.update(
@@ -68,6 +106,7 @@ class ParticipantManager(ModelManager):
              'session-id': {'$ne': None},
              'tags': {'$ne': tag}},
             {'$push': {'tags': tag}})
+        self.cache.invalidate(participant_phone)
 
     def enrolling(self, participant_phone, dialogue_id):
         self.enrolling_participants(
@@ -83,6 +122,10 @@ class ParticipantManager(ModelManager):
                 'dialogue-id': dialogue_id,
                 'date-time': self.get_local_time("vusion")}}},
             multi=multi)
+        if 'phone' in query and isinstance(query['phone'], basestring):
+            self.cache.invalidate(query['phone'])
+        else:
+            self.cache.clear()
     
     def labelling(self, participant_phone, label, value, raw):
         self.collection.update(
@@ -95,27 +138,35 @@ class ParticipantManager(ModelManager):
             {'$push': {'profile': {'label': label,
                                    'value': value,
                                    'raw': raw}}})
+        self.cache.invalidate(participant_phone)
 
 
     def save_transport_metadata(self, participant_phone, transport_metadata):
         self.collection.update(
             {'phone': participant_phone},
             {'$set': {'transport_metadata': transport_metadata}})
+        if isinstance(transport_metadata, dict):
+            self.cache.update(
+                participant_phone, 'transport_metadata', transport_metadata)
+        else:
+            self.cache.invalidate(participant_phone)
 
     def save_participant(self, participant):
         if not isinstance(participant, Participant):
             participant = Participant(**participant)
+        self.cache.invalidate(participant['phone'])
         return self.save_document(participant)
 
+    ## The participant is loaded from the cache or the database whatever
+    ## only_optin, so the cached participant is the same in both cases.
     def get_participant(self, participant_phone, only_optin=False):
         try:
-            query = {'phone':participant_phone}
-            if only_optin:
-                query.update({'session-id':{'$ne': None}})
-            return Participant(**self.collection.find_one(query))
-        except TypeError:
-            self.log("Participant phone %s is either not optin or not in collection." % participant_phone)
-            return None
+            is_cached, participant = self.cache.get(participant_phone)
+            if not is_cached:
+                participant = self.collection.find_one({'phone': participant_phone})
+                if participant is not None:
+                    participant = Participant.from_trusted(**participant)
+                self.cache.set(participant_phone, participant)
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             self.log(
@@ -123,12 +174,17 @@ class ParticipantManager(ModelManager):
                 (participant_phone,
                  traceback.format_exception(exc_type, exc_value, exc_traceback)))
             return None
+        if participant is None or (only_optin and participant['session-id'] is None):
+            self.log("Participant phone %s is either not optin or not in collection." % participant_phone)
+            return None
+        return participant
 
-    def get_participants(self, query=None, sort=None):
+    def get_participants(self, query=None, sort=None, limit=0):
         def log(exception, item=None):
             self.log("Exception %r while instanciating a participant %r" % (exception, item))
         return CursorInstanciator(
-            self.collection.find(query, sort=sort), Participant, [log])
+            self.collection.find(query, sort=sort, limit=limit),
+            Participant.from_trusted, [log])
 
     @inlineCallbacks
     def get_labels(self, query=None):
@@ -159,6 +215,9 @@ class ParticipantManager(ModelManager):
         return 0 < self.collection.find(query).limit(1).count()
 
     def is_optin(self, participant_phone):
+        is_cached, participant = self.cache.get(participant_phone)
+        if is_cached:
+            return participant is not None and participant['session-id'] is not None
         query = {'phone':participant_phone,
                  'session-id': {'$ne': None}}
         return 0 != self.collection.find(query).limit(1).count()
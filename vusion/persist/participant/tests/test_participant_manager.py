@@ -374,3 +374,48 @@ class TestParticipantManager(TestCase, ObjectMaker):
                   'opt-out': 0.0}}
              ],
             results)
+
+    def test_cache(self):
+        self.manager.set_cache(10, ttl=0)
+        self.manager.save(self.mkobj_participant('1'))
+
+        participant = self.manager.get_participant('1')
+        self.assertTrue(participant is self.manager.get_participant('1', True))
+        self.assertTrue(self.manager.is_optin('1'))
+        self.assertTrue(self.manager.get_participant('2') is None)
+        self.assertTrue(self.manager.get_participant('2') is None)
+
+        ## write-through from the mutating methods
+        self.manager.tagging('1', 'geek')
+        self.assertEqual(['geek'], self.manager.get_participant('1')['tags'])
+        self.manager.labelling('1', 'gender', 'male', 'gender male')
+        self.assertEqual('male', self.manager.get_participant('1').get_data('gender'))
+        self.manager.save_transport_metadata('1', {'token': '11'})
+        self.assertEqual(
+            {'token': '11'},
+            self.manager.get_participant('1')['transport_metadata'])
+        self.manager.opting_out('1')
+        self.assertTrue(self.manager.get_participant('1', True) is None)
+        self.assertFalse(self.manager.is_optin('1'))
+
+        stats = self.manager.get_cache_stats()
+        self.assertEqual(stats['misses'], 5)
+        self.assertEqual(stats['hits'], 5)
+        self.assertEqual(stats['hit-ratio'], 0.5)
+
+    def test_cache_scope(self):
+        self.manager.save(self.mkobj_participant('1'))
+
+        ## without scope, the cache is disabled by default
+        participant = self.manager.get_participant('1')
+        self.assertFalse(participant is self.manager.get_participant('1'))
+
+        self.manager.open_scope('1')
+        participant = self.manager.get_participant('1')
+        self.assertTrue(participant is self.manager.get_participant('1'))
+        self.manager.enrolling('1', '01')
+        self.assertTrue(self.manager.get_participant('1').is_enrolled('01'))
+        self.manager.close_scope('1')
+
+        self.assertEqual(self.manager.get_cache_stats()['scopes'], 0)
+        self.assertEqual(len(self.manager.cache), 0)
@@ -2,7 +2,8 @@ import sys, traceback
 
 from bson.objectid import ObjectId
 
-from vusion.persist import ModelManager, Request
+from vusion.persist import ModelManager, Request, KeywordIndex
+from vusion.utils import clean_keyword, get_first_msg_word
 
 
 class RequestManager(ModelManager):
@@ -11,27 +12,94 @@ class RequestManager(ModelManager):
         super(RequestManager, self).__init__(db, collection_name, **kwargs)
         #NO index on the request collection
         self.loaded_requests = {}
+        self.keyphrase_index = KeywordIndex()
+        self.lazy_keyword_index = KeywordIndex()
+        self.loaded_version = None
+        self.is_loaded_dirty = False
+        self.cache_hits = 0
+        self.cache_reloads = 0
         self.load_requests()
 
     def load_requests(self):
+        self.loaded_requests.clear()
+        self.keyphrase_index.clear()
+        self.lazy_keyword_index.clear()
         requests = self.find()
         for request in requests:
             request = Request(**request)
-            self.loaded_requests[str(request['_id'])] = request
+            self._set_loaded_request(str(request['_id']), request)
+        self.loaded_version = self.get_version()
+        self.is_loaded_dirty = False
+        self.cache_reloads += 1
 
     def load_request(self, request_id):
         request = self.find_one({'_id': ObjectId(request_id)})
         if request is None:
-            self.loaded_requests.pop(request_id)
+            self.loaded_requests.pop(request_id, None)
+            self.keyphrase_index.remove(request_id)
+            self.lazy_keyword_index.remove(request_id)
         else:
             request = Request(**request)
-            self.loaded_requests.update({request_id: request})
+            self._set_loaded_request(request_id, request)
+        self.loaded_version = self.get_version()
+        self.cache_reloads += 1
 
+    def _set_loaded_request(self, request_id, request):
+        self.loaded_requests.update({request_id: request})
+        self.keyphrase_index.add(request_id, request.matching_keyphrases)
+        if request.is_lazy_matching():
+            self.lazy_keyword_index.add(request_id, request.matching_keywords)
+        else:
+            self.lazy_keyword_index.remove(request_id)
+
+    ## The loaded requests are only reloaded on a control message or when
+    ## written through this manager, no database read on the hot path.
     def get_requests(self):
-        if len(self.loaded_requests) != self.count():
+        if self.is_loaded_dirty:
             self.load_requests()
+        else:
+            self.cache_hits += 1
         return self.loaded_requests
 
+    ## The version stamp of the requests: their count and the most recent
+    ## modified stamp, which the frontend bump on every save.
+    def get_version(self):
+        cursor = self.find({}, ['modified']).sort('modified', -1).limit(1)
+        modifieds = [request.get('modified', None) for request in cursor]
+        return (self.count(), modifieds[0] if modifieds != [] else None)
+
+    ## Polled by the daemon in case a control message has been lost.
+    def check_version(self):
+        if self.get_version() == self.loaded_version:
+            return False
+        self.log("Requests have been modified, reloading all requests.")
+        self.load_requests()
+        return True
+
+    def get_cache_stats(self):
+        return {'hits': self.cache_hits,
+                'reloads': self.cache_reloads}
+
+    def save(self, *args, **kwargs):
+        self.is_loaded_dirty = True
+        return self.collection.save(*args, **kwargs)
+
+    def insert(self, *args, **kwargs):
+        self.is_loaded_dirty = True
+        return self.collection.insert(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.is_loaded_dirty = True
+        return self.collection.update(*args, **kwargs)
+
+    def remove(self, *args, **kwargs):
+        self.is_loaded_dirty = True
+        return self.collection.remove(*args, **kwargs)
+
+    def drop(self):
+        self.is_loaded_dirty = True
+        super(RequestManager, self).drop()
+
     def get_all_keywords(self):
         keywords = []
         requests = self.get_requests()
@@ -44,15 +112,13 @@ class RequestManager(ModelManager):
     def get_matching_request_actions(self, message_content, actions, context):
         requests = self.get_requests()
         # keyphrase matching
-        for request_id, request in requests.iteritems():
-            if request.is_matching(message_content):
-                actions.extend(request.get_actions())
-                context.update({'request-id': ObjectId(request_id)})  
-                return
-
+        request_id = self.keyphrase_index.get(
+            clean_keyword(message_content), requests)
         # keyword/lazy matching
-        for request_id, request in requests.iteritems():
-            if request.is_matching(message_content, False):
-                actions.extend(request.get_actions())
-                context.update({'request-id': ObjectId(request_id)})
-                return
+        if request_id is None:
+            request_id = self.lazy_keyword_index.get(
+                clean_keyword(get_first_msg_word(message_content)), requests)
+        if request_id is None:
+            return
+        actions.extend(requests[request_id].get_actions())
+        context.update({'request-id': ObjectId(request_id)})
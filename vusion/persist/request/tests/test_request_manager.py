@@ -1,5 +1,8 @@
+from datetime import datetime
+
 from pymongo import MongoClient
 from bson.objectid import ObjectId
+from bson.timestamp import Timestamp
 
 from twisted.trial.unittest import TestCase
 
@@ -92,3 +95,51 @@ class TestRequestManager(TestCase, ObjectMaker):
         self.assertEqual(1, len(actions))
         self.assertTrue(isinstance(actions[0], FeedbackAction))
         self.assertEqual(context['request-id'], lazy_id)
+
+    def test_get_matching_request_actions_after_load_request(self):
+        request_id = self.request_manager.save(self.mkobj_request_join())
+        self.request_manager.load_requests()
+        request_leave = self.mkobj_request_leave()
+        request_leave['_id'] = request_id
+        self.request_manager.save(request_leave)
+        self.request_manager.load_request(str(request_id))
+
+        actions = Actions()
+        context = Context()
+        self.request_manager.get_matching_request_actions("www", actions, context)
+        self.assertEqual(0, len(actions))
+
+        self.request_manager.get_matching_request_actions("quit", actions, context)
+        self.assertEqual(context['request-id'], request_id)
+
+    def test_get_requests_cache(self):
+        self.request_manager.save(self.mkobj_request_join())
+        self.request_manager.get_requests()
+        stats = self.request_manager.get_cache_stats()
+
+        ## no database read as long as the requests are not modified
+        for i in range(3):
+            self.assertEqual(len(self.request_manager.get_requests()), 1)
+        self.assertEqual(
+            self.request_manager.get_cache_stats(),
+            {'hits': stats['hits'] + 3, 'reloads': stats['reloads']})
+
+        ## modified by another process, only reloaded on control or version check
+        request_id = self.request_manager.collection.save(self.mkobj_request_leave())
+        self.assertEqual(len(self.request_manager.get_requests()), 1)
+        self.request_manager.load_request(str(request_id))
+        self.assertEqual(len(self.request_manager.get_requests()), 2)
+        self.assertFalse(self.request_manager.check_version())
+
+        self.request_manager.collection.remove(request_id)
+        self.assertTrue(self.request_manager.check_version())
+        self.assertEqual(len(self.request_manager.get_requests()), 1)
+        self.assertEqual(
+            self.request_manager.get_cache_stats()['reloads'], stats['reloads'] + 2)
+
+        ## edited in place by another process
+        self.request_manager.collection.update(
+            {}, {'$set': {'keyword': 'www', 'modified': Timestamp(datetime.now(), 0)}})
+        self.assertTrue(self.request_manager.check_version())
+        self.assertEqual(
+            self.request_manager.get_requests().values()[0]['keyword'], 'www')
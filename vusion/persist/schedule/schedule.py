@@ -6,6 +6,7 @@ from vusion.persist.action import action_generator
 from vusion.persist import Model
 from vusion.context import Context
 from vusion.utils import time_from_vusion_format, time_to_vusion_format
+from vusion.const import DATE_TIME_REGEX
 
 
 class Schedule(Model):
@@ -21,7 +22,7 @@ class Schedule(Model):
         'date-time': {
             'required': True,
             'valid_string': lambda v: isinstance(v['date-time'], basestring),
-            'valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+)(:0?(\d+))$'), v['date-time'])
+            'valid_value': lambda v: re.match(DATE_TIME_REGEX, v['date-time'])
             },
         }
 
@@ -40,6 +41,9 @@ class Schedule(Model):
         if isinstance(date_time, datetime):
             date_time = time_to_vusion_format(date_time)
         self['date-time'] = date_time
+        ## a rescheduled schedule is released from the sender claim
+        self.payload.pop('claim-id', None)
+        self.payload.pop('claim-time', None)
         self.validate_fields()
 
     def is_message(self):
@@ -148,6 +152,45 @@ class UnattachSchedule(MessageSchedule):
         return 'unattach-history'
 
 
+## A single schedule of an unattached message sent to all or a selection of
+## participants, it's expanded by batch of participants at sending time.
+class BroadcastSchedule(Schedule):
+
+    MODEL_TYPE = 'broadcast-schedule'
+    MODEL_VERSION = '2'
+
+    fields = {
+        'date-time': Schedule.fields['date-time'],
+        'unattach-id': {
+            'required': True
+            },
+        'last-participant-id': {
+            'required': True
+            },
+        'participant-count': {
+            'required': True
+            },
+        }
+
+    def before_validate(self):
+        self.payload.setdefault('last-participant-id', None)
+        self.payload.setdefault('participant-count', None)
+
+    def validate_fields(self):
+        self._validate(self, BroadcastSchedule.fields)
+
+    def is_started(self):
+        return self['participant-count'] is not None
+
+    ## the participants of an unattached message expanded one after the other
+    def generate_unattach_schedule(self, participant):
+        return UnattachSchedule(**{
+            'participant-phone': participant['phone'],
+            'participant-session-id': participant['session-id'],
+            'unattach-id': self['unattach-id'],
+            'date-time': self['date-time']})
+
+
 class FeedbackSchedule(MessageSchedule):
 
     MODEL_TYPE = 'feedback-schedule'
@@ -198,16 +241,27 @@ class ActionSchedule(Schedule):
 
 
 def schedule_generator(**kwargs):
+    return get_schedule_class(kwargs)(**kwargs)
+
+
+## Instanciate a schedule read from the database
+def trusted_schedule_generator(**kwargs):
+    return get_schedule_class(kwargs).from_trusted(**kwargs)
+
+
+def get_schedule_class(kwargs):
     if kwargs['object-type'] == 'dialogue-schedule':
-        return DialogueSchedule(**kwargs)
+        return DialogueSchedule
     elif kwargs['object-type'] == 'deadline-schedule':
-        return DeadlineSchedule(**kwargs)
+        return DeadlineSchedule
     elif kwargs['object-type'] == 'reminder-schedule':
-        return ReminderSchedule(**kwargs)
+        return ReminderSchedule
     elif kwargs['object-type'] == 'unattach-schedule':
-        return UnattachSchedule(**kwargs)
+        return UnattachSchedule
+    elif kwargs['object-type'] == 'broadcast-schedule':
+        return BroadcastSchedule
     elif kwargs['object-type'] == 'feedback-schedule':
-        return FeedbackSchedule(**kwargs)
+        return FeedbackSchedule
     elif kwargs['object-type'] == 'action-schedule':
-        return ActionSchedule(**kwargs)
+        return ActionSchedule
     raise VusionError("%s not supported" % kwargs['object-type'])
@@ -1,23 +1,93 @@
 import sys, traceback
+from datetime import timedelta
 from bson import ObjectId
 
 from twisted.internet.threads import deferToThread
 from twisted.internet.defer import returnValue, inlineCallbacks, Deferred
 
 from vusion.persist.cursor_instanciator import CursorInstanciator
-from vusion.persist import ModelManager, schedule_generator
+from vusion.utils import time_to_vusion_format
+from vusion.persist import (
+    ModelManager, schedule_generator, trusted_schedule_generator)
+from vusion.persist.schedule.schedule_timer import ScheduleTimer
 from vusion.persist.schedule.schedule import (
     Schedule, UnattachSchedule, DeadlineSchedule, ReminderSchedule,
-    ActionSchedule, DialogueSchedule)
+    ActionSchedule, DialogueSchedule, BroadcastSchedule)
 
 
 class ScheduleManager(ModelManager):
 
+    CLAIM_TIMEOUT = 10  #in minutes
+    TIMER_RESYNC_LIMIT = 100
+
     def __init__(self, db, collection_name, **kwargs):
         super(ScheduleManager, self).__init__(db, collection_name, **kwargs)
         self.collection.ensure_index('date-time', background=True)
         self.collection.ensure_index([
             ('participant-phone',1), ('interaction-id', 1)], background=True)
+        self.timer = ScheduleTimer()
+        self.queue = None
+
+    def set_timer(self, resync_interval, max_size=10000):
+        self.timer = ScheduleTimer(resync_interval, max_size)
+
+    ## Mirror the schedules in a queue shared by several workers
+    def set_queue(self, queue):
+        self.queue = queue
+
+    def push_schedules(self, schedules):
+        documents = [schedule.payload if isinstance(schedule, Schedule) else schedule
+                     for schedule in schedules]
+        for document in documents:
+            self.timer.push(document.get('date-time', None))
+        if self.queue is not None:
+            self.queue.push_many([
+                (document['_id'], document.get('participant-phone', None),
+                 document['date-time'])
+                for document in documents
+                if (document.get('_id', None) is not None
+                    and document.get('date-time', None) is not None)])
+
+    ## Mirror all the schedules in the queue
+    def resync_queue(self):
+        self.queue.resync(
+            (schedule['_id'], schedule.get('participant-phone', None), schedule['date-time'])
+            for schedule in self.collection.find(
+                {'date-time': {'$exists': True}},
+                ['participant-phone', 'date-time']))
+
+    ## The next schedule time from the timer, resynced from the database
+    def get_timer_next_time(self):
+        if self.timer.needs_resync():
+            schedule_times, is_complete = self.get_next_schedule_times(
+                self.TIMER_RESYNC_LIMIT)
+            self.timer.resync(schedule_times, is_complete)
+        return self.timer.get_next_time()
+
+    def save(self, *args, **kwargs):
+        result = self.collection.save(*args, **kwargs)
+        self.push_schedules([args[0]])
+        return result
+
+    def insert(self, *args, **kwargs):
+        result = self.collection.insert(*args, **kwargs)
+        self.push_schedules(args[0] if isinstance(args[0], list) else [args[0]])
+        return result
+
+    def update(self, *args, **kwargs):
+        self.timer.invalidate()
+        return self.collection.update(*args, **kwargs)
+
+    def drop(self):
+        self.timer.invalidate()
+        super(ScheduleManager, self).drop()
+
+    def save_object(self, instance):
+        instance.validate_fields()
+        document = instance.get_as_dict()
+        result = self.collection.save(document)
+        self.push_schedules([document])
+        return result
 
     @inlineCallbacks
     def save_schedule(self, schedule):
@@ -36,7 +106,7 @@ class ScheduleManager(ModelManager):
         try:
             if raw_schedule is None:
                 return None
-            return schedule_generator(**raw_schedule)
+            return trusted_schedule_generator(**raw_schedule)
         except:
             exc_type, exc_value, exc_traceback = sys.exc_info()
             self.log(
@@ -53,7 +123,7 @@ class ScheduleManager(ModelManager):
     def _wrap_cursor_schedules(self, cursor):
         def log(exception, item):
             self.log("Exception %s while intanciating a schedule %r" % (exception, item))        
-        return CursorInstanciator(cursor, schedule_generator, log)
+        return CursorInstanciator(cursor, trusted_schedule_generator, log)
 
     def get_participant_reminder_tail(self, participant_phone, dialogue_id, interaction_id):
         cursor = self.collection.find({
@@ -64,6 +134,85 @@ class ScheduleManager(ModelManager):
             "interaction-id": interaction_id})
         return self._wrap_cursor_schedules(cursor)
 
+    ## Return the dialogue, reminder and deadline schedules of a batch of
+    ## participants indexed by (phone, interaction-id)
+    def get_participants_dialogue_schedules(self, participant_phones, dialogue_id):
+        cursor = self.collection.find({
+            "participant-phone": {'$in': participant_phones},
+            "object-type": {'$in': ['dialogue-schedule',
+                                    'reminder-schedule',
+                                    'deadline-schedule']},
+            "dialogue-id": dialogue_id})
+        schedules = {}
+        for schedule in self._wrap_cursor_schedules(cursor):
+            if schedule is None:
+                continue
+            key = (schedule['participant-phone'], schedule['interaction-id'])
+            schedules.setdefault(key, []).append(schedule)
+        return schedules
+
+    ## Unordered bulk write, schedules are upserted on their _id
+    def save_schedules_bulk(self, schedules, removed_ids=[]):
+        if schedules == [] and removed_ids == []:
+            return 0
+        bulk = self.collection.initialize_unordered_bulk_op()
+        saved = []
+        for schedule in schedules:
+            if not isinstance(schedule, Schedule):
+                schedule = schedule_generator(**schedule)
+            schedule.validate_fields()
+            if schedule['_id'] is None:
+                schedule['_id'] = ObjectId()
+            bulk.find({'_id': schedule['_id']}).upsert().replace_one(
+                schedule.get_as_dict())
+            saved.append(schedule)
+        if removed_ids != []:
+            bulk.find({'_id': {'$in': removed_ids}}).remove()
+        bulk.execute()
+        self.push_schedules(saved)
+        return len(schedules) + len(removed_ids)
+
+    ## Set the unattach schedules of the selected participants and remove
+    ## the ones of the removed participant phones with one unordered bulk
+    def save_unattach_schedules_bulk(self, unattach, selected, removed_phones=[]):
+        if selected == [] and removed_phones == []:
+            return 0
+        unattach_id = str(unattach['_id'])
+        existing_phones = set()
+        if selected != []:
+            cursor = self.collection.find(
+                {'unattach-id': unattach_id,
+                 'participant-phone': {'$in': [p['phone'] for p in selected]}},
+                ['participant-phone'])
+            existing_phones = set(item['participant-phone'] for item in cursor)
+        bulk = self.collection.initialize_unordered_bulk_op()
+        for participant in selected:
+            if participant['phone'] in existing_phones:
+                bulk.find({'unattach-id': unattach_id,
+                           'participant-phone': participant['phone']}).update(
+                    {'$set': {'date-time': unattach['fixed-time'],
+                              'participant-session-id': participant['session-id']},
+                     '$unset': {'claim-id': True, 'claim-time': True}})
+                continue
+            schedule = UnattachSchedule(**{
+                'participant-phone': participant['phone'],
+                'participant-session-id': participant['session-id'],
+                'unattach-id': unattach_id,
+                'date-time': unattach['fixed-time']})
+            bulk.insert(schedule.get_as_dict())
+        if removed_phones != []:
+            bulk.find({'unattach-id': unattach_id,
+                       'participant-phone': {'$in': removed_phones}}).remove()
+        bulk.execute()
+        if selected != [] and self.queue is None:
+            self.timer.push(unattach['fixed-time'])
+        elif selected != []:
+            self.push_schedules([schedule for schedule in self.collection.find(
+                {'unattach-id': unattach_id,
+                 'participant-phone': {'$in': [p['phone'] for p in selected]}},
+                ['participant-phone', 'date-time'])])
+        return len(selected) + len(removed_phones)
+
     def get_participant_unattach(self, participant_phone, unattach_id):
         return self._generate_schedule(self.collection.find_one({
             'participant-phone': participant_phone,
@@ -87,12 +236,83 @@ class ScheduleManager(ModelManager):
                 return schedule.get_schedule_time()
         return None
 
+    ## Return a tuple (times, is_complete) of the next schedule times with
+    ## is_complete when there is no schedule after them
+    def get_next_schedule_times(self, limit=100):
+        schedules = self._wrap_cursor_schedules(
+            self.collection.find(
+                sort=[('date-time', 1)],
+                limit=limit))
+        schedules.add_failure_callback(self._remove_failure)
+        schedule_times = []
+        count = 0
+        for schedule in schedules:
+            count += 1
+            if schedule is not None:
+                schedule_times.append(schedule.get_schedule_time())
+        return schedule_times, count < limit
+
     def get_due_schedules(self, limit=100):
         cursor = self.collection.find(
             filter={'date-time': {'$lt': self.get_local_time('vusion')}},
             sort=[('date-time', 1)], limit=limit)
         return self._wrap_cursor_schedules(cursor)
-    
+
+    ## Mark a batch of due schedules with the claim id so that another
+    ## worker cannot send them. Claims older than CLAIM_TIMEOUT are
+    ## considered lost and can be claimed again.
+    def claim_due_schedules(self, claim_id, limit=100):
+        local_time = self.get_local_time()
+        claimable = {
+            'date-time': {'$lt': time_to_vusion_format(local_time)},
+            '$or': [{'claim-id': {'$exists': False}},
+                    {'claim-time': {'$lt': time_to_vusion_format(
+                        local_time - timedelta(minutes=self.CLAIM_TIMEOUT))}}]}
+        cursor = self.collection.find(
+            claimable, ['_id'], sort=[('date-time', 1)], limit=limit)
+        schedule_ids = [item['_id'] for item in cursor]
+        return self._claim_schedules(claim_id, claimable, schedule_ids, local_time)
+
+    ## Claim the due schedules leased from the schedule queue
+    def claim_schedules(self, claim_id, schedule_ids):
+        local_time = self.get_local_time()
+        claimable = {
+            'date-time': {'$lt': time_to_vusion_format(local_time)},
+            '$or': [{'claim-id': {'$exists': False}},
+                    {'claim-time': {'$lt': time_to_vusion_format(
+                        local_time - timedelta(minutes=self.CLAIM_TIMEOUT))}}]}
+        return self._claim_schedules(claim_id, claimable, schedule_ids, local_time)
+
+    def _claim_schedules(self, claim_id, claimable, schedule_ids, local_time):
+        if schedule_ids == []:
+            return []
+        claimable.update({'_id': {'$in': schedule_ids}})
+        self.collection.update_many(
+            claimable,
+            {'$set': {'claim-id': claim_id,
+                      'claim-time': time_to_vusion_format(local_time)}})
+        cursor = self.collection.find(
+            {'claim-id': claim_id}, sort=[('date-time', 1)])
+        return [schedule for schedule in self._wrap_cursor_schedules(cursor)
+                if schedule is not None]
+
+    ## Ack the queued schedules which have been removed, the others are
+    ## pushed again as they might have been rescheduled
+    def ack_queued_schedules(self, schedule_ids):
+        remaining = [schedule for schedule in self.collection.find(
+            {'_id': {'$in': schedule_ids}}, ['participant-phone', 'date-time'])]
+        remaining_ids = set(schedule['_id'] for schedule in remaining)
+        self.queue.ack([schedule_id for schedule_id in schedule_ids
+                        if schedule_id not in remaining_ids])
+        self.push_schedules(remaining)
+
+    ## Return False if the schedule has been removed in the meantime
+    def remove_claimed_schedule(self, schedule, claim_id):
+        result = self.collection.delete_one({
+            '_id': schedule['_id'],
+            'claim-id': claim_id})
+        return result.deleted_count == 1
+
     def remove_participant_reminders(self, participant_phone, dialogue_id, interaction_id):
         self.collection.remove({
             'participant-phone': participant_phone,
@@ -149,6 +369,24 @@ class ScheduleManager(ModelManager):
             schedule.set_time(unattach['fixed-time'])
         yield self.save_schedule(schedule)
 
+    ## Replace the schedules of the unattached message by a broadcast
+    def save_broadcast_schedule(self, unattach):
+        self.remove_unattach(unattach['_id'])
+        return self.save_object(BroadcastSchedule(**{
+            'unattach-id': str(unattach['_id']),
+            'date-time': unattach['fixed-time']}))
+
+    ## Store the progress of a claimed broadcast and release it for the next
+    ## batch, return False if it has been removed or rescheduled in the meantime
+    def release_broadcast_schedule(self, schedule, claim_id):
+        result = self.collection.update_one(
+            {'_id': schedule['_id'], 'claim-id': claim_id},
+            {'$set': {'last-participant-id': schedule['last-participant-id'],
+                      'participant-count': schedule['participant-count']},
+             '$unset': {'claim-id': True, 'claim-time': True}})
+        self.push_schedules([schedule])
+        return result.matched_count == 1
+
     @inlineCallbacks
     def unattach_schedule(self, participant, unattach):
         if unattach.is_selectable(participant):
@@ -0,0 +1,98 @@
+# -*- test-case-name: vusion.persist.schedule.tests.test_schedule_manager -*-
+import heapq
+from datetime import datetime
+from threading import Lock
+from time import time
+
+from vusion.utils import time_from_vusion_format
+
+
+## Min-heap of the schedule times written by the worker, so that the daemon
+## know its next wake up without querying the schedules. The removed
+## schedules are not tracked, they only cause an early wake up, and the
+## schedules written by other processes are found on the periodic resync
+## from the database (every resync_interval seconds).
+## The lock is required as the manager is called from the db threads.
+class ScheduleTimer(object):
+
+    def __init__(self, resync_interval=60, max_size=10000):
+        self.resync_interval = resync_interval
+        self.max_size = max_size
+        self.times = []
+        self.is_complete = True
+        self.last_resync = None
+        self.lock = Lock()
+        self.pushes = 0
+        self.resyncs = 0
+        self.wakeups = 0
+        self.empty_wakeups = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def push(self, schedule_time):
+        if schedule_time is None:
+            return
+        if not isinstance(schedule_time, datetime):
+            schedule_time = time_from_vusion_format(schedule_time)
+        with self.lock:
+            self.pushes += 1
+            heapq.heappush(self.times, schedule_time)
+            ## only the earliest times are kept, a resync is done once consumed
+            if len(self.times) > self.max_size:
+                self.times = heapq.nsmallest(self.max_size / 2, self.times)
+                self.is_complete = False
+
+    def get_next_time(self):
+        with self.lock:
+            if self.times == []:
+                return None
+            return self.times[0]
+
+    ## Drop the times which have been handled by the daemon
+    def pop_due(self, local_time, claimed=0):
+        with self.lock:
+            self.wakeups += 1
+            if claimed == 0:
+                self.empty_wakeups += 1
+            ## as the sender, only the times past by the second are due
+            local_time = local_time.replace(microsecond=0)
+            while self.times != [] and self.times[0] < local_time:
+                heapq.heappop(self.times)
+
+    def needs_resync(self):
+        if self.last_resync is None:
+            return True
+        if self.times == [] and not self.is_complete:
+            return True
+        return time() - self.last_resync >= self.resync_interval
+
+    ## Merge the next schedule times of the database with the pushed ones.
+    ## When the database has more schedules than loaded, the later times are
+    ## dropped so that a resync is done once the loaded ones are consumed.
+    def resync(self, schedule_times, is_complete=True):
+        with self.lock:
+            self.resyncs += 1
+            self.last_resync = time()
+            times = set(self.times)
+            times.update(schedule_times)
+            if not is_complete and schedule_times != []:
+                last_time = max(schedule_times)
+                times = [t for t in times if t <= last_time]
+            self.times = list(times)
+            heapq.heapify(self.times)
+            self.is_complete = is_complete
+
+    ## The schedules have been updated, the times are not reliable anymore
+    def invalidate(self):
+        with self.lock:
+            self.last_resync = None
+
+    def get_stats(self):
+        next_time = self.get_next_time()
+        return {'size': len(self.times),
+                'next-time': (next_time.isoformat() if next_time is not None else None),
+                'pushes': self.pushes,
+                'resyncs': self.resyncs,
+                'wakeups': self.wakeups,
+                'empty-wakeups': self.empty_wakeups}
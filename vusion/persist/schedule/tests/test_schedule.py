@@ -4,7 +4,9 @@ from datetime import timedelta, datetime
 
 from twisted.trial.unittest import TestCase
 
-from vusion.persist import schedule_generator, DialogueSchedule
+from vusion.persist import (
+    schedule_generator, trusted_schedule_generator, DialogueSchedule)
+from vusion.error import InvalidField
 from tests.utils import ObjectMaker
 from vusion.utils import time_from_vusion_format, time_to_vusion_format
 
@@ -18,6 +20,22 @@ class TestSchedule(TestCase, ObjectMaker):
         schedule = DialogueSchedule(**self.mkobj_schedule(date_time=sometime))
         self.assertEqual('2014-10-02T10:00:00', schedule['date-time'])
     
+    def test_trusted_instanciate(self):
+        raw = self.mkobj_schedule()
+        raw['date-time'] = '2014-10-02 10:00'
+        self.assertRaises(InvalidField, schedule_generator, **raw)
+
+        ## At the current version the validation rules are skipped
+        schedule = trusted_schedule_generator(**raw)
+        self.assertTrue(isinstance(schedule, DialogueSchedule))
+        self.assertEqual('2014-10-02 10:00', schedule['date-time'])
+        self.assertFalse(schedule.is_trusted)
+        self.assertRaises(InvalidField, schedule.set_time, '2014-10-02 10:00')
+
+        ## An older version is upgraded and validated
+        raw['model-version'] = '1'
+        self.assertRaises(InvalidField, trusted_schedule_generator, **raw)
+
     def test_is_expired(self):
         now = datetime.now()
         
@@ -33,4 +51,22 @@ class TestSchedule(TestCase, ObjectMaker):
         future = now + timedelta(minutes=15)
         schedule = schedule_generator(**self.mkobj_schedule(
                     date_time=time_to_vusion_format(future)))        
-        self.assertFalse(schedule.is_expired(now))
\ No newline at end of file
+        self.assertFalse(schedule.is_expired(now))
+
+    def test_broadcast_generate_unattach_schedule(self):
+        schedule = schedule_generator(**{
+            'object-type': 'broadcast-schedule',
+            'unattach-id': '1',
+            'date-time': '2014-10-02T10:00:00'})
+        self.assertFalse(schedule.is_started())
+
+        unattach_schedule = schedule.generate_unattach_schedule(
+            self.mkobj_participant('06', session_id='2'))
+        self.assertEqual(
+            unattach_schedule.get_as_dict(),
+            {'object-type': 'unattach-schedule',
+             'model-version': '2',
+             'participant-phone': '06',
+             'participant-session-id': '2',
+             'unattach-id': '1',
+             'date-time': '2014-10-02T10:00:00'})
@@ -135,6 +135,49 @@ class TestScheduleManager(TestCase, ObjectMaker):
         reminder = reminders.next()
         self.assertIsInstance(reminder, ReminderSchedule)
 
+    @inlineCallbacks
+    def test_get_participants_dialogue_schedules(self):
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='1', dialogue_id='1', interaction_id='2'))
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='1', object_type='reminder-schedule',
+            dialogue_id='1', interaction_id='2'))
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='2', dialogue_id='1', interaction_id='2'))
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='1', dialogue_id='2', interaction_id='2'))
+
+        schedules = self.manager.get_participants_dialogue_schedules(['1'], '1')
+
+        self.assertEqual([('1', '2')], schedules.keys())
+        self.assertEqual(
+            ['dialogue-schedule', 'reminder-schedule'],
+            sorted([s.get_type() for s in schedules[('1', '2')]]))
+
+    @inlineCallbacks
+    def test_save_schedules_bulk(self):
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='1', dialogue_id='1', interaction_id='2'))
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='1', object_type='reminder-schedule',
+            dialogue_id='1', interaction_id='2'))
+        updated = schedule_generator(**self.manager.find_one(
+            {'object-type': 'dialogue-schedule'}))
+        updated.set_time('2014-10-02T10:00:00')
+        removed = self.manager.find_one({'object-type': 'reminder-schedule'})
+        added = DialogueSchedule(**self.mkobj_schedule(
+            participant_phone='2', dialogue_id='1', interaction_id='2'))
+
+        writes = self.manager.save_schedules_bulk(
+            [updated, added], [removed['_id']])
+
+        self.assertEqual(3, writes)
+        self.assertEqual(2, self.manager.count())
+        self.assertEqual(
+            '2014-10-02T10:00:00',
+            self.manager.find_one({'participant-phone': '1'})['date-time'])
+        self.assertEqual(0, self.manager.save_schedules_bulk([], []))
+
     @inlineCallbacks
     def test_get_due_schedules(self):
         now = self.manager.get_local_time()
@@ -156,6 +199,38 @@ class TestScheduleManager(TestCase, ObjectMaker):
         self.assertIsInstance(schedule, DialogueSchedule)
         self.assertEqual('2', schedule['participant-phone'])
 
+    @inlineCallbacks
+    def test_claim_due_schedules(self):
+        now = self.manager.get_local_time()
+        past = now - timedelta(minutes=5)
+        future = now + timedelta(minutes=5)
+
+        for phone in ['1', '2', '3']:
+            yield self.manager.save_schedule(self.mkobj_schedule(
+                participant_phone=phone, date_time=time_to_vusion_format(past)))
+        yield self.manager.save_schedule(self.mkobj_schedule(
+            participant_phone='4', date_time=time_to_vusion_format(future)))
+
+        schedules = self.manager.claim_due_schedules('a', limit=2)
+        self.assertEqual(2, len(schedules))
+        self.assertIsInstance(schedules[0], DialogueSchedule)
+        self.assertEqual('a', schedules[0]['claim-id'])
+
+        schedules = self.manager.claim_due_schedules('b', limit=2)
+        self.assertEqual(1, len(schedules))
+        self.assertEqual([], self.manager.claim_due_schedules('c'))
+
+        ## a lost claim can be claimed again
+        self.manager.update(
+            {'claim-id': 'b'},
+            {'$set': {'claim-time': time_to_vusion_format(now - timedelta(hours=1))}})
+        schedules = self.manager.claim_due_schedules('d')
+        self.assertEqual(1, len(schedules))
+
+        self.assertFalse(self.manager.remove_claimed_schedule(schedules[0], 'b'))
+        self.assertTrue(self.manager.remove_claimed_schedule(schedules[0], 'd'))
+        self.assertEqual(3, self.manager.count())
+
     @inlineCallbacks
     def test_get_next_schedule_time(self):
         now = self.manager.get_local_time()
@@ -177,6 +252,58 @@ class TestScheduleManager(TestCase, ObjectMaker):
         #the invalid_schedule has been removed
         self.assertEqual(2, self.manager.count())
 
+    @inlineCallbacks
+    def test_get_timer_next_time(self):
+        now = self.manager.get_local_time().replace(microsecond=0)
+        future = now + timedelta(minutes=5)
+
+        self.assertEqual(None, self.manager.get_timer_next_time())
+        self.assertEqual(1, self.manager.timer.get_stats()['resyncs'])
+
+        ## the schedules saved through the manager are pushed
+        schedule = schedule_generator(**self.mkobj_schedule(
+            participant_phone='1', date_time=time_to_vusion_format(future)))
+        yield self.manager.save_schedule(schedule)
+        self.manager.save(self.mkobj_schedule(
+            participant_phone='2', date_time=time_to_vusion_format(now)))
+        self.assertEqual(now, self.manager.get_timer_next_time())
+        self.assertEqual(1, self.manager.timer.get_stats()['resyncs'])
+
+        self.manager.timer.pop_due(now + timedelta(seconds=1), 1)
+        self.assertEqual(future, self.manager.get_timer_next_time())
+
+        ## the schedules modified by query are resynced
+        self.manager.update(
+            {'participant-phone': '1'},
+            {'$set': {'date-time': time_to_vusion_format(now)}})
+        self.assertEqual(now, self.manager.get_timer_next_time())
+        self.assertEqual(2, self.manager.timer.get_stats()['resyncs'])
+
+    @inlineCallbacks
+    def test_get_timer_next_time_resync(self):
+        now = self.manager.get_local_time().replace(microsecond=0)
+        future = now + timedelta(minutes=5)
+        more_future = now + timedelta(minutes=6)
+        for phone, date_time in [('1', future), ('2', more_future)]:
+            schedule = schedule_generator(**self.mkobj_schedule(
+                participant_phone=phone, date_time=time_to_vusion_format(date_time)))
+            yield self.manager.save_schedule(schedule)
+
+        ## the pushed times are kept on resync
+        self.manager.timer.invalidate()
+        self.assertEqual(future, self.manager.get_timer_next_time())
+        self.manager.timer.pop_due(future + timedelta(seconds=1), 1)
+        self.assertEqual(more_future, self.manager.get_timer_next_time())
+
+        ## when partially loaded, a resync is done once the times consumed
+        self.manager.TIMER_RESYNC_LIMIT = 1
+        self.manager.timer.invalidate()
+        self.assertEqual(future, self.manager.get_timer_next_time())
+        self.manager.collection.remove({'participant-phone': '1'})
+        self.manager.timer.pop_due(future + timedelta(seconds=1), 1)
+        self.assertTrue(self.manager.timer.needs_resync())
+        self.assertEqual(more_future, self.manager.get_timer_next_time())
+
     @inlineCallbacks
     def test_remove_unattach(self):
         schedule_1 = schedule_generator(**self.mkobj_schedule_unattach(
@@ -248,6 +375,26 @@ class TestScheduleManager(TestCase, ObjectMaker):
             save_schedule['date-time'],
             '2200-03-12T12:30:00')
 
+    def test_save_unattach_schedules_bulk_update_claimed(self):
+        schedule = schedule_generator(**self.mkobj_schedule_unattach(
+            participant_phone='06', unattach_id='1',
+            date_time='2010-03-12T12:30:00'))
+        self.manager.save_schedule(schedule)
+        self.manager.claim_due_schedules('a')
+
+        unattach = UnattachedMessage(**self.mkobj_unattach_message(
+            fixed_time='2200-03-12T12:30:00'))
+        unattach['_id'] = '1'
+
+        self.manager.save_unattach_schedules_bulk(
+            unattach, [{'phone': '06', 'session-id': '1'}])
+
+        self.assertEqual(1, self.manager.count())
+        save_schedule = self.manager.find_one()
+        self.assertEqual(save_schedule['date-time'], '2200-03-12T12:30:00')
+        self.assertFalse('claim-id' in save_schedule)
+        self.assertFalse('claim-time' in save_schedule)
+
     @inlineCallbacks
     def test_save_unattached_schedule_new(self):
         schedule = schedule_generator(**self.mkobj_schedule_unattach(
@@ -1,5 +1,4 @@
-import re
-
+from vusion.address_normaliser import address_normaliser
 from vusion.persist import ModelManager
 from vusion.persist.cursor_instanciator import CursorInstanciator
 from shortcode import Shortcode
@@ -21,8 +20,8 @@ class ShortcodeManager(ModelManager):
             return Shortcode(**codes[0])
         else:
             for code in codes:
-                regex = re.compile(('^\+%s' % code['international-prefix']))
-                if re.match(regex, from_addr):
+                if address_normaliser.has_international_prefix(
+                        from_addr, code['international-prefix']):
                     return Shortcode(**code)
         self.log_helper.err("Could not find shortcode for %s with %s " %
                             (to_addr, code['international-prefix']))
@@ -0,0 +1,32 @@
+from twisted.trial.unittest import TestCase
+
+from vusion.persist import KeywordIndex
+
+
+class TestKeywordIndex(TestCase):
+
+    def test_add_remove(self):
+        index = KeywordIndex()
+        index.add('1', ['www', 'quit', 'www'])
+        index.add('2', ['quit'])
+        self.assertEqual(2, len(index))
+        self.assertEqual(['www', 'quit'], index.owners['1'])
+
+        index.remove('1')
+        self.assertEqual(None, index.get('www', ['1', '2']))
+        self.assertEqual('2', index.get('quit', ['1', '2']))
+
+        index.add('2', ['feel'])
+        self.assertEqual(None, index.get('quit', ['2']))
+        self.assertEqual('2', index.get('feel', ['2']))
+
+    def test_get_precedence(self):
+        index = KeywordIndex()
+        index.add('1', ['www'])
+        index.add('2', ['www'])
+
+        self.assertEqual('1', index.get('www', ['1', '2']))
+        self.assertEqual('2', index.get('www', ['2', '1']))
+        ## owner not loaded anymore
+        self.assertEqual(None, index.get('www', ['3']))
+        self.assertEqual(None, index.get('other', ['1', '2']))
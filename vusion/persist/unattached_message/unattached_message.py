@@ -2,7 +2,7 @@ import re
 
 from vusion.error import InvalidField, MissingField
 from vusion.persist import Model
-from vusion.const import TAG_REGEX, LABEL_REGEX
+from vusion.const import TAG_REGEX, LABEL_REGEX, DATE_TIME_REGEX
 
 ##TODO update the validation
 class UnattachedMessage(Model):
@@ -17,7 +17,7 @@ class UnattachedMessage(Model):
         'send-to-type': lambda v: v in ['all', 'match', 'phone'],
         'content': lambda v: v is not None,
         'type-schedule': lambda v: v in ['fixed-time', 'immediately'],
-        'fixed-time': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+)(:0?(\d+))$'), v)
+        'fixed-time': lambda v: re.match(DATE_TIME_REGEX, v)
     }  
 
     SEND_TO_FIELDS = {
@@ -3,6 +3,7 @@ import re
 from datetime import datetime
 
 from vusion.utils import time_to_vusion_format
+from vusion.const import TIMESTAMP_REGEX
 
 from vusion.persist import Model
 
@@ -28,7 +29,7 @@ class UnmatchableReply(Model):
             },
         'timestamp': {
             'required': True,
-            'valid_value': lambda v: re.match(re.compile('^(\d{4})-0?(\d+)-0?(\d+)T0?(\d+):0?(\d+):0?(\d+)$'), v['timestamp'])
+            'valid_value': lambda v: re.match(TIMESTAMP_REGEX, v['timestamp'])
             },
     }
    
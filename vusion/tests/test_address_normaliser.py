@@ -0,0 +1,62 @@
+from twisted.trial.unittest import TestCase
+
+from vusion.address_normaliser import AddressNormaliser
+
+
+class TestAddressNormaliser(TestCase):
+
+    def test_clean_phone(self):
+        normaliser = AddressNormaliser()
+        self.assertEqual(normaliser.clean_phone('+256111'), '+256111')
+        self.assertEqual(normaliser.clean_phone('256111'), '+256111')
+        self.assertEqual(normaliser.clean_phone('0256111'), '+256111')
+        self.assertEqual(normaliser.clean_phone('000256111'), '+0256111')
+        self.assertEqual(normaliser.clean_phone(''), None)
+        self.assertEqual(normaliser.clean_phone(None), None)
+
+    def test_shortcode(self):
+        normaliser = AddressNormaliser()
+        self.assertTrue(normaliser.is_shortcode_address('256-8181'))
+        self.assertFalse(normaliser.is_shortcode_address('+318181'))
+        self.assertFalse(normaliser.is_shortcode_address(None))
+        self.assertEqual(normaliser.get_shortcode_value('256-8181'), '8181')
+        self.assertEqual(normaliser.get_shortcode_value('+318181'), '+318181')
+        self.assertEqual(
+            normaliser.get_shortcode_international_prefix('256-8181'), '256')
+        self.assertEqual(
+            normaliser.get_shortcode_international_prefix('8181'), '8181')
+        self.assertTrue(normaliser.has_international_prefix('+25611', 256))
+        self.assertFalse(normaliser.has_international_prefix('25611', '256'))
+
+    def test_inbound(self):
+        normaliser = AddressNormaliser(
+            international_prefix='254', ensure_plus_inbound=True)
+        self.assertEqual(
+            normaliser.normalise_inbound_from_addr('00254 888'), '+254888')
+        self.assertEqual(
+            normaliser.normalise_inbound_from_addr('888'), '+254888')
+        self.assertEqual(
+            normaliser.normalise_inbound_to_addr('+ 8181'), '+8181')
+        self.assertEqual(
+            normaliser.normalise_inbound_to_addr('008181'), '+8181')
+
+    def test_outbound(self):
+        normaliser = AddressNormaliser(
+            international_prefix='256', trim_plus_outbound=True,
+            trim_international_prefix_outbound=True)
+        self.assertEqual(
+            normaliser.normalise_outbound_to_addr('+2561111'), '1111')
+        self.assertEqual(
+            normaliser.normalise_outbound_to_addr('2561111'), '1111')
+        self.assertEqual(
+            normaliser.normalise_outbound_to_addr('+2541111'), '2541111')
+
+    def test_memoize(self):
+        normaliser = AddressNormaliser(max_size=2)
+        normaliser.clean_phone('0256111')
+        normaliser.clean_phone('0256111')
+        self.assertEqual(normaliser.get_stats()['hits'], 1)
+        normaliser.clean_phone('0256112')
+        normaliser.clean_phone('0256113')
+        self.assertEqual(normaliser.get_stats()['phones'], 1)
+        self.assertEqual(normaliser.clean_phone('0256111'), '+256111')
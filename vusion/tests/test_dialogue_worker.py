@@ -282,6 +282,26 @@ class DialogueWorkerTestCase_main(DialogueWorkerTestCase):
             close_question,
             "How are you?\n1. Fine\n2. Ok\n To reply send: FEEL<space><AnswerNb> to 8181")
 
+    def test12_generate_message_use_template_cache(self):
+        saved_template_id = self.collections['templates'].save(
+            self.template_closed_question)
+        settings = self.mk_program_settings(
+            default_template_closed_question=saved_template_id)
+        self.initialize_properties(settings)
+        interaction = self.mkobj_dialogue_question_offset_days()['interactions'][0]
+        expected = "How are you?\n1. Fine\n2. Ok\n To reply send: FEEL<space><AnswerNb> to 8181"
+
+        self.assertEqual(self.worker.generate_message(interaction), expected)
+
+        ## The template is not read again until the dialogues are reloaded
+        self.collections['templates'].remove()
+        self.assertEqual(self.worker.generate_message(interaction), expected)
+
+        self.collections['dialogues'].load_dialogues()
+        self.assertRaises(MissingTemplate,
+                          self.worker.generate_message,
+                          interaction)
+
     def test12_generate_message_use_template_closed_question(self):
         saved_template_id = self.collections['templates'].save(
             self.template_open_question)
@@ -457,3 +477,20 @@ class DialogueWorkerTestCase_main(DialogueWorkerTestCase):
         messages = self.app_helper.get_dispatched('stats', 'control', StatsWorkerControl)
         self.assertEqual(1, len(messages))
         self.assertEqual( messages[0]['program_db'], 'test_program_db')
+
+    @inlineCallbacks
+    def test_metrics(self):
+        self.assertTrue(self.worker.metrics is None)
+        self.config.update({'metrics': 1, 'metrics_sample_interval': 1})
+        worker = yield self.app_helper.get_application(self.config)
+        self.initialize_properties()
+
+        yield worker.send_scheduled()
+
+        metrics = worker.metrics.get_stats()['metrics']
+        self.assertEqual(1, metrics['send_scheduled']['count'])
+        self.assertEqual(1, metrics['send_scheduled']['sampled'])
+        self.assertTrue('schedules.find' in metrics)
+
+        worker.flush_metrics()
+        self.assertTrue(worker.r_server.get('%s:metrics' % worker.r_key))
@@ -210,3 +210,33 @@ class DialogueWorkerTestCase_consumeEvent(DialogueWorkerTestCase):
 
         self.assertEqual('failed', history['message-status'])
         self.assertEqual('Level:unknown Code:unknown Message:unknown', history['failure-reason'])
+
+    @inlineCallbacks
+    def test_events_coalesced(self):
+        self.initialize_properties()
+        self.worker.event_window = 10
+        past = self.worker.get_local_time() - timedelta(hours=5)
+
+        history = self.mkobj_history_unattach(
+            '4',
+            time_to_vusion_format(past),
+            message_direction='outgoing',
+            message_status='pending',
+            message_id='1')
+        self.worker.collections['history'].save_history(**history)
+
+        yield self.app_helper.dispatch_event(self.mkmsg_delivery_for_send(
+            event_type='ack', user_message_id='1'))
+        yield self.app_helper.dispatch_event(self.mkmsg_delivery_for_send(
+            event_type='delivery_report', user_message_id='1',
+            delivery_status='delivered'))
+        self.assertEqual(2, len(self.worker.events))
+        self.assertTrue(self.worker.event_flusher.active())
+
+        yield self.worker.flush_events()
+        self.assertEqual(0, len(self.worker.events))
+        history = self.collections['history'].find_one({'message-id': '1'})
+        self.assertEqual('delivered', history['message-status'])
+        credit_log = self.collections['credit_logs'].find_one()
+        self.assertEqual(1, credit_log['outgoing-acked'])
+        self.assertEqual(1, credit_log['outgoing-delivered'])
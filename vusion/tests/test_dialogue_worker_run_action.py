@@ -34,6 +34,7 @@ from vusion.tests.test_dialogue_worker import DialogueWorkerTestCase
 
 class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
 
+    @inlineCallbacks
     def test_run_action_unmatching_answer(self):
         self.initialize_properties()
 
@@ -53,7 +54,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         context = Context()
         context.update({'request-id': '1'})
 
-        self.worker.run_action(
+        yield self.worker.run_action(
             '08',
             UnMatchingAnswerAction(**{'answer': 'best'}),
             context,
@@ -138,7 +139,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         context = Context()
         context.update({'request-id': '1'})
 
-        self.worker.run_action(
+        yield self.worker.run_action(
             '06',
             FeedbackAction(**{'content': 'message'}),
             context,
@@ -161,7 +162,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         context = Context()
         context.update({'request-id': '1'})
 
-        self.worker.run_action(
+        yield self.worker.run_action(
             '06',
             FeedbackAction(**{'content': 'message'}),
             context,
@@ -182,7 +183,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         context = Context()
         context.update({'request-id': '1'})
 
-        self.worker.run_action(
+        yield self.worker.run_action(
             '06',
             SmsMoAction(**{'mo-content': 'test incoming MO message'}),
             context,
@@ -223,11 +224,12 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             time_from_vusion_format(participant['enrolled'][0]['date-time']))
 
         #Enrolling a new number will opt it in
-        self.worker.run_action("09", EnrollingAction(**{'enroll': '01'}))
+        yield self.worker.run_action("09", EnrollingAction(**{'enroll': '01'}))
         participant = self.collections['participants'].find_one({'phone': '09', 'enrolled.dialogue-id':'01'})
         self.assertTrue(participant)
         self.assertEqual(participant['session-id'], RegexMatcher(r'^[0-9a-fA-F]{32}$'))
 
+    @inlineCallbacks
     def test_run_action_enroll_again(self):
         self.initialize_properties()
 
@@ -241,7 +243,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             enrolled=[{'dialogue-id': dialogue['dialogue-id'],
                        'date-time': time_to_vusion_format(dPast)}]))
 
-        self.worker.run_action("08", EnrollingAction(**{'enroll': '01'}))
+        yield self.worker.run_action("08", EnrollingAction(**{'enroll': '01'}))
 
         participant = self.collections['participants'].find_one({'phone': '08'})
         self.assertEqual(
@@ -260,6 +262,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         self.assertTrue(self.collections['participants'].find_one({'enrolled.dialogue-id':'0'}) is not None)
         self.assertEqual(1, self.collections['schedules'].count())
 
+    @inlineCallbacks
     def test_run_action_enroll_clear_profile_if_not_optin(self):
         self.initialize_properties()
 
@@ -276,7 +279,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                        'date-time': '2012-08-08T12:36:20'}]))
         dNow = self.worker.get_local_time()
 
-        self.worker.run_action("06", EnrollingAction(**{'enroll': '01'}))
+        yield self.worker.run_action("06", EnrollingAction(**{'enroll': '01'}))
 
         participant = self.collections['participants'].find_one({'phone':'06'})
         self.assertEqual(participant['tags'], [])
@@ -310,13 +313,14 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             action_generator(**schedule['action']),
             EnrollingAction(**{'enroll': '01'}))
 
+    @inlineCallbacks
     def test_run_action_optin_optout(self):
         self.initialize_properties()
 
         regex_time = RegexMatcher(r'^(\d{4})-0?(\d+)-0?(\d+)[T ]0?(\d+):0?(\d+):0?(\d+)$')        
 
         ## Participant optin
-        self.worker.run_action("08", OptinAction())
+        yield self.worker.run_action("08", OptinAction())
         self.assertEqual(1, self.collections['participants'].count())
         participant = self.collections['participants'].find_one()
         self.assertTrue('session-id' in participant)
@@ -330,7 +334,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         ## Participant optout (All schedule messages should be removed)
         self.collections['schedules'].save(self.mkobj_schedule("08"))
         self.collections['schedules'].save(self.mkobj_schedule("06"))
-        self.worker.run_action("08", OptoutAction())
+        yield self.worker.run_action("08", OptoutAction())
         self.assertEqual(1, self.collections['participants'].count())
         participant_optout = self.collections['participants'].find_one()
         self.assertTrue(participant_optout['session-id'] is None)
@@ -339,7 +343,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         self.assertEqual(1, self.collections['schedules'].count())
 
         ## Participant can optin again
-        self.worker.run_action("08", OptinAction())
+        yield self.worker.run_action("08", OptinAction())
         self.assertEqual(1, self.collections['participants'].count())
         participant = self.collections['participants'].find_one()
         self.assertEqual(participant['session-id'], RegexMatcher(r'^[0-9a-fA-F]{32}$'))
@@ -347,7 +351,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
         self.assertEqual(participant['last-optout-date'], None)
 
         ## Participant cannot optin while they are aleardy optin
-        self.worker.run_action("08", OptinAction())
+        yield self.worker.run_action("08", OptinAction())
         self.assertEqual(1, self.collections['participants'].count())
         participant_reoptin = self.collections['participants'].find_one()
         self.assertEqual(participant['session-id'], participant_reoptin['session-id'])
@@ -365,7 +369,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             enrolled=[{'dialogue-id': '1', 
                        'date-time': '2012-11-01T10:30:20'}]
         ))
-        self.worker.run_action("06", OptinAction())
+        yield self.worker.run_action("06", OptinAction())
         participant = self.collections['participants'].find_one({'phone':'06'})
         self.assertEqual(participant['tags'], [])
         self.assertEqual(participant['profile'], [])
@@ -380,7 +384,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             enrolled=[{'dialogue-id': '1', 
                        'date-time': '2012-11-01T10:30:20'}]
         ))
-        self.worker.run_action("06", OptoutAction())
+        yield self.worker.run_action("06", OptoutAction())
         participant = self.collections['participants'].find_one({'phone': '07'})
         self.assertEqual(participant['tags'], ['geeks'])
         self.assertEqual(participant['profile'], [{'label': 'name',
@@ -390,12 +394,13 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             {'dialogue-id': '1', 
              'date-time': '2012-11-01T10:30:20'}])
 
+    @inlineCallbacks
     def test_run_action_optin_double_option_no_setting(self):
         self.initialize_properties()
 
         self.collections['participants'].save(self.mkobj_participant())           
 
-        self.worker.run_action('06', OptinAction())
+        yield self.worker.run_action('06', OptinAction())
         
         messages = self.app_helper.get_dispatched_outbound()
         self.assertEqual(len(messages), 0)
@@ -569,6 +574,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                                                            'interaction-id': interaction['interaction-id']}))        
         self.assertEqual(self.collections['schedules'].count(), 0) 
 
+    @inlineCallbacks
     def test_run_action_reset_no_exceptions(self):
         self.initialize_properties()
 
@@ -581,12 +587,13 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                      'value': 'Oliv'}])
         self.collections['participants'].save(participant)
 
-        self.worker.run_action("06", ResetAction())
+        yield self.worker.run_action("06", ResetAction())
 
         reset_participant = self.collections['participants'].find_one({'phone':'06'})
 
         self.assertEqual(reset_participant['profile'], [])
         
+    @inlineCallbacks
     def test_run_action_reset_keep_labels(self):
         self.initialize_properties()
 
@@ -599,12 +606,13 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                      'value': 'Oliv'}])
         self.collections['participants'].save(participant)
 
-        self.worker.run_action("06", ResetAction(**{'keep-labels': 'name'}))
+        yield self.worker.run_action("06", ResetAction(**{'keep-labels': 'name'}))
 
         reset_participant = self.collections['participants'].find_one({'phone':'06'})
 
         self.assertEqual(reset_participant['profile'], [{'label': 'name', 'value': 'Oliv', 'raw': ''}])
         
+    @inlineCallbacks
     def test_run_action_reset_keep_labels_only_original_labels(self):
         self.initialize_properties()
 
@@ -619,12 +627,13 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                       'value': '33'}])
         self.collections['participants'].save(participant)
 
-        self.worker.run_action("06", ResetAction(**{'keep-labels': 'name, gender'}))
+        yield self.worker.run_action("06", ResetAction(**{'keep-labels': 'name, gender'}))
 
         reset_participant = self.collections['participants'].find_one({'phone':'06'})
 
         self.assertEqual(reset_participant['profile'], [{'label': 'name', 'value': 'Oliv', 'raw': ''}])        
             
+    @inlineCallbacks
     def test_run_action_reset_keep_tags(self):
         self.initialize_properties()
 
@@ -638,12 +647,13 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                      'value': 'Oliv'}])
         self.collections['participants'].save(participant)
 
-        self.worker.run_action("06", ResetAction(**{'keep-tags': 'geek, meek'}))
+        yield self.worker.run_action("06", ResetAction(**{'keep-tags': 'geek, meek'}))
 
         reset_participant = self.collections['participants'].find_one({'phone':'06'})
 
         self.assertEqual(reset_participant['tags'], ['geek', 'meek']) 
         
+    @inlineCallbacks
     def test_run_action_reset_keep_tags_only_original_tags(self):
         self.initialize_properties()
 
@@ -657,13 +667,14 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                      'value': 'Oliv'}])
         self.collections['participants'].save(participant)
 
-        self.worker.run_action("06", ResetAction(**{'keep-tags': 'geek, fee'}))
+        yield self.worker.run_action("06", ResetAction(**{'keep-tags': 'geek, fee'}))
 
         reset_participant = self.collections['participants'].find_one({'phone':'06'})
 
         self.assertEqual(reset_participant['tags'], ['geek'])    
    
 
+    @inlineCallbacks
     def test_run_conditional_action(self):
         self.initialize_properties()
 
@@ -675,7 +686,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
                      'value': 'Oliv'}]))
 
         ## Simple Condition
-        self.worker.run_action("08", TaggingAction(**{
+        yield self.worker.run_action("08", TaggingAction(**{
             'model-version': '2',
             'set-condition': 'condition',
             'condition-operator': 'all-subconditions',
@@ -691,7 +702,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             ['geek'],
             participant['tags'])
                 
-        self.worker.run_action("08", TaggingAction(**{
+        yield self.worker.run_action("08", TaggingAction(**{
             'model-version': '2',
             'set-condition': 'condition',
             'condition-operator': 'all-subconditions',
@@ -708,7 +719,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             participant['tags'])
 
         ## Complex Condition
-        self.worker.run_action(
+        yield self.worker.run_action(
             "08", 
             TaggingAction(**{
                 'model-version': '2',
@@ -762,6 +773,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             ['father','GroupB'],
             participant['tags'])
 
+    @inlineCallbacks
     def test_run_action_proportional_tagging_already_tagged(self):
         self.initialize_properties()
 
@@ -775,7 +787,7 @@ class DialogueWorkerTestCase_runAction(DialogueWorkerTestCase):
             'proportional-tags': [{'tag': 'GroupA', 'weight': '1'},
                                   {'tag': 'GroupB', 'weight': '1'}]})
         ## Tagging
-        self.worker.run_action("08", proportional_tagging)
+        yield self.worker.run_action("08", proportional_tagging)
         participant = self.collections['participants'].find_one()
         self.assertEqual(participant['tags'], ['geek', 'GroupB'])
 
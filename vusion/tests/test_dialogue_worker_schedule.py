@@ -982,3 +982,249 @@ class DialogueWorkerTestCase_schedule(DialogueWorkerTestCase):
             2, self.collections['schedules'].find({'participant-phone': '01'}).count())
         self.assertEqual(
             1, self.collections['schedules'].find({'participant-phone': '02'}).count())
+
+    @inlineCallbacks
+    def test_schedule_dialogue_bulk(self):
+        self.initialize_properties()
+        self.worker.scheduling_engine = 'bulk'
+
+        now = self.worker.get_local_time()
+        past = now - timedelta(days=1)
+        future = now + timedelta(days=1)
+
+        dialogue = self.mkobj_dialogue_announcement_offset_days()
+        self.collections['dialogues'].save(dialogue)
+
+        self.collections['participants'].save(
+            self.mkobj_participant(
+                participant_phone='01',
+                enrolled=[]))
+        self.collections['participants'].save(
+            self.mkobj_participant(
+                participant_phone='02',
+                session_id='x',
+                enrolled=[{
+                    'dialogue-id': '0',
+                    'date-time': time_to_vusion_format(past)}]))
+        self.collections['history'].save(
+            self.mkobj_history_dialogue(
+                dialogue_id='0',
+                interaction_id='0',
+                timestamp=time_to_vusion_format(past),
+                participant_phone='02',
+                participant_session_id='x'))
+        self.collections['schedules'].save(
+            self.mkobj_schedule(
+                participant_phone='02',
+                participant_session_id='x',
+                date_time=time_to_vusion_format(future),
+                dialogue_id='0',
+                interaction_id='1'))
+        self.collections['participants'].save(
+            self.mkobj_participant(
+                participant_phone='03',
+                session_id=None))
+
+        yield self.worker.schedule_dialogue('0')
+
+        self.assertEqual(3, self.collections['schedules'].count())
+        self.assertEqual(
+            2, self.collections['schedules'].find({'participant-phone': '01'}).count())
+        self.assertEqual(
+            1, self.collections['schedules'].find({'participant-phone': '02'}).count())
+
+    @inlineCallbacks
+    def test_schedule_dialogue_bulk_same_as_default(self):
+        self.initialize_properties()
+
+        now = self.worker.get_local_time()
+        dialogue = self.mkobj_dialogue_open_question_offset_conditional()
+        self.collections['dialogues'].save(dialogue)
+
+        for phone in ['01', '02', '03', '04']:
+            self.collections['participants'].save(
+                self.mkobj_participant(
+                    participant_phone=phone,
+                    session_id=phone,
+                    enrolled=[{
+                        'dialogue-id': '04',
+                        'date-time': time_to_vusion_format(now - timedelta(hours=1))}]))
+        ## answered the first question
+        self.collections['history'].save(
+            self.mkobj_history_dialogue(
+                '04', '01-01', time_to_vusion_format(now - timedelta(minutes=10)),
+                participant_phone='02', participant_session_id='02'))
+        self.collections['history'].save(
+            self.mkobj_history_dialogue(
+                '04', '01-01', time_to_vusion_format(now - timedelta(minutes=5)),
+                participant_phone='02', participant_session_id='02',
+                direction='incoming', matching_answer='olivier'))
+        ## oneway marker on the first question
+        self.collections['history'].save(
+            self.mkobj_history_one_way_marker(
+                '04', '01-01', time_to_vusion_format(now),
+                participant_phone='03', participant_session_id='03'))
+        ## second question already sent with a pending deadline
+        self.collections['history'].save(
+            self.mkobj_history_dialogue(
+                '04', '01-02', time_to_vusion_format(now - timedelta(minutes=1)),
+                participant_phone='04', participant_session_id='04'))
+        self.collections['schedules'].save(
+            self.mkobj_schedule(
+                participant_phone='04',
+                participant_session_id='04',
+                date_time=time_to_vusion_format(now + timedelta(minutes=2)),
+                dialogue_id='04',
+                interaction_id='01-02',
+                object_type='deadline-schedule'))
+        initial_schedules = [s for s in self.collections['schedules'].find()]
+
+        def get_schedules():
+            schedules = []
+            for schedule in self.collections['schedules'].find():
+                schedule.pop('_id')
+                schedules.append(schedule)
+            return sorted(schedules, key=lambda s: (
+                s['participant-phone'], s['interaction-id'],
+                s['object-type'], s['date-time']))
+
+        yield self.worker.schedule_dialogue('04')
+        default_schedules = get_schedules()
+
+        self.collections['schedules'].drop()
+        for schedule in initial_schedules:
+            self.collections['schedules'].save(schedule)
+        self.worker.scheduling_engine = 'bulk'
+        self.worker.mass_scheduler.chunk_size = 1
+        yield self.worker.schedule_dialogue('04')
+
+        self.assertEqual(default_schedules, get_schedules())
+        self.assertEqual(
+            [('01', '01-01'),
+             ('02', '01-02'), ('02', '01-02'), ('02', '01-02'),
+             ('04', '01-01'), ('04', '01-02'), ('04', '01-02')],
+            [(s['participant-phone'], s['interaction-id']) for s in default_schedules])
+
+    @inlineCallbacks
+    def test_schedule_unattach_message_bulk(self):
+        self.initialize_properties()
+        self.worker.scheduling_engine = 'bulk'
+        self.worker.mass_scheduler.chunk_size = 2
+
+        dFuture = self.worker.get_local_time() + timedelta(minutes=30)
+        for phone in ['06', '07', '08', '09', '10']:
+            self.collections['participants'].save(
+                self.mkobj_participant(phone, tags=['geek']))
+        self.collections['participants'].save(self.mkobj_participant('11'))
+        unattach = self.mkobj_unattach_message(
+            send_to_type='match',
+            send_to_match_operator='all',
+            send_to_match_conditions=['geek'],
+            fixed_time=time_to_vusion_format(dFuture))
+        unattach_id = self.collections['unattached_messages'].save(unattach)
+        ## a participant not selected anymore
+        self.collections['schedules'].save(self.mkobj_schedule_unattach(
+            participant_phone='11',
+            date_time=time_to_vusion_format(dFuture),
+            unattach_id=str(unattach_id)))
+
+        yield self.worker.schedule_unattach(str(unattach_id))
+
+        self.assertEqual(self.collections['schedules'].count(), 5)
+        self.assertEqual(
+            self.collections['schedules'].find({'participant-phone': '11'}).count(), 0)
+
+        ## rescheduling is updating the schedules time
+        dFuture = dFuture + timedelta(minutes=30)
+        unattach = self.collections['unattached_messages'].find_one(
+            {'_id': unattach_id})
+        unattach['fixed-time'] = time_to_vusion_format(dFuture)
+        self.collections['unattached_messages'].save(unattach)
+
+        yield self.worker.schedule_unattach(str(unattach_id))
+
+        self.assertEqual(
+            self.collections['schedules'].find(
+                {'date-time': time_to_vusion_format(dFuture)}).count(), 5)
+        self.assertEqual(
+            self.redis.hgetall('%s:mass-scheduling' % self.worker.r_key), {})
+
+    @inlineCallbacks
+    def test_schedule_unattach_bulk_resume(self):
+        self.initialize_properties()
+        mass_scheduler = self.worker.mass_scheduler
+        mass_scheduler.chunk_size = 2
+
+        dFuture = self.worker.get_local_time() + timedelta(minutes=30)
+        for phone in ['06', '07', '08', '09', '10']:
+            self.collections['participants'].save(self.mkobj_participant(phone))
+        unattach = self.mkobj_unattach_message(
+            fixed_time=time_to_vusion_format(dFuture))
+        unattach['_id'] = self.collections['unattached_messages'].save(unattach)
+        query = {'session-id': {'$ne': None}}
+        participant_ids = [p['_id'] for p in self.collections['participants'].find(
+            sort=[('_id', 1)])]
+
+        ## interrupted after the first chunk
+        job = ('unattach:%s' % unattach['_id'],
+               repr((unattach['fixed-time'], sorted(query.items()))))
+        mass_scheduler.set_progress(job[0], job[1], 'save', participant_ids[1])
+
+        ## the chunks are not run on the reactor thread
+        d = mass_scheduler.schedule_unattach(unattach, query)
+        self.assertFalse(d.called)
+        count = yield d
+        self.assertEqual(count, 3)
+        self.assertEqual(self.collections['schedules'].count(), 3)
+
+        ## a different signature is starting from the begining
+        mass_scheduler.set_progress(job[0], 'other', 'save', participant_ids[1])
+        count = yield mass_scheduler.schedule_unattach(unattach, query)
+        self.assertEqual(count, 5)
+        self.assertEqual(self.collections['schedules'].count(), 5)
+
+    @inlineCallbacks
+    def test_schedule_mass_tag_bulk_same_as_default(self):
+        self.initialize_properties()
+
+        dNow = self.worker.get_local_time()
+        dialogue = self.mkobj_dialogue_auto_enrollment(
+            auto_enrollment='match',
+            condition_operator='all-subconditions',
+            subconditions=[{'subcondition-field': 'tagged',
+                            'subcondition-operator': 'with',
+                            'subcondition-parameter': 'geek'}])
+        self.collections['dialogues'].save(dialogue.get_as_dict())
+        self.collections['unattached_messages'].save(
+            self.mkobj_unattach_message_2(recipient=['geek']))
+        self.collections['unattached_messages'].save(
+            self.mkobj_unattach_message_2(recipient=['cool']))
+        for phone, tags in [('06', ['geek']), ('07', ['geek', 'cool']),
+                            ('08', ['cool']), ('09', [])]:
+            self.collections['participants'].save(
+                self.mkobj_participant(phone, tags=tags))
+        initial_participants = [p for p in self.collections['participants'].find()]
+
+        def get_schedules():
+            schedules = []
+            for schedule in self.collections['schedules'].find():
+                schedule.pop('_id')
+                schedules.append(schedule)
+            return sorted(schedules, key=lambda s: (
+                s['participant-phone'], s['object-type'], s['date-time']))
+
+        yield self.worker.schedule_mass_tag('geek', {'tags': 'geek'})
+        default_schedules = get_schedules()
+
+        self.collections['schedules'].drop()
+        self.collections['participants'].drop()
+        for participant in initial_participants:
+            self.collections['participants'].save(participant)
+        self.worker.scheduling_engine = 'bulk'
+        self.worker.mass_scheduler.chunk_size = 1
+        yield self.worker.schedule_mass_tag('geek', {'tags': 'geek'})
+
+        self.assertEqual(default_schedules, get_schedules())
+        self.assertEqual(
+            ['06', '06', '07', '07', '07'],
+            [s['participant-phone'] for s in default_schedules])
@@ -3,6 +3,7 @@ from datetime import datetime, time, date, timedelta
 from twisted.internet.defer import inlineCallbacks
 
 from vusion.persist import Dialogue, schedule_generator
+from vusion.component import RedisScheduleQueue
 from vusion.persist.action import TaggingAction
 from vusion.utils import time_to_vusion_format, time_from_vusion_format
 
@@ -432,3 +433,159 @@ class DialogueWorkerTestCase_sendSchedule(DialogueWorkerTestCase):
         participant = self.collections['participants'].get_participant(
             participant['phone'])
         self.assertEqual(['geek'], participant['tags'])
+
+    @inlineCallbacks
+    def test_daemon_process_while_sending(self):
+        self.initialize_properties()
+        timer = self.collections['schedules'].timer
+        past = self.worker.get_local_time().replace(microsecond=0) - timedelta(minutes=1)
+        timer.push(past)
+
+        ## the due times are left to the running send
+        self.worker.is_sending = True
+        yield self.worker.daemon_process()
+        self.assertEqual(past, timer.get_next_time())
+
+        self.worker.is_sending = False
+        yield self.worker.daemon_process()
+        self.assertEqual(None, timer.get_next_time())
+
+    @inlineCallbacks
+    def test_send_scheduled_batch(self):
+        self.initialize_properties()
+        self.worker.sender_batch_size = 3
+        self.worker.sender_window = 2
+
+        dNow = self.worker.get_local_time() - timedelta(minutes=2)
+
+        dialogue = self.mkobj_dialogue_announcement_2()
+        self.collections['dialogues'].save(dialogue)
+        self.collections['participants'].save(self.mkobj_participant('08'))
+        self.collections['participants'].save(self.mkobj_participant('09'))
+
+        for interaction_id, phone, minutes in [('0', '08', 3), ('1', '09', 2),
+                                               ('2', '08', 1), ('0', '09', 0)]:
+            self.collections['schedules'].save(
+                self.mkobj_schedule(
+                    date_time=time_to_vusion_format(dNow - timedelta(minutes=minutes)),
+                    dialogue_id='2',
+                    interaction_id=interaction_id,
+                    participant_phone=phone))
+        ## claimed by another worker
+        self.collections['schedules'].update(
+            {'participant-phone': '09', 'interaction-id': '0'},
+            {'$set': {'claim-id': 'other',
+                      'claim-time': time_to_vusion_format(dNow)}})
+
+        claimed = yield self.worker.send_scheduled()
+
+        self.assertEqual(3, claimed)
+        messages = yield self.app_helper.wait_for_dispatched_outbound(3)
+        self.assertEqual(
+            [('08', 'Hello'), ('08', 'Today is the special day'),
+             ('09', 'Today will be sunny')],
+            sorted([(m['to_addr'], m['content']) for m in messages]))
+        ## participant schedules are sent in order
+        self.assertEqual(
+            ['Hello', 'Today is the special day'],
+            [m['content'] for m in messages if m['to_addr'] == '08'])
+        self.assertEqual(1, self.collections['schedules'].count())
+
+        claimed = yield self.worker.send_scheduled()
+        self.assertEqual(0, claimed)
+
+    @inlineCallbacks
+    def test_send_scheduled_broadcast(self):
+        self.initialize_properties()
+        self.worker.unattach_broadcast = True
+        self.worker.broadcast_batch_size = 2
+
+        dNow = self.worker.get_local_time() - timedelta(minutes=2)
+        for phone in ['06', '07', '08']:
+            self.collections['participants'].save(self.mkobj_participant(phone))
+        self.collections['participants'].save(
+            self.mkobj_participant('09', session_id=None))
+        unattach_id = self.collections['unattached_messages'].save(
+            self.mkobj_unattach_message(fixed_time=time_to_vusion_format(dNow)))
+
+        yield self.worker.schedule_unattach(str(unattach_id))
+        self.assertEqual(1, self.collections['schedules'].count())
+
+        credit_manager = self.worker.credit_manager
+        count_key = credit_manager.broadcast_count_key(str(unattach_id))
+        claimed = yield self.worker.send_scheduled()
+        self.assertEqual(3, claimed)
+        schedule = self.collections['schedules'].find_one()
+        self.assertEqual(3, schedule['participant-count'])
+        self.assertNotEqual(None, schedule['last-participant-id'])
+        self.assertEqual('3', credit_manager.redis.get(count_key))
+        self.assertTrue(credit_manager.redis.ttl(count_key) <= 1800)
+
+        claimed = yield self.worker.send_scheduled()
+        self.assertEqual(2, claimed)
+        self.assertEqual(0, self.collections['schedules'].count())
+        self.assertEqual(None, credit_manager.redis.get(count_key))
+
+        messages = yield self.app_helper.wait_for_dispatched_outbound(3)
+        self.assertEqual(
+            ['06', '07', '08'], sorted([m['to_addr'] for m in messages]))
+
+        ## same histories as the schedules by participant
+        def get_histories():
+            histories = []
+            for history in self.collections['history'].find():
+                for key in ['_id', 'timestamp', 'message-id']:
+                    history.pop(key)
+                histories.append(history)
+            return sorted(histories, key=lambda h: h['participant-phone'])
+        broadcast_histories = get_histories()
+        self.assertEqual(3, len(broadcast_histories))
+        self.collections['history'].drop()
+
+        ## a stale count is not used by the schedules by participant
+        credit_manager.set_broadcast_count(str(unattach_id), 100)
+        self.worker.unattach_broadcast = False
+        yield self.worker.schedule_unattach(str(unattach_id))
+        self.assertEqual(None, credit_manager.redis.get(count_key))
+        self.assertEqual(3, self.collections['schedules'].count())
+        yield self.worker.send_scheduled()
+        self.assertEqual(broadcast_histories, get_histories())
+
+    @inlineCallbacks
+    def test_send_scheduled_queue(self):
+        self.initialize_properties()
+        queue = RedisScheduleQueue(self.worker.r_key, self.worker.r_server)
+        self.worker.schedule_queue = queue
+        self.collections['schedules'].set_queue(queue)
+
+        dNow = self.worker.get_local_time() - timedelta(minutes=2)
+        dialogue = self.mkobj_dialogue_announcement_2()
+        self.collections['dialogues'].save(dialogue)
+        for phone in ['07', '08']:
+            self.collections['participants'].save(self.mkobj_participant(phone))
+            self.collections['schedules'].save(
+                self.mkobj_schedule(
+                    date_time=time_to_vusion_format(dNow),
+                    dialogue_id='2',
+                    interaction_id='0',
+                    participant_phone=phone))
+        self.assertEqual(2, len(queue))
+
+        ## the participant 07 is leased by another worker
+        queue.acquire_resync('other-worker')
+        queue.redis.set(queue.lease_key('07'), 'other-worker')
+
+        claimed = yield self.worker.send_scheduled()
+        self.assertEqual(1, claimed)
+        self.assertEqual(1, len(queue))
+        self.assertEqual(1, self.collections['schedules'].count())
+
+        queue.release('other-worker', '07')
+        claimed = yield self.worker.send_scheduled()
+        self.assertEqual(1, claimed)
+        self.assertEqual(0, len(queue))
+        self.assertEqual(0, self.collections['schedules'].count())
+
+        messages = yield self.app_helper.wait_for_dispatched_outbound(2)
+        self.assertEqual(['08', '07'], [m['to_addr'] for m in messages])
+        queue.clear()
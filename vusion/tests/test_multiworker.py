@@ -13,7 +13,8 @@ from vumi.tests.helpers import VumiTestCase, WorkerHelper, MessageHelper
 from vumi.service import Worker
 
 from vusion import VusionMultiWorker, DialogueWorker
-from vusion.persist import ProgramManager
+from vusion.persist import ProgramManager, WorkerConfig
+from vusion.component import ShardRing
 
 from tests.utils import MessageMaker, DataLayerUtils
 
@@ -252,3 +253,71 @@ class VusionMultiWorkerTestCase(VumiTestCase, MessageMaker):
         self.assertTrue('worker2' in self.worker.workers)
         self.assertTrue(isinstance(self.worker.workers['worker2'],
                                    ToyWorker))
+
+    @inlineCallbacks
+    def test_startup_shard(self):
+        ring = ShardRing(['shard0', 'shard1'], ['worker1'])
+        self.assertEqual(ring.get_shard('worker1'), 'pinned-worker1')
+
+        config = dict(self.base_config)
+        config.update({
+            'shards': 2,
+            'pinned_workers': ['worker1'],
+            'shard_name': 'pinned-worker1'})
+        yield self.get_multiworker(config)
+
+        self.assertEqual(self.worker.control_name, 'vusion.pinned-worker1')
+        self.assertEqual(self.worker.workers.keys(), ['worker1'])
+
+        ## the workers of the other shards are not started
+        shard_name = ring.get_shard('worker2')
+        self.worker.add_worker(WorkerConfig(**{
+            'name': 'worker2',
+            'class': '%s.ToyDialogueWorker' % (__name__,),
+            'config': self.new_worker_config}))
+        self.assertFalse('worker2' in self.worker.workers)
+        self.assertEqual(
+            self.worker.shard_ring.get_load()[shard_name], ['worker2'])
+
+    @inlineCallbacks
+    def test_forward_control(self):
+        config = dict(self.base_config)
+        config.update({
+            'shards': 2,
+            'pinned_workers': ['worker1'],
+            'shard_name': 'pinned-worker1'})
+        yield self.get_multiworker(config)
+
+        forwarded = []
+
+        class ShardConnector(object):
+
+            def __init__(self, shard_name):
+                self.shard_name = shard_name
+
+            def publish_control(self, msg):
+                forwarded.append(
+                    (self.shard_name, msg['message_type'], msg['worker_name']))
+
+        self.worker.shard_connectors = dict(
+            (shard_name, ShardConnector(shard_name))
+            for shard_name in self.worker.shard_ring.get_shard_names())
+        ring = ShardRing(['shard0', 'shard1'], ['worker1'])
+
+        for message_type, worker_name in [('add_worker', 'worker1'),
+                                          ('add_worker', 'worker2'),
+                                          ('remove_worker', 'worker2')]:
+            yield self.worker.forward_control(self.mkmsg_multiworker_control(
+                message_type=message_type,
+                worker_name=worker_name,
+                worker_class='%s.ToyDialogueWorker' % (__name__,),
+                config=self.new_worker_config))
+
+        ## the controls are routed to the shard of their worker
+        self.assertEqual(
+            forwarded,
+            [('pinned-worker1', 'add_worker', 'worker1'),
+             (ring.get_shard('worker2'), 'add_worker', 'worker2'),
+             (ring.get_shard('worker2'), 'remove_worker', 'worker2')])
+        self.assertEqual(
+            self.worker.shard_ring.get_load()[ring.get_shard('worker2')], [])
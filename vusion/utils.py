@@ -7,7 +7,7 @@ from unidecode import unidecode
 
 from vumi.utils import get_first_word
 
-from vusion.const import PLUS_REGEX, ZEROS_REGEX
+from vusion.address_normaliser import address_normaliser
 
 
 def get_default(kwargs, field, default_value):
@@ -64,12 +64,7 @@ def get_local_time_as_timestamp(local_time):
 
 ##TODO rename is_prefixed_code_a_shortcode
 def is_shortcode_address(address):
-    if address is None:
-        return False
-    regex_NATIONAL_SHORTCODE = re.compile('^[0-9]+-[0-9]+$')
-    if re.match(regex_NATIONAL_SHORTCODE, address):
-        return True
-    return False
+    return address_normaliser.is_shortcode_address(address)
 
 ##TODO rename is_prefixed_code_a_longcode
 def is_longcode_address(address):
@@ -80,19 +75,11 @@ def is_longcode_address(address):
 
 ##TODO rename from_prefixed_code_to_code
 def get_shortcode_value(shortcode):
-    if shortcode is None :
-        return None
-    if is_shortcode_address(shortcode):
-        return shortcode.split('-')[1]
-    return shortcode
+    return address_normaliser.get_shortcode_value(shortcode)
 
 ##TODO rename from_prefixed_code_to_prefix
 def get_shortcode_international_prefix(shortcode):
-    if shortcode is None :
-        return None
-    if is_shortcode_address(shortcode):
-        return shortcode.split('-')[0]
-    return shortcode
+    return address_normaliser.get_shortcode_international_prefix(shortcode)
 
 ##TODO move function in Shortcode model
 def get_shortcode_address(shortcode):
@@ -156,13 +143,7 @@ def get_words(content, start, end, delimiter=' '):
 
 
 def clean_phone(phone):
-    if phone in [None,'']:
-        return None
-    if (re.match(ZEROS_REGEX, phone)):
-        return re.sub(ZEROS_REGEX, "+", phone)
-    if (not re.match(PLUS_REGEX, phone)):
-        return '+%s' % phone
-    return phone
+    return address_normaliser.clean_phone(phone)
 
 def dynamic_content_notation_to_string(domain, keys):
     tmp = domain